@@ -0,0 +1,426 @@
+"""
+Shared engine for calling AI providers
+
+Both Streamlit entry points describe a call as an AIRequest and get an
+AIResponse back, whichever provider serves it. Provider clients are cached
+per (provider, API key, model) for the life of the process:
+
+* Gemini is called over its REST API through one keep-alive
+  requests.Session, so TLS connections are reused between clicks and each
+  request carries its own key instead of the SDK's process-global
+  genai.configure().
+* OpenAI uses one openai.OpenAI client per key (optional dependency).
+
+Every call first passes its key's rate limiter (see rate_limiter) and is
+recorded by ai_telemetry, whatever its outcome.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import ai_telemetry
+from ai_metrics import RequestTimer
+from rate_limiter import AI_QUEUE_TIMEOUT, AdmissionError, limiter_for
+
+try:
+    import openai
+except ImportError:  # OpenAI support is optional
+    openai = None
+
+GEMINI_API_BASE = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1beta')
+OPENAI_API_BASE = os.getenv('OPENAI_API_BASE') or None
+AI_REQUEST_TIMEOUT = float(os.getenv('AI_REQUEST_TIMEOUT', '120'))
+AI_HTTP_POOL_SIZE = int(os.getenv('AI_HTTP_POOL_SIZE', '20'))
+AI_RATE_LIMIT_RETRIES = int(os.getenv('AI_RATE_LIMIT_RETRIES', '2'))
+
+_CANCEL_POLL_INTERVAL = 0.25  # how often a cancel watcher checks whether its stream ended
+
+
+class AIProviderError(Exception):
+    """A provider rejected the request or returned an unusable response"""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AIRequest:
+    """One analysis request: prompt, optional images and an optional JSON schema
+
+    deadline is an absolute time.monotonic() value; past it the request fails
+    with AIProviderError instead of waiting on a slow provider.
+    """
+
+    def __init__(self, provider, model, api_key, prompt, images=None, response_schema=None,
+                 max_tokens=None, deadline=None):
+        self.provider = provider
+        self.model = model
+        self.api_key = api_key
+        self.prompt = prompt
+        # [{'mime_type': ..., 'data': bytes, 'source_bytes': size before preprocessing}]
+        self.images = images or []
+        self.response_schema = response_schema
+        self.max_tokens = max_tokens
+        self.deadline = deadline
+
+    def timeout(self):
+        """Seconds a single network wait may take, bounded by the deadline"""
+        if self.deadline is None:
+            return AI_REQUEST_TIMEOUT
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise AIProviderError(f"{self.model} missed its deadline")
+        return min(AI_REQUEST_TIMEOUT, remaining)
+
+
+class AIResponse:
+    """Complete text of a response plus its timing entry from ai_metrics"""
+
+    def __init__(self, text, provider, model, timing):
+        self.text = text
+        self.provider = provider
+        self.model = model
+        self.timing = timing
+
+
+def _http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=AI_HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _gemini_schema(schema):
+    """Gemini's REST API spells schema types in upper case"""
+    converted = {}
+    for key, value in schema.items():
+        if key == 'type':
+            converted[key] = value.upper()
+        elif key == 'properties':
+            converted[key] = {name: _gemini_schema(child) for name, child in value.items()}
+        elif key == 'items':
+            converted[key] = _gemini_schema(value)
+        else:
+            converted[key] = value
+    return converted
+
+
+def _shut_down(sock):
+    """Shut a socket down so a read blocked on it in another thread returns"""
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def _close_on_cancel(cancel, close):
+    """Call close() from a watcher thread as soon as cancel is set
+
+    A cancelled stream still waiting for its first token would otherwise
+    hold its thread and HTTP connection until the model answers. Returns an
+    event to set once the stream has ended, which stops the watcher.
+    """
+    finished = threading.Event()
+    if cancel is None:
+        return finished
+
+    def watch():
+        while not finished.is_set():
+            if cancel.wait(_CANCEL_POLL_INTERVAL):
+                if not finished.is_set():
+                    close()
+                return
+
+    threading.Thread(target=watch, name='ai-cancel-watch', daemon=True).start()
+    return finished
+
+
+def _error_from_response(response):
+    try:
+        message = response.json().get('error', {}).get('message') or response.text
+    except ValueError:
+        message = response.text
+    retry_after = response.headers.get('Retry-After')
+    return AIProviderError(
+        f"HTTP {response.status_code}: {message}",
+        status=response.status_code,
+        retry_after=float(retry_after) if retry_after and retry_after.replace('.', '', 1).isdigit() else None
+    )
+
+
+class GeminiProvider:
+    """Gemini generateContent over REST with server-sent-event streaming"""
+
+    name = 'gemini'
+    session = _http_session()  # shared by every key and model
+
+    def __init__(self, api_key, model):
+        self.api_key = api_key
+        self.model = model
+        self.url = f"{GEMINI_API_BASE}/models/{model}:streamGenerateContent"
+
+    def _payload(self, request):
+        parts = [{'text': request.prompt}]
+        for image in request.images:
+            parts.append({'inline_data': {
+                'mime_type': image['mime_type'],
+                'data': base64.b64encode(image['data']).decode('ascii')
+            }})
+        config = {'maxOutputTokens': request.max_tokens} if request.max_tokens else {}
+        if request.response_schema is not None:
+            config['responseMimeType'] = 'application/json'
+            config['responseSchema'] = _gemini_schema(request.response_schema)
+        return {'contents': [{'role': 'user', 'parts': parts}], 'generationConfig': config}
+
+    def stream(self, request, usage, cancel=None):
+        """Yield text fragments as Gemini produces them, filling usage with token counts
+
+        Setting the threading.Event cancel closes the response at once.
+        """
+        response = self.session.post(
+            self.url,
+            params={'alt': 'sse'},
+            headers={'x-goog-api-key': self.api_key},
+            json=self._payload(request),
+            stream=True,
+            timeout=request.timeout()
+        )
+
+        def close():
+            # Closing alone does not wake a read blocked in another thread
+            _shut_down(getattr(getattr(response.raw, 'connection', None), 'sock', None))
+            response.close()
+
+        finished = _close_on_cancel(cancel, close)
+        with response:
+            try:
+                if response.status_code != 200:
+                    raise _error_from_response(response)
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    event = json.loads(line[len('data:'):])
+                    if 'error' in event:
+                        raise AIProviderError(event['error'].get('message', 'Gemini stream error'))
+                    if 'usageMetadata' in event:
+                        metadata = event['usageMetadata']
+                        usage['prompt_tokens'] = metadata.get('promptTokenCount')
+                        # Thinking tokens are billed as output
+                        usage['completion_tokens'] = (
+                            metadata.get('candidatesTokenCount', 0) + metadata.get('thoughtsTokenCount', 0)
+                        )
+                    for candidate in event.get('candidates', [])[:1]:
+                        for part in candidate.get('content', {}).get('parts', []):
+                            if part.get('text') and not part.get('thought'):
+                                yield part['text']
+            finally:
+                finished.set()
+
+
+class OpenAIProvider:
+    """OpenAI chat completions with streaming"""
+
+    name = 'openai'
+    # Models that reject image input
+    TEXT_ONLY_MODELS = {'gpt-4', 'gpt-3.5-turbo'}
+
+    def __init__(self, api_key, model):
+        if openai is None:
+            raise AIProviderError("The OpenAI provider requires the openai package (pip install openai)")
+        self.model = model
+        self.client = openai.OpenAI(api_key=api_key, base_url=OPENAI_API_BASE, timeout=AI_REQUEST_TIMEOUT)
+
+    def stream(self, request, usage, cancel=None):
+        """Yield text fragments as OpenAI produces them, filling usage with token counts
+
+        Setting the threading.Event cancel closes the response at once.
+        """
+        content = [{'type': 'text', 'text': request.prompt}]
+        if self.model not in self.TEXT_ONLY_MODELS:
+            for image in request.images:
+                encoded = base64.b64encode(image['data']).decode('ascii')
+                content.append({
+                    'type': 'image_url',
+                    'image_url': {'url': f"data:{image['mime_type']};base64,{encoded}"}
+                })
+        options = {}
+        if request.max_tokens:
+            options['max_completion_tokens'] = request.max_tokens
+        if request.response_schema is not None:
+            options['response_format'] = {'type': 'json_object'}
+
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{'role': 'user', 'content': content}],
+                stream=True,
+                stream_options={'include_usage': True},
+                timeout=request.timeout(),
+                **options
+            )
+
+            def close():
+                # Closing alone does not wake a read blocked in another thread
+                network_stream = response.response.extensions.get('network_stream')
+                _shut_down(network_stream.get_extra_info('socket') if network_stream is not None else None)
+                response.close()
+
+            finished = _close_on_cancel(cancel, close)
+            try:
+                for chunk in response:
+                    if chunk.usage is not None:
+                        usage['prompt_tokens'] = chunk.usage.prompt_tokens
+                        usage['completion_tokens'] = chunk.usage.completion_tokens
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                finished.set()
+        except openai.APIStatusError as e:
+            retry_after = e.response.headers.get('retry-after') if e.response is not None else None
+            raise AIProviderError(
+                str(e), status=e.status_code,
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+            ) from e
+
+
+PROVIDERS = {
+    'gemini': GeminiProvider,
+    'openai': OpenAIProvider,
+}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_provider(provider, api_key, model):
+    """Return the cached client for (provider, API key, model), creating it once"""
+    if provider not in PROVIDERS:
+        raise AIProviderError(f"Provider '{provider}' is not yet supported.")
+    key = (provider, hashlib.sha256((api_key or '').encode('utf-8')).hexdigest(), model)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = PROVIDERS[provider](api_key, model)
+            _clients[key] = client
+        return client
+
+
+def _stream_once(request, on_text, cancel, trace):
+    timer = RequestTimer(request.provider, request.model)
+    chunks = []
+    stream = None
+    try:
+        client = get_provider(request.provider, request.api_key, request.model)
+        if cancel is not None and cancel.is_set():
+            return None
+        stream = client.stream(request, trace['usage'], cancel)
+        for fragment in stream:
+            if cancel is not None and cancel.is_set():
+                return None
+            if request.deadline is not None and time.monotonic() > request.deadline:
+                raise AIProviderError(f"{request.model} missed its deadline")
+            timer.first_byte()
+            chunks.append(fragment)
+            if on_text is not None:
+                on_text(fragment)
+    except Exception:
+        if cancel is not None and cancel.is_set():
+            return None  # the watcher closed the response under us
+        trace['timing'] = timer.finish(ok=False)
+        raise
+    finally:
+        if stream is not None:
+            stream.close()
+    if cancel is not None and cancel.is_set():
+        return None
+    trace['timing'] = timer.finish()
+    return AIResponse("".join(chunks), request.provider, request.model, trace['timing'])
+
+
+def _record_telemetry(request, trace):
+    timing = trace['timing'] or {}
+    error = trace['error']
+    images = request.images
+    source_bytes = sum(image.get('source_bytes') or len(image['data']) for image in images)
+    sent_bytes = sum(len(image['data']) for image in images)
+    ai_telemetry.record({
+        'provider': request.provider,
+        'model': request.model,
+        'outcome': trace['outcome'],
+        'http_status': getattr(error, 'status', None),
+        'error': str(error)[:255] if error is not None else None,
+        'retries': trace['retries'],
+        'queue_seconds': trace['queue'],
+        'ttfb_seconds': timing.get('ttfb'),
+        'total_seconds': timing.get('total'),
+        'image_count': len(images),
+        'image_source_bytes': source_bytes if images else None,
+        'image_sent_bytes': sent_bytes if images else None,
+        'prompt_tokens': trace['usage'].get('prompt_tokens'),
+        'completion_tokens': trace['usage'].get('completion_tokens'),
+    })
+
+
+def stream_response(request, on_text=None, cancel=None, on_wait=None):
+    """Run a request to completion, calling on_text(fragment) as each fragment arrives
+
+    The request first waits for its API key's rate limiter, reporting
+    on_wait(position, eta_seconds) while queued. A 429 before any text
+    arrives backs the key off and retries up to AI_RATE_LIMIT_RETRIES times.
+
+    Returns an AIResponse. Raises AIProviderError or the underlying network
+    error on failure; either way the request's latency is recorded. If the
+    threading.Event cancel is set, the stream is closed and None is returned;
+    cancelled calls appear in telemetry but not in the latency history.
+    """
+    limiter = limiter_for(request.api_key)
+    trace = {'usage': {}, 'timing': None, 'queue': 0.0, 'retries': 0, 'outcome': 'error', 'error': None}
+    try:
+        for attempt in range(AI_RATE_LIMIT_RETRIES + 1):
+            trace['retries'] = attempt
+            timeout = AI_QUEUE_TIMEOUT
+            if request.deadline is not None:
+                timeout = min(timeout, max(0.0, request.deadline - time.monotonic()))
+            queued_at = time.perf_counter()
+            try:
+                admitted = limiter.acquire(timeout, on_wait, cancel)
+            except AdmissionError as e:
+                trace['outcome'] = 'rejected'
+                raise AIProviderError(str(e)) from e
+            finally:
+                trace['queue'] += time.perf_counter() - queued_at
+            if not admitted:
+                trace['outcome'] = 'cancelled'
+                return None
+
+            try:
+                response = _stream_once(request, on_text, cancel, trace)
+            except AIProviderError as e:
+                if e.status != 429:
+                    raise
+                limiter.backoff(e.retry_after)
+                if attempt == AI_RATE_LIMIT_RETRIES:
+                    raise
+            else:
+                if response is None:
+                    trace['outcome'] = 'cancelled'
+                    return None
+                limiter.succeeded()
+                trace['outcome'] = 'ok'
+                return response
+    except Exception as e:
+        trace['error'] = e
+        raise
+    finally:
+        _record_telemetry(request, trace)
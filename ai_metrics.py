@@ -0,0 +1,106 @@
+"""
+Latency records for AI provider requests
+
+Each request is timed from the call to the first streamed chunk
+(time to first byte) and to the last one (total latency). The most recent
+AI_LATENCY_HISTORY requests are kept in memory for the Diagnostics panel.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+AI_LATENCY_HISTORY = int(os.getenv('AI_LATENCY_HISTORY', '200'))
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers (None when empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))
+    return ordered[rank]
+
+
+class LatencyRecorder:
+    """Bounded, thread-safe history of request timings"""
+
+    def __init__(self, history=AI_LATENCY_HISTORY):
+        self._records = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def record(self, entry):
+        with self._lock:
+            self._records.append(entry)
+
+    def recent(self):
+        with self._lock:
+            return list(self._records)
+
+    def summary(self):
+        """Count, error count, median/p95 time to first byte and total latency"""
+        return self._summarize(self.recent())
+
+    def model_stats(self):
+        """summary() per (provider, model), plus each model's error rate"""
+        by_model = {}
+        for entry in self.recent():
+            by_model.setdefault((entry['provider'], entry['model']), []).append(entry)
+        stats = {}
+        for model, records in by_model.items():
+            stats[model] = self._summarize(records)
+            stats[model]['error_rate'] = stats[model]['errors'] / len(records)
+        return stats
+
+    @staticmethod
+    def _summarize(records):
+        ttfb = [entry['ttfb'] for entry in records if entry['ttfb'] is not None]
+        total = [entry['total'] for entry in records if entry['ok']]
+        return {
+            'requests': len(records),
+            'errors': sum(1 for entry in records if not entry['ok']),
+            'ttfb_p50': percentile(ttfb, 0.5),
+            'ttfb_p95': percentile(ttfb, 0.95),
+            'total_p50': percentile(total, 0.5),
+            'total_p95': percentile(total, 0.95),
+        }
+
+
+class RequestTimer:
+    """Times one AI request; call first_byte() on the first chunk and finish() at the end"""
+
+    def __init__(self, provider, model, recorder=None):
+        self.provider = provider
+        self.model = model
+        self.recorder = recorder or latency_recorder
+        self.started = time.perf_counter()
+        self.ttfb = None
+
+    def first_byte(self):
+        if self.ttfb is None:
+            self.ttfb = time.perf_counter() - self.started
+
+    def finish(self, ok=True):
+        """Record the request and return its timing entry"""
+        entry = {
+            'provider': self.provider,
+            'model': self.model,
+            'ttfb': self.ttfb,
+            'total': time.perf_counter() - self.started,
+            'ok': ok,
+            'at': time.time(),
+        }
+        self.recorder.record(entry)
+        return entry
+
+
+def describe_timing(entry):
+    """Short caption such as 'first token 1.2s · total 6.8s'"""
+    if entry['ttfb'] is None:
+        return f"total {entry['total']:.1f}s"
+    return f"first token {entry['ttfb']:.1f}s · total {entry['total']:.1f}s"
+
+
+# Global recorder shared by every page in the process
+latency_recorder = LatencyRecorder()
@@ -0,0 +1,157 @@
+"""
+Hedged, deadline-bound routing of one analysis across several models
+
+route_response() takes the same request prepared for a primary model and
+for its backups. It starts the primary and, if no first token has arrived
+by that model's p95 time to first token, fires the next candidate as a
+hedge; whichever streams first wins and the others are cancelled. A
+candidate that fails hands over to the next one, and nothing runs past the
+overall deadline. Candidate order and hedge delays come from the rolling
+per-model statistics in ai_metrics.
+"""
+
+import os
+import queue
+import threading
+import time
+
+from ai_engine import AIProviderError, stream_response
+from ai_metrics import latency_recorder
+
+AI_REQUEST_DEADLINE = float(os.getenv('AI_REQUEST_DEADLINE', '90'))
+# Hedge delay used until a model has AI_HEDGE_MIN_SAMPLES successful timings
+AI_HEDGE_DELAY = float(os.getenv('AI_HEDGE_DELAY', '8'))
+AI_HEDGE_MIN_SAMPLES = int(os.getenv('AI_HEDGE_MIN_SAMPLES', '5'))
+# Models failing at least this share of recent requests are tried last
+AI_UNHEALTHY_ERROR_RATE = float(os.getenv('AI_UNHEALTHY_ERROR_RATE', '0.5'))
+
+_MIN_HEDGE_DELAY = 0.5
+
+
+def hedge_delay(request, stats):
+    """Seconds to wait for a first token before hedging request"""
+    model_stats = stats.get((request.provider, request.model))
+    if model_stats is None or model_stats['requests'] - model_stats['errors'] < AI_HEDGE_MIN_SAMPLES:
+        return AI_HEDGE_DELAY
+    return max(_MIN_HEDGE_DELAY, model_stats['ttfb_p95'] or AI_HEDGE_DELAY)
+
+
+def _is_unhealthy(request, stats):
+    model_stats = stats.get((request.provider, request.model))
+    return (
+        model_stats is not None
+        and model_stats['requests'] >= AI_HEDGE_MIN_SAMPLES
+        and model_stats['error_rate'] >= AI_UNHEALTHY_ERROR_RATE
+    )
+
+
+def order_candidates(requests, stats):
+    """Primary first unless it is failing; backups healthiest and fastest first"""
+    def backup_key(request):
+        model_stats = stats.get((request.provider, request.model)) or {}
+        return (_is_unhealthy(request, stats), model_stats.get('ttfb_p50') or AI_HEDGE_DELAY)
+
+    primary, backups = requests[:1], sorted(requests[1:], key=backup_key)
+    if primary and backups and _is_unhealthy(primary[0], stats) and not _is_unhealthy(backups[0], stats):
+        return backups[:1] + primary + backups[1:]
+    return primary + backups
+
+
+def route_response(requests, on_text=None, on_start=None, deadline=AI_REQUEST_DEADLINE, on_wait=None):
+    """Answer with the first candidate to stream, hedging and failing over as needed
+
+    requests is a list of AIRequest, the user's choice first. on_start(request)
+    is called whenever a candidate starts streaming to on_text; a later call
+    means the earlier candidate failed mid-answer and its text is void.
+    on_wait(position, eta_seconds) reports rate-limiter queueing until a
+    candidate starts streaming. All callbacks run on the calling thread.
+    Returns the winning AIResponse or raises the last candidate's error.
+    """
+    stats = latency_recorder.model_stats()
+    pending = order_candidates(list(requests), stats)
+    if not pending:
+        raise AIProviderError("No model to send the request to.")
+
+    deadline_at = time.monotonic() + deadline
+    events = queue.Queue()
+    attempts = []
+    running = {}  # attempt index -> cancel event
+    leader = None
+    last_error = None
+
+    def worker(index, request, cancel):
+        try:
+            response = stream_response(
+                request,
+                lambda fragment: events.put(('text', index, fragment)),
+                cancel,
+                lambda position, eta: events.put(('wait', index, (position, eta)))
+            )
+        except Exception as e:
+            events.put(('error', index, e))
+        else:
+            events.put(('done', index, response))
+
+    def launch():
+        request = pending.pop(0)
+        request.deadline = deadline_at
+        cancel = threading.Event()
+        running[len(attempts)] = cancel
+        threading.Thread(
+            target=worker, args=(len(attempts), request, cancel),
+            name='ai-route', daemon=True
+        ).start()
+        attempts.append(request)
+        return time.monotonic() + hedge_delay(request, stats)
+
+    def cancel_all(keep=None):
+        for index in list(running):
+            if index != keep:
+                running.pop(index).set()
+
+    next_hedge_at = launch()
+    while True:
+        now = time.monotonic()
+        if now >= deadline_at:
+            cancel_all()
+            raise AIProviderError(f"No model answered within {deadline:g}s") from last_error
+
+        wake_at = deadline_at
+        if leader is None and pending:
+            wake_at = min(wake_at, next_hedge_at)
+        try:
+            kind, index, payload = events.get(timeout=max(0.0, wake_at - now))
+        except queue.Empty:
+            if leader is None and pending and time.monotonic() >= next_hedge_at:
+                next_hedge_at = launch()
+            continue
+
+        if index not in running:
+            continue  # cancelled loser
+
+        if kind == 'wait':
+            if leader is None and on_wait is not None:
+                on_wait(*payload)
+        elif kind == 'text':
+            if leader is None:
+                leader = index
+                cancel_all(keep=index)
+                if on_start is not None:
+                    on_start(attempts[index])
+            if on_text is not None:
+                on_text(payload)
+        elif kind == 'done':
+            running.pop(index)
+            cancel_all()
+            if leader is None and on_start is not None:
+                on_start(attempts[index])  # finished without streaming any text
+            return payload
+        else:
+            running.pop(index)
+            last_error = payload
+            if index == leader:
+                leader = None
+            if not running:
+                if not pending:
+                    raise payload
+                next_hedge_at = launch()
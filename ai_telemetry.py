@@ -0,0 +1,118 @@
+"""
+Per-request telemetry for AI provider calls
+
+ai_engine.stream_response() hands one entry per call to record(): model,
+outcome, retries, rate-limiter wait, time to first token, total latency,
+image bytes before and after preprocessing, token counts and estimated cost.
+Entries are buffered in memory and written to the ai_telemetry table in
+batches by a background thread, so provider calls never wait on the
+database. Rows older than AI_TELEMETRY_RETENTION_DAYS are pruned hourly.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+AI_TELEMETRY = os.getenv('AI_TELEMETRY', 'true').lower() not in ('0', 'false', 'no')
+AI_TELEMETRY_RETENTION_DAYS = int(os.getenv('AI_TELEMETRY_RETENTION_DAYS', '30'))
+
+# USD per million (prompt, completion) tokens; override or extend with AI_MODEL_PRICES
+MODEL_PRICES = {
+    'gemini-2.5-pro': (1.25, 10.00),
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-1.5-pro': (1.25, 5.00),
+    'gemini-1.5-pro-latest': (1.25, 5.00),
+    'gpt-5': (1.25, 10.00),
+    'gpt-4.1': (2.00, 8.00),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4': (30.00, 60.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+}
+MODEL_PRICES.update({
+    model: tuple(prices) for model, prices in json.loads(os.getenv('AI_MODEL_PRICES') or '{}').items()
+})
+
+_BUFFER_SIZE = 10000
+_BATCH_SIZE = 200
+_FLUSH_INTERVAL = 1.0
+_PRUNE_INTERVAL = 3600
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Estimated USD cost of a call, or None if the model or token counts are unknown"""
+    prices = MODEL_PRICES.get(model)
+    if prices is None or prompt_tokens is None or completion_tokens is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+class TelemetryWriter:
+    """Buffers telemetry entries and writes them to the database in batches"""
+
+    def __init__(self, buffer_size=_BUFFER_SIZE):
+        self._queue = queue.Queue(maxsize=buffer_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def record(self, entry):
+        """Queue an entry without blocking; drops it if the buffer is full"""
+        self._start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='ai-telemetry', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        # Imported here so the legacy single-page app can use ai_engine without a database
+        from database import db_manager
+        last_prune = 0.0
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + _FLUSH_INTERVAL
+            while len(batch) < _BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                db_manager.insert_ai_telemetry(batch)
+                self.written += len(batch)
+                if time.monotonic() - last_prune > _PRUNE_INTERVAL:
+                    last_prune = time.monotonic()
+                    db_manager.prune_ai_telemetry(datetime.now() - timedelta(days=AI_TELEMETRY_RETENTION_DAYS))
+            except Exception:
+                # Telemetry must never take the app down; the batch is lost
+                self.failed += len(batch)
+
+    def stats(self):
+        return {
+            'written': self.written,
+            'pending': self._queue.qsize(),
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
+
+
+def record(entry):
+    """Record one AI call (see database.TELEMETRY_COLUMNS for the keys)"""
+    if telemetry_writer is not None:
+        entry.setdefault('created_at', datetime.now())
+        entry['cost_usd'] = estimate_cost(entry['model'], entry.get('prompt_tokens'), entry.get('completion_tokens'))
+        telemetry_writer.record(entry)
+
+
+# Global writer shared by every page in the process (None when AI_TELEMETRY=false)
+telemetry_writer = TelemetryWriter() if AI_TELEMETRY else None
@@ -0,0 +1,141 @@
+"""
+Cache of AI meal analyses keyed by image content and prompt
+
+The key is a SHA-256 over the preprocessed image bytes, the system prompt,
+the user's notes and the model id, so an identical request never pays for a
+second model call. Choose where entries live with ANALYSIS_CACHE_BACKEND:
+
+* memory   - per-process LRU (default)
+* database - the analysis_cache table, shared by every app process
+* off      - disable caching
+
+ANALYSIS_CACHE_SIZE bounds the number of entries in either backend.
+"""
+
+import copy
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from database import db_manager
+from connection_pool import PoolTimeoutError
+from storage import Error
+
+ANALYSIS_CACHE_SIZE = int(os.getenv('ANALYSIS_CACHE_SIZE', '500'))
+
+
+def analysis_cache_key(image_bytes, prompt, user_notes, model_id):
+    """Return the hex digest identifying one analysis request"""
+    digest = hashlib.sha256()
+    for part in (image_bytes, prompt, (user_notes or '').strip(), model_id):
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        # Length-prefix each field so ('ab', 'c') and ('a', 'bc') differ
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class MemoryAnalysisCache:
+    """Process-local LRU of (ai_analysis, nutrition_data) by cache key"""
+
+    def __init__(self, max_size=ANALYSIS_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'errors': 0}
+
+    def get(self, key):
+        """Return (ai_analysis, nutrition_data) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+        # Callers may edit nutrition_data; the cached copy must stay intact
+        ai_analysis, nutrition_data = entry
+        return ai_analysis, copy.deepcopy(nutrition_data)
+
+    def set(self, key, model_id, ai_analysis, nutrition_data):
+        with self._lock:
+            self._entries[key] = (ai_analysis, copy.deepcopy(nutrition_data))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = len(self._entries)
+        snapshot['max_size'] = self.max_size
+        return snapshot
+
+
+class DatabaseAnalysisCache:
+    """analysis_cache table shared across processes
+
+    Database problems are counted and treated as misses; a broken cache must
+    never stop a meal from being analyzed.
+    """
+
+    def __init__(self, max_size=ANALYSIS_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'errors': 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def get(self, key):
+        """Return (ai_analysis, nutrition_data) or None"""
+        try:
+            entry = db_manager.get_cached_analysis(key)
+        except (*Error, PoolTimeoutError, ValueError):
+            self._count('errors')
+            return None
+        self._count('hits' if entry is not None else 'misses')
+        return entry
+
+    def set(self, key, model_id, ai_analysis, nutrition_data):
+        try:
+            evicted = db_manager.store_cached_analysis(
+                key, model_id, ai_analysis, nutrition_data, self.max_size
+            )
+        except (*Error, PoolTimeoutError):
+            self._count('errors')
+            return
+        self._count('evictions', evicted)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot['size'] = None
+        snapshot['max_size'] = self.max_size
+        return snapshot
+
+
+ANALYSIS_CACHES = {
+    'memory': MemoryAnalysisCache,
+    'database': DatabaseAnalysisCache,
+}
+
+
+def create_analysis_cache(name=None):
+    """Instantiate the cache named by ANALYSIS_CACHE_BACKEND, or None when off"""
+    name = (name or os.getenv('ANALYSIS_CACHE_BACKEND', 'memory')).lower()
+    if name == 'off' or ANALYSIS_CACHE_SIZE <= 0:
+        return None
+    if name not in ANALYSIS_CACHES:
+        raise ValueError(
+            f"Unknown ANALYSIS_CACHE_BACKEND '{name}'. Choose one of: {', '.join(ANALYSIS_CACHES)}, off"
+        )
+    return ANALYSIS_CACHES[name]()
+
+
+# Global analysis cache instance (None when disabled)
+analysis_cache = create_analysis_cache()
@@ -0,0 +1,142 @@
+"""
+Background AI analysis jobs
+
+Submitting a photo stores it as a row in analysis_jobs and hands the job id
+to a process-wide worker pool, so the Streamlit script thread never waits on
+the AI. A worker claims the job, runs the analysis and saves the meal and
+the job result in one transaction; pages read job status from the database,
+so navigating away or rerunning never loses a finished result.
+
+Jobs left queued or running when the process stopped are picked up again
+when the app starts (AnalysisJobQueue.start()). This assumes one app process
+per database; with several, set AI_JOB_RECOVER=false on all but one.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from connection_pool import PoolTimeoutError
+from database import db_manager
+from image_store import image_store
+from meal_analysis import analyze_image
+from storage import Error
+
+AI_JOB_WORKERS = int(os.getenv('AI_JOB_WORKERS', '4'))
+AI_JOB_RECOVER = os.getenv('AI_JOB_RECOVER', 'true').lower() not in ('0', 'false', 'no')
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class AnalysisJobQueue:
+    """Worker pool for analysis jobs plus in-memory progress of running ones"""
+
+    def __init__(self, workers=AI_JOB_WORKERS, recover=AI_JOB_RECOVER):
+        self.workers = workers
+        self.recover = recover
+        self._executor = None
+        self._recovered = not recover
+        self._lock = threading.Lock()
+        self._progress = {}  # job id -> {'items': [...], 'position': n}
+
+    def start(self):
+        """Start the worker pool and requeue jobs a previous process left behind
+
+        Called at app startup; later calls only return the pool. Raises on
+        database errors, in which case the next call retries the recovery.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ai-job')
+            if not self._recovered:
+                for job_id in db_manager.requeue_analysis_jobs():
+                    self._executor.submit(self._run, job_id)
+                self._recovered = True
+        return self._executor
+
+    def _pool(self):
+        if self._executor is None or not self._recovered:
+            return self.start()
+        return self._executor
+
+    def submit(self, user_id, meal_type, image_bytes, mime_type, user_prompt='', image_name=None,
+               image_phash=None, source_bytes=None):
+        """Queue a preprocessed photo for analysis and return the job id
+
+        The meal is logged for the time of submission, not of completion.
+        Raises on database errors.
+        """
+        pool = self._pool()
+        now = datetime.now()
+        job_id = db_manager.create_analysis_job({
+            'user_id': user_id,
+            'meal_type': meal_type,
+            'meal_date': now.date(),
+            'meal_time': now.time().replace(microsecond=0),
+            'user_prompt': user_prompt or '',
+            'image_name': image_name,
+            'image_mime': mime_type,
+            'image_data': image_bytes,
+            'image_phash': image_phash,
+            'image_source_bytes': source_bytes
+        })
+        pool.submit(self._run, job_id)
+        return job_id
+
+    def progress(self, job_id):
+        """Items parsed so far and rate-limiter queue position of a running job, or None"""
+        return self._progress.get(job_id)
+
+    def _run(self, job_id):
+        try:
+            job = db_manager.claim_analysis_job(job_id)
+        except Exception as e:
+            # Nobody reads the executor's future; without this the job would sit queued
+            self._fail(job_id, e)
+            return
+        if job is None:
+            return
+        progress = self._progress[job_id] = {'items': [], 'position': None}
+
+        def on_items(items):
+            progress['items'] = list(items)
+            progress['position'] = None
+
+        def on_wait(position, eta):
+            progress['position'] = position
+
+        try:
+            if not job['gemini_api_key']:
+                raise ValueError("No Gemini API key found. Please update your API key in Settings.")
+            ai_analysis, nutrition_data, _, _ = analyze_image(
+                job['image_data'], job['image_mime'], job['user_prompt'], job['gemini_api_key'],
+                on_items, on_wait, job['image_source_bytes']
+            )
+            image_sha256 = image_store.put(job['image_data']) if image_store is not None else None
+            db_manager.complete_analysis_job(job_id, {
+                'user_id': job['user_id'],
+                'meal_type': job['meal_type'],
+                'meal_date': job['meal_date'],
+                'meal_time': job['meal_time'],
+                'image_name': job['image_name'],
+                'image_phash': job['image_phash'],
+                'image_sha256': image_sha256,
+                'ai_analysis': ai_analysis,
+                'nutrition_data': nutrition_data
+            })
+        except Exception as e:
+            self._fail(job_id, e)
+        finally:
+            self._progress.pop(job_id, None)
+
+    @staticmethod
+    def _fail(job_id, error):
+        try:
+            db_manager.fail_analysis_job(job_id, error)
+        except (*Error, PoolTimeoutError):
+            pass  # left queued or running; requeued when the app next starts
+
+
+# Global job queue shared by every session in the process
+analysis_jobs = AnalysisJobQueue()
@@ -1,6 +1,7 @@
 import streamlit as st
 import os
 from database import db_manager
+from analysis_jobs import analysis_jobs
 from auth import show_auth_page, logout
 from pages.home import show_home_page
 from pages.ai_calculator import show_ai_calculator
@@ -303,20 +304,23 @@ def show_header():
 def main():
     """Main application logic"""
     
-    # Check authentication
-    if not st.session_state.authenticated:
-        show_auth_page()
-        return
-    
-    # Initialize database (in a real app, this would be done during setup)
+    # Apply schema migrations once per process (no-op on later reruns)
     try:
-        if not db_manager.init_database():
+        if not db_manager.ensure_schema():
             st.error("⚠️ Database connection failed. Using placeholder data for demo.")
             st.info("💡 Please configure your database settings in the .env file.")
+        else:
+            # Resume analyses interrupted by a restart (no-op after the first run)
+            analysis_jobs.start()
     except Exception as e:
         st.error(f"Database error: {e}")
         st.info("💡 Please check your database configuration in the .env file.")
     
+    # Check authentication
+    if not st.session_state.authenticated:
+        show_auth_page()
+        return
+    
     # Show header
     show_header()
     
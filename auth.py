@@ -1,7 +1,11 @@
 import streamlit as st
 from database import db_manager
+import os
 import re
 
+# Usernames allowed to see admin-only views such as AI telemetry
+ADMIN_USERNAMES = {name.strip() for name in os.getenv('ADMIN_USERNAMES', '').split(',') if name.strip()}
+
 def validate_email(email):
     """Validate email format"""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -127,6 +131,10 @@ def show_signup_form():
             else:
                 st.error(message)
 
+def is_admin(user):
+    """Return True if the user is listed in ADMIN_USERNAMES"""
+    return user is not None and user['username'] in ADMIN_USERNAMES
+
 def logout():
     """Logout user"""
     st.session_state.authenticated = False
@@ -0,0 +1,53 @@
+"""
+Concurrent AI analysis of many meal photos
+
+Requests that share an API key run at most AI_MAX_CONCURRENCY_PER_KEY at a
+time across the whole process, so a large batch cannot flood the provider
+with one key's requests even when several sessions use it at once.
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+AI_MAX_CONCURRENCY_PER_KEY = int(os.getenv('AI_MAX_CONCURRENCY_PER_KEY', '4'))
+
+_key_semaphores = {}
+_key_semaphores_lock = threading.Lock()
+
+
+def key_semaphore(api_key):
+    """Process-wide semaphore bounding concurrent requests for one API key"""
+    # Never keep the raw key around as a dict key
+    key_id = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()
+    with _key_semaphores_lock:
+        semaphore = _key_semaphores.get(key_id)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(AI_MAX_CONCURRENCY_PER_KEY)
+            _key_semaphores[key_id] = semaphore
+        return semaphore
+
+
+def run_batch(tasks, api_key, worker):
+    """Run worker(task) for every task, yielding (index, result, error) as each finishes
+
+    error is the exception raised by worker, or None on success. Workers run
+    on pool threads and must not touch Streamlit elements.
+    """
+    if not tasks:
+        return
+    semaphore = key_semaphore(api_key)
+
+    def guarded(task):
+        with semaphore:
+            return worker(task)
+
+    workers = max(1, min(len(tasks), AI_MAX_CONCURRENCY_PER_KEY))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ai-batch') as pool:
+        futures = {pool.submit(guarded, task): index for index, task in enumerate(tasks)}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
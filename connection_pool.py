@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class PooledConnection:
+    """Proxy around a raw connection that hands it back to the pool on close()"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._released = False
+
+    def close(self):
+        """Return the connection to the pool instead of closing it"""
+        if not self._released:
+            self._released = True
+            self._pool._release(self._raw)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # Safety net for call sites that bail out on an error before close()
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Process-wide, size-bounded pool of database connections
+
+    Connections that sat idle longer than ``ping_after`` seconds are
+    health-checked on checkout, recycled once they sit idle longer than
+    ``max_idle`` seconds, and counted so the pool can be sized.
+    """
+
+    def __init__(self, connect, max_size=10, timeout=10.0, max_idle=300.0, ping=None, ping_after=5.0):
+        self._connect = connect
+        self._ping = ping
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+
+        self._idle = deque()  # (raw connection, time it was returned)
+        self._open = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0,
+        }
+
+    def get(self):
+        """Check out a healthy connection, waiting up to ``timeout`` seconds"""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+
+        with self._cond:
+            while True:
+                while self._idle:
+                    raw, returned_at = self._idle.pop()
+                    idle_for = time.monotonic() - returned_at
+                    # A connection returned moments ago is not worth a round trip
+                    if idle_for > self.max_idle or (idle_for > self.ping_after and not self._is_healthy(raw)):
+                        self._discard(raw)
+                        continue
+                    self._stats['checkouts'] += 1
+                    return PooledConnection(self, raw)
+
+                if self._open < self.max_size:
+                    # Reserve the slot before connecting outside the lock
+                    self._open += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available after {self.timeout}s "
+                        f"(pool size {self.max_size})"
+                    )
+                if not waited:
+                    waited = True
+                    self._stats['waits'] += 1
+                self._cond.wait(remaining)
+
+        try:
+            raw = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._stats['created'] += 1
+            self._stats['checkouts'] += 1
+        return PooledConnection(self, raw)
+
+    def _release(self, raw):
+        """Take a connection back, dropping it if it is no longer usable"""
+        try:
+            # Never hand uncommitted work to the next borrower; a failed
+            # rollback also tells us the connection is gone
+            raw.rollback()
+            healthy = True
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            if healthy:
+                self._idle.append((raw, time.monotonic()))
+            else:
+                self._discard(raw)
+            self._cond.notify()
+
+    def _is_healthy(self, raw):
+        if self._ping is None:
+            return True
+        try:
+            return bool(self._ping(raw))
+        except Exception:
+            return False
+
+    def _discard(self, raw):
+        # Caller holds the lock
+        self._open -= 1
+        self._stats['discarded'] += 1
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """Close every idle connection (checked-out ones close on release)"""
+        with self._cond:
+            while self._idle:
+                raw, _ = self._idle.pop()
+                self._discard(raw)
+            self._cond.notify_all()
+
+    def stats(self):
+        """Return a snapshot of the pool counters"""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot['open'] = self._open
+            snapshot['idle'] = len(self._idle)
+            snapshot['in_use'] = self._open - len(self._idle)
+            snapshot['max_size'] = self.max_size
+        return snapshot
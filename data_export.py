@@ -0,0 +1,222 @@
+"""
+Streaming export of meal history to CSV, JSONL or Parquet
+
+Rows come from DatabaseManager.iter_meal_export_rows in fixed-size chunks
+and are written straight to the output file, so memory use does not grow
+with the size of a user's history. Finished exports wait in EXPORT_DIR
+until they are downloaded once, their session ends, or EXPORT_MAX_AGE
+passes.
+"""
+
+import csv
+import io
+import json
+import os
+import tempfile
+import weakref
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from database import db_manager, EXPORT_COLUMNS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_DIR = os.getenv('EXPORT_DIR') or os.path.join(tempfile.gettempdir(), 'calories_tracker_exports')
+# Exports older than this many seconds are deleted even if a crash kept them alive
+EXPORT_MAX_AGE = float(os.getenv('EXPORT_MAX_AGE', '3600'))
+
+# format -> (file extension, mime type)
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'jsonl': ('jsonl', 'application/x-ndjson'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+MEAL_COLUMNS = EXPORT_COLUMNS[:11]
+ITEM_COLUMNS = EXPORT_COLUMNS[11:]
+NUMERIC_COLUMNS = {column for column in EXPORT_COLUMNS if column.startswith(('total_', 'item_'))} - {'item_name'}
+
+
+def available_formats():
+    """Return the export formats usable in this environment"""
+    return [name for name in EXPORT_FORMATS if name != 'parquet' or pq is not None]
+
+
+def _format_value(column, value):
+    """Normalize database values into plain, serializable Python values"""
+    if value is None:
+        return None
+    if isinstance(value, timedelta):
+        # mysql-connector returns TIME columns as timedelta
+        seconds = int(value.total_seconds())
+        return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    if isinstance(value, time):
+        return value.strftime('%H:%M:%S')
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal) or column in NUMERIC_COLUMNS:
+        return float(value)
+    return value
+
+
+def _normalized_chunks(user_id, start_date, end_date, chunk_size):
+    for rows in db_manager.iter_meal_export_rows(user_id, start_date, end_date, chunk_size):
+        yield [
+            [_format_value(column, value) for column, value in zip(EXPORT_COLUMNS, row)]
+            for row in rows
+        ]
+
+
+def write_csv(chunks, out):
+    """Write one CSV row per meal item (meal columns repeated)"""
+    text_out = io.TextIOWrapper(out, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(text_out)
+    writer.writerow(EXPORT_COLUMNS)
+    rows_written = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        rows_written += len(rows)
+    text_out.detach()
+    return rows_written
+
+
+def write_jsonl(chunks, out):
+    """Write one JSON object per meal with its items nested"""
+    rows_written = 0
+    current = None
+
+    def flush(meal):
+        out.write(json.dumps(meal).encode('utf-8') + b'\n')
+
+    for rows in chunks:
+        for row in rows:
+            rows_written += 1
+            if current is None or current['meal_id'] != row[0]:
+                if current is not None:
+                    flush(current)
+                current = dict(zip(MEAL_COLUMNS, row[:len(MEAL_COLUMNS)]))
+                current['items'] = []
+            if row[len(MEAL_COLUMNS)] is not None:
+                item = dict(zip(ITEM_COLUMNS, row[len(MEAL_COLUMNS):]))
+                current['items'].append({
+                    column.replace('item_', '', 1): value for column, value in item.items()
+                })
+
+    if current is not None:
+        flush(current)
+    return rows_written
+
+
+def write_parquet(chunks, out):
+    """Write one Parquet row group per chunk"""
+    if pq is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([
+        (column, pa.float64() if column in NUMERIC_COLUMNS else
+         pa.int64() if column == 'meal_id' else pa.string())
+        for column in EXPORT_COLUMNS
+    ])
+    rows_written = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_table(pa.table(
+                {name: list(values) for name, values in zip(EXPORT_COLUMNS, columns)},
+                schema=schema
+            ))
+            rows_written += len(rows)
+    return rows_written
+
+
+WRITERS = {
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+    'parquet': write_parquet,
+}
+
+
+def export_meals(user_id, export_format, out, start_date=None, end_date=None,
+                 chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream a user's meals into a binary file object; returns rows written"""
+    if export_format not in WRITERS:
+        raise ValueError(f"Unsupported export format '{export_format}'")
+    chunks = _normalized_chunks(user_id, start_date, end_date, chunk_size)
+    return WRITERS[export_format](chunks, out)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _remove_stale_exports(max_age=EXPORT_MAX_AGE):
+    """Delete exports left behind by sessions of a process that did not exit cleanly"""
+    cutoff = datetime.now().timestamp() - max_age
+    try:
+        names = os.listdir(EXPORT_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class ExportFile:
+    """A finished export on disk, deleted once it has been downloaded
+
+    Keep it in st.session_state: when the session ends the object is
+    garbage-collected and the file is deleted with it.
+    """
+
+    def __init__(self, path, rows, export_format):
+        self.path = path
+        self.rows = rows
+        self.format = export_format
+        self._finalizer = weakref.finalize(self, _remove, path)
+
+    @property
+    def available(self):
+        return os.path.exists(self.path)
+
+    def take(self):
+        """Bytes of the export for its one download; the file is deleted afterwards
+
+        Safe to call from any thread, e.g. as a deferred st.download_button data callable.
+        """
+        try:
+            with open(self.path, 'rb') as handle:
+                return handle.read()
+        finally:
+            self._finalizer()
+
+    def discard(self):
+        """Delete the file without downloading it"""
+        self._finalizer()
+
+
+def export_meals_to_file(user_id, export_format, start_date=None, end_date=None):
+    """Export to a file in EXPORT_DIR and return it as an ExportFile"""
+    extension, _ = EXPORT_FORMATS[export_format]
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    _remove_stale_exports()
+    with tempfile.NamedTemporaryFile(dir=EXPORT_DIR, suffix=f'.{extension}', delete=False) as out:
+        try:
+            rows = export_meals(user_id, export_format, out, start_date, end_date)
+        except BaseException:
+            out.close()
+            _remove(out.name)
+            raise
+    return ExportFile(out.name, rows, export_format)
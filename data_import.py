@@ -0,0 +1,260 @@
+"""
+Bulk import of historical meal logs from CSV or JSONL
+
+Accepts the same layouts data_export.py produces:
+
+* CSV  - one row per food item (or per meal when there are no items).
+         Required columns: meal_date, meal_type. Optional: meal_id (groups
+         item rows into one meal), meal_time, image_name, total_* and item_*.
+* JSONL - one JSON object per meal with the same keys and an optional
+         "items" list of {name, calories, protein, carbs, fat, sugar, fiber}.
+
+Rows are validated as they stream in and written in large batched
+transactions. The daily rollup is refreshed once at the end for the imported
+date range.
+"""
+
+import csv
+import io
+import json
+import math
+import time as timer
+from datetime import date, datetime, time
+
+from database import db_manager
+
+IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 50
+
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner', 'snack')
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fat', 'sugar', 'fiber')
+DEFAULT_MEAL_TIME = time(12, 0)
+# Largest value a DECIMAL(10,2) nutrient column holds
+MAX_NUTRIENT_VALUE = 99999999.99
+
+
+class ImportRowError(ValueError):
+    """A single row failed validation"""
+
+
+def _parse_date(value):
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ImportRowError(f"invalid meal_date '{value}' (expected YYYY-MM-DD)")
+
+
+def _parse_time(value):
+    if value in (None, ''):
+        return DEFAULT_MEAL_TIME
+    text = str(value).strip()
+    for fmt in ('%H:%M:%S', '%H:%M', '%I:%M %p', '%I:%M%p'):
+        try:
+            return datetime.strptime(text, fmt).time()
+        except ValueError:
+            continue
+    raise ImportRowError(f"invalid meal_time '{value}' (expected HH:MM[:SS])")
+
+
+def _parse_number(value, field):
+    if value in (None, ''):
+        return 0.0
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ImportRowError(f"invalid number for {field}: '{value}'")
+    if not math.isfinite(number):
+        raise ImportRowError(f"invalid number for {field}: '{value}'")
+    if number < 0:
+        raise ImportRowError(f"{field} cannot be negative")
+    if number > MAX_NUTRIENT_VALUE:
+        raise ImportRowError(f"{field} is larger than {MAX_NUTRIENT_VALUE:.2f}")
+    return number
+
+
+def _parse_meal_type(value):
+    meal_type = str(value or '').strip().lower()
+    if meal_type not in MEAL_TYPES:
+        raise ImportRowError(f"invalid meal_type '{value}' (expected one of {', '.join(MEAL_TYPES)})")
+    return meal_type
+
+
+def _build_meal(user_id, record, items):
+    """Validate a meal record and turn it into a save_meals() dict"""
+    nutrition_data = {
+        f'total_{nutrient}': _parse_number(record.get(f'total_{nutrient}'), f'total_{nutrient}')
+        for nutrient in NUTRIENTS
+    }
+    nutrition_data['items'] = items
+
+    # Fill in missing totals from the items when only items were given
+    if items and not any(nutrition_data[f'total_{nutrient}'] for nutrient in NUTRIENTS):
+        for nutrient in NUTRIENTS:
+            nutrition_data[f'total_{nutrient}'] = sum(item[nutrient] for item in items)
+
+    return {
+        'user_id': user_id,
+        'meal_date': _parse_date(record.get('meal_date')),
+        'meal_time': _parse_time(record.get('meal_time')),
+        'meal_type': _parse_meal_type(record.get('meal_type')),
+        'image_name': record.get('image_name') or None,
+        'ai_analysis': record.get('ai_analysis') or None,
+        'nutrition_data': nutrition_data
+    }
+
+
+def _build_item(values, prefix=''):
+    name = str(values.get(f'{prefix}name') or '').strip()
+    if not name:
+        return None
+    if len(name) > 255:
+        raise ImportRowError("item name is longer than 255 characters")
+    item = {'name': name}
+    for nutrient in NUTRIENTS:
+        item[nutrient] = _parse_number(values.get(f'{prefix}{nutrient}'), f'{prefix}{nutrient}')
+    return item
+
+
+def iter_csv_meals(text_stream, user_id):
+    """Yield (line number, rows consumed, meal or ImportRowError) from a CSV stream"""
+    reader = csv.DictReader(text_stream)
+    missing = {'meal_date', 'meal_type'} - set(reader.fieldnames or [])
+    if missing:
+        raise ImportRowError(f"CSV is missing required column(s): {', '.join(sorted(missing))}")
+
+    grouped = 'meal_id' in reader.fieldnames
+    pending_key = None
+    pending_record = None
+    pending_items = []
+    pending_line = None
+    pending_rows = 0
+
+    def flush():
+        try:
+            return pending_line, pending_rows, _build_meal(user_id, pending_record, pending_items)
+        except ImportRowError as e:
+            return pending_line, pending_rows, e
+
+    for row in reader:
+        line = reader.line_num
+        key = row.get('meal_id') if grouped and row.get('meal_id') else None
+
+        if pending_record is not None and (key is None or key != pending_key):
+            yield flush()
+            pending_record = None
+
+        if pending_record is None:
+            pending_key = key
+            pending_record = row
+            pending_items = []
+            pending_line = line
+            pending_rows = 0
+
+        try:
+            item = _build_item(row, prefix='item_')
+        except ImportRowError as e:
+            yield line, 1, e
+            continue
+        pending_rows += 1
+        if item is not None:
+            pending_items.append(item)
+
+    if pending_record is not None:
+        yield flush()
+
+
+def iter_jsonl_meals(text_stream, user_id):
+    """Yield (line number, rows consumed, meal or ImportRowError) from a JSONL stream"""
+    for line_number, line in enumerate(text_stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ImportRowError("each line must be a JSON object")
+            items = []
+            for raw_item in record.get('items') or []:
+                item = _build_item(raw_item)
+                if item is not None:
+                    items.append(item)
+            yield line_number, 1, _build_meal(user_id, record, items)
+        except json.JSONDecodeError as e:
+            yield line_number, 1, ImportRowError(f"invalid JSON: {e.msg}")
+        except ImportRowError as e:
+            yield line_number, 1, e
+
+
+READERS = {
+    'csv': iter_csv_meals,
+    'jsonl': iter_jsonl_meals,
+}
+
+
+def detect_format(file_name):
+    """Guess the import format from a file name"""
+    lowered = (file_name or '').lower()
+    if lowered.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return 'csv'
+
+
+def import_meals(user_id, binary_stream, import_format, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """Validate and load meals from a binary stream into the database
+
+    Invalid rows are skipped and reported. Returns a summary dict with the
+    number of meals and items loaded, the input rows read, the errors, the
+    elapsed time and the throughput in rows per second.
+    progress(meals_loaded) is called after each committed batch.
+    """
+    if import_format not in READERS:
+        raise ValueError(f"Unsupported import format '{import_format}'")
+
+    text_stream = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    summary = {'meals': 0, 'items': 0, 'rows': 0, 'errors': [], 'error_count': 0}
+    started = timer.perf_counter()
+    first_date = None
+    last_date = None
+    batch = []
+
+    def load(batch):
+        db_manager.insert_meals(batch, update_rollup=False)
+        summary['meals'] += len(batch)
+        summary['items'] += sum(len(meal['nutrition_data']['items']) for meal in batch)
+        if progress:
+            progress(summary['meals'])
+
+    try:
+        for line_number, rows, result in READERS[import_format](text_stream, user_id):
+            summary['rows'] += rows
+            if isinstance(result, ImportRowError):
+                summary['error_count'] += 1
+                if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                    summary['errors'].append(f"line {line_number}: {result}")
+                continue
+
+            batch.append(result)
+            meal_date = result['meal_date']
+            first_date = meal_date if first_date is None else min(first_date, meal_date)
+            last_date = meal_date if last_date is None else max(last_date, meal_date)
+
+            if len(batch) >= batch_size:
+                load(batch)
+                batch = []
+
+        if batch:
+            load(batch)
+    finally:
+        # Leave the caller's stream open
+        text_stream.detach()
+        # Refresh the daily rollup once for everything that was committed
+        if summary['meals']:
+            db_manager.rebuild_daily_nutrition(user_id, first_date, last_date)
+
+    elapsed = timer.perf_counter() - started
+    summary['seconds'] = elapsed
+    summary['rows_per_second'] = summary['rows'] / elapsed if elapsed > 0 else 0.0
+    summary['first_date'] = first_date
+    summary['last_date'] = last_date
+    return summary
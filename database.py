@@ -1,109 +1,130 @@
-import mysql.connector
-from mysql.connector import Error
+from connection_pool import PoolTimeoutError
+from storage import Error, create_backend
 import streamlit as st
 import hashlib
 import os
 from dotenv import load_dotenv
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import json
+import threading
+import migrations
+from food_index import FOOD_LINK_MIN_SCORE, food_index
+from query_cache import QueryCache
 
 # Load environment variables
 load_dotenv()
 
+# Column order of rows yielded by DatabaseManager.iter_meal_export_rows
+EXPORT_COLUMNS = [
+    'meal_id', 'meal_date', 'meal_time', 'meal_type', 'image_name',
+    'total_calories', 'total_protein', 'total_carbs', 'total_fat',
+    'total_sugar', 'total_fiber',
+    'item_name', 'item_calories', 'item_protein', 'item_carbs', 'item_fat',
+    'item_sugar', 'item_fiber'
+]
+
+# Columns of the ai_telemetry table written by ai_telemetry
+TELEMETRY_COLUMNS = [
+    'created_at', 'provider', 'model', 'outcome', 'http_status', 'error', 'retries',
+    'queue_seconds', 'ttfb_seconds', 'total_seconds', 'image_count',
+    'image_source_bytes', 'image_sent_bytes', 'prompt_tokens', 'completion_tokens', 'cost_usd'
+]
+
+# Maximum meal_items rows per multi-row INSERT
+ITEM_BATCH_SIZE = 1000
+
+# Schema bootstrap runs once per process, not on every Streamlit rerun
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def match_food_id(item_name):
+    """Id of the canonical food an item name refers to, or None
+
+    Weak matches ("Chicken tikka masala" -> chicken breast) are not linked.
+    """
+    match = food_index.lookup(item_name) if food_index is not None else None
+    return match[0].id if match and match[1] >= FOOD_LINK_MIN_SCORE else None
+
 class DatabaseManager:
-    def __init__(self):
-        self.host = os.getenv('DB_HOST', 'localhost')
-        self.port = os.getenv('DB_PORT', '3306')
-        self.database = os.getenv('DB_NAME', 'calories_tracker')
-        self.user = os.getenv('DB_USER', 'placeholder_username')
-        self.password = os.getenv('DB_PASSWORD', 'placeholder_password')
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._backend_lock = threading.Lock()
         
+        # Per-user read cache for day totals and meal lists
+        self.cache = QueryCache(
+            max_size=int(os.getenv('QUERY_CACHE_SIZE', '2048')),
+            ttl=float(os.getenv('QUERY_CACHE_TTL', '300'))
+        )
+    
+    @property
+    def backend(self):
+        """Storage backend selected by DB_BACKEND, created on first use"""
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = create_backend()
+        return self._backend
+    
     def get_connection(self):
-        """Create and return a database connection"""
-        try:
-            connection = mysql.connector.connect(
-                host=self.host,
-                port=self.port,
-                database=self.database,
-                user=self.user,
-                password=self.password
-            )
-            return connection
-        except Error as e:
+        """Check out a database connection from the storage backend
+        
+        Calling close() on the returned connection hands it back to the pool.
+        """
+        try:
+            return self.backend.get_connection()
+        except (*Error, PoolTimeoutError) as e:
             st.error(f"Database connection error: {e}")
             return None
     
-    def init_database(self):
-        """Initialize the database with required tables"""
+    def pool_stats(self):
+        """Return connection counters (checkouts, waits, timeouts, open)"""
+        return self.backend.stats()
+    
+    def cache_stats(self):
+        """Return query cache counters (hits, misses, evictions, size)"""
+        return self.cache.stats()
+    
+    def migrate(self, target=None, log=None):
+        """Apply pending schema migrations; raises on database errors"""
+        connection = self.backend.get_connection()
         try:
-            connection = self.get_connection()
-            if connection is None:
-                return False
-                
-            cursor = connection.cursor()
-            
-            # Create users table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    username VARCHAR(50) UNIQUE NOT NULL,
-                    email VARCHAR(100) UNIQUE NOT NULL,
-                    password_hash VARCHAR(255) NOT NULL,
-                    gemini_api_key TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    daily_calorie_goal INT DEFAULT 2000,
-                    daily_protein_goal INT DEFAULT 150,
-                    daily_carb_goal INT DEFAULT 250,
-                    daily_fat_goal INT DEFAULT 65
-                )
-            """)
-            
-            # Create meals table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS meals (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    user_id INT NOT NULL,
-                    meal_date DATE NOT NULL,
-                    meal_time TIME NOT NULL,
-                    meal_type ENUM('breakfast', 'lunch', 'dinner', 'snack') NOT NULL,
-                    image_name VARCHAR(255),
-                    total_calories DECIMAL(10,2) DEFAULT 0,
-                    total_protein DECIMAL(10,2) DEFAULT 0,
-                    total_carbs DECIMAL(10,2) DEFAULT 0,
-                    total_fat DECIMAL(10,2) DEFAULT 0,
-                    total_sugar DECIMAL(10,2) DEFAULT 0,
-                    total_fiber DECIMAL(10,2) DEFAULT 0,
-                    ai_analysis TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-                )
-            """)
-            
-            # Create meal_items table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS meal_items (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    meal_id INT NOT NULL,
-                    item_name VARCHAR(255) NOT NULL,
-                    calories DECIMAL(10,2) DEFAULT 0,
-                    protein DECIMAL(10,2) DEFAULT 0,
-                    carbs DECIMAL(10,2) DEFAULT 0,
-                    fat DECIMAL(10,2) DEFAULT 0,
-                    sugar DECIMAL(10,2) DEFAULT 0,
-                    fiber DECIMAL(10,2) DEFAULT 0,
-                    FOREIGN KEY (meal_id) REFERENCES meals(id) ON DELETE CASCADE
-                )
-            """)
-            
-            connection.commit()
-            cursor.close()
+            return migrations.migrate(connection, self.backend.dialect, target=target, log=log)
+        finally:
+            connection.close()
+    
+    def applied_migrations(self):
+        """Return the set of applied migration versions; raises on database errors"""
+        connection = self.backend.get_connection()
+        try:
+            return migrations.applied_versions(connection)
+        finally:
             connection.close()
+    
+    def init_database(self):
+        """Bring the database schema up to date by applying pending migrations"""
+        try:
+            self.migrate()
             return True
             
-        except Error as e:
+        except (*Error, PoolTimeoutError) as e:
             st.error(f"Database initialization error: {e}")
             return False
     
+    def ensure_schema(self):
+        """Run migrations once per process and skip the check on later reruns"""
+        global _schema_ready
+        if _schema_ready:
+            return True
+        
+        with _schema_lock:
+            if not _schema_ready:
+                if os.getenv('DB_AUTO_MIGRATE', 'true').lower() in ('0', 'false', 'no'):
+                    # Migrations are run at deploy time with `python manage.py migrate`
+                    _schema_ready = True
+                else:
+                    _schema_ready = self.init_database()
+        return _schema_ready
+    
     def hash_password(self, password):
         """Hash a password for storing"""
         return hashlib.sha256(password.encode()).hexdigest()
@@ -129,7 +150,7 @@ class DatabaseManager:
             return True, "User created successfully"
             
         except Error as e:
-            if "Duplicate entry" in str(e):
+            if self.backend.is_duplicate_error(e):
                 return False, "Username or email already exists"
             return False, f"Database error: {e}"
     
@@ -172,69 +193,373 @@ class DatabaseManager:
         except Error as e:
             return False, None, f"Database error: {e}"
     
-    def save_meal_analysis(self, user_id, meal_type, ai_analysis, nutrition_data, image_name=None):
+    def save_meal_analysis(self, user_id, meal_type, ai_analysis, nutrition_data, image_name=None,
+                           image_phash=None, image_sha256=None):
         """Save meal analysis to database"""
+        meal_ids = self.save_meals([{
+            'user_id': user_id,
+            'meal_type': meal_type,
+            'ai_analysis': ai_analysis,
+            'nutrition_data': nutrition_data,
+            'image_name': image_name,
+            'image_phash': image_phash,
+            'image_sha256': image_sha256
+        }])
+        return meal_ids is not None
+    
+    def save_meals(self, meals):
+        """Save many meals and their items in a single transaction
+        
+        Each meal is a dict with user_id, meal_type, ai_analysis and
+        nutrition_data, plus optional image_name, image_phash, image_sha256
+        (the photo's image_store digest), meal_date and meal_time (defaulting
+        to now). Returns the new meal ids, or None on failure.
+        """
+        try:
+            return self.insert_meals(meals)
+            
+        except (*Error, PoolTimeoutError) as e:
+            st.error(f"Error saving meal: {e}")
+            return None
+    
+    def insert_meals(self, meals, update_rollup=True):
+        """Insert meals in one transaction and return their ids
+        
+        Same as save_meals() but raises on database errors. Bulk loaders pass
+        update_rollup=False and call rebuild_daily_nutrition() once at the end.
+        """
+        if not meals:
+            return []
+        
+        connection = self.backend.get_connection()
         try:
-            connection = self.get_connection()
-            if connection is None:
-                return False
-                
             cursor = connection.cursor()
+            meal_ids = self._write_meals(cursor, meals, update_rollup)
+            
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+        
+        self._invalidate_meal_days(meals)
+        return meal_ids
+    
+    def _invalidate_meal_days(self, meals):
+        """Drop cached reads for every (user, day) touched by the given meals"""
+        days_by_user = {}
+        for meal in meals:
+            days_by_user.setdefault(meal['user_id'], set()).add(meal.get('meal_date') or date.today())
+        for user_id, days in days_by_user.items():
+            self.cache.invalidate(user_id, days)
+    
+    def _write_meals(self, cursor, meals, update_rollup=True):
+        """Insert meals, their items and rollup deltas using the given cursor"""
+        meal_ids = []
+        item_rows = []
+        rollup = {}
+        
+        for meal in meals:
+            nutrition_data = meal['nutrition_data']
+            meal_date = meal.get('meal_date') or date.today()
+            meal_time = meal.get('meal_time') or datetime.now().time()
+            # Round like DECIMAL(10,2) so the rollup matches what meals stores
+            totals = tuple(round(float(nutrition_data.get(key, 0) or 0), 2) for key in (
+                'total_calories', 'total_protein', 'total_carbs',
+                'total_fat', 'total_sugar', 'total_fiber'
+            ))
             
             # Insert meal record
             cursor.execute("""
                 INSERT INTO meals (user_id, meal_date, meal_time, meal_type, image_name,
                                  total_calories, total_protein, total_carbs, total_fat,
-                                 total_sugar, total_fiber, ai_analysis)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                user_id,
-                date.today(),
-                datetime.now().time(),
-                meal_type,
-                image_name,
-                nutrition_data.get('total_calories', 0),
-                nutrition_data.get('total_protein', 0),
-                nutrition_data.get('total_carbs', 0),
-                nutrition_data.get('total_fat', 0),
-                nutrition_data.get('total_sugar', 0),
-                nutrition_data.get('total_fiber', 0),
-                ai_analysis
-            ))
+                                 total_sugar, total_fiber, ai_analysis, image_phash, image_sha256)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (meal['user_id'], meal_date, meal_time, meal['meal_type'], meal.get('image_name'))
+                + totals + (meal.get('ai_analysis'), meal.get('image_phash'), meal.get('image_sha256')))
             
             meal_id = cursor.lastrowid
+            meal_ids.append(meal_id)
             
-            # Insert individual meal items if provided
-            if 'items' in nutrition_data:
-                for item in nutrition_data['items']:
-                    cursor.execute("""
-                        INSERT INTO meal_items (meal_id, item_name, calories, protein,
-                                              carbs, fat, sugar, fiber)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        meal_id,
-                        item['name'],
-                        item.get('calories', 0),
-                        item.get('protein', 0),
-                        item.get('carbs', 0),
-                        item.get('fat', 0),
-                        item.get('sugar', 0),
-                        item.get('fiber', 0)
-                    ))
+            # Collect individual meal items for one batched insert
+            for item in nutrition_data.get('items', []):
+                item_rows.append((
+                    meal_id,
+                    item['name'],
+                    item.get('calories', 0),
+                    item.get('protein', 0),
+                    item.get('carbs', 0),
+                    item.get('fat', 0),
+                    item.get('sugar', 0),
+                    item.get('fiber', 0),
+                    item['food_id'] if 'food_id' in item else match_food_id(item['name'])
+                ))
+            
+            key = (meal['user_id'], meal_date)
+            previous = rollup.get(key, (0,) * 7)
+            rollup[key] = (previous[0] + 1,) + tuple(a + b for a, b in zip(previous[1:], totals))
+        
+        # executemany turns this into multi-row INSERT statements
+        for start in range(0, len(item_rows), ITEM_BATCH_SIZE):
+            cursor.executemany("""
+                INSERT INTO meal_items (meal_id, item_name, calories, protein,
+                                      carbs, fat, sugar, fiber, food_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, item_rows[start:start + ITEM_BATCH_SIZE])
+        
+        # Keep the daily rollup in step within the same transaction
+        if update_rollup:
+            self._update_daily_rollup(cursor, [
+                (user_id, meal_date) + deltas for (user_id, meal_date), deltas in rollup.items()
+            ])
+        
+        return meal_ids
+    
+    def _update_daily_rollup(self, cursor, rows):
+        """Add (or, with negative values, subtract) per-day deltas to the daily rollup
+        
+        Each row is (user_id, date, meal_count, calories, protein, carbs, fat,
+        sugar, fiber).
+        """
+        if not rows:
+            return
+        
+        cursor.executemany(self.backend.upsert_sql(
+            'daily_nutrition',
+            ['user_id', 'nutrition_date'],
+            ['meal_count', 'calories', 'protein', 'carbs', 'fat', 'sugar', 'fiber'],
+            accumulate=True
+        ), rows)
+        
+        for row in rows:
+            if row[2] < 0:
+                cursor.execute("""
+                    DELETE FROM daily_nutrition
+                    WHERE user_id = %s AND nutrition_date = %s AND meal_count <= 0
+                """, (row[0], row[1]))
+    
+    def delete_meal(self, user_id, meal_id):
+        """Delete a single meal and remove it from the daily rollup"""
+        try:
+            connection = self.get_connection()
+            if connection is None:
+                return False
+            
+            cursor = connection.cursor()
+            
+            cursor.execute("""
+                SELECT meal_date, total_calories, total_protein, total_carbs,
+                       total_fat, total_sugar, total_fiber
+                FROM meals
+                WHERE id = %s AND user_id = %s
+            """, (meal_id, user_id))
+            meal = cursor.fetchone()
+            
+            if meal is None:
+                cursor.close()
+                connection.close()
+                return False
+            
+            cursor.execute("DELETE FROM meals WHERE id = %s AND user_id = %s", (meal_id, user_id))
+            if cursor.rowcount != 1:
+                # Someone else deleted it first and already adjusted the rollup
+                cursor.close()
+                connection.close()
+                return False
+            
+            self._update_daily_rollup(cursor, [
+                (user_id, meal[0], -1) + tuple(-value for value in meal[1:])
+            ])
             
             connection.commit()
             cursor.close()
             connection.close()
+            self.cache.invalidate(user_id, [meal[0]])
             return True
             
         except Error as e:
-            st.error(f"Error saving meal: {e}")
+            st.error(f"Error deleting meal: {e}")
             return False
     
+    def delete_user_meals(self, user_id):
+        """Delete every meal for a user along with their daily rollup rows"""
+        try:
+            connection = self.get_connection()
+            if connection is None:
+                return False
+            
+            cursor = connection.cursor()
+            cursor.execute("DELETE FROM meals WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM daily_nutrition WHERE user_id = %s", (user_id,))
+            
+            connection.commit()
+            cursor.close()
+            connection.close()
+            self.cache.invalidate(user_id)
+            return True
+            
+        except Error as e:
+            st.error(f"Error deleting data: {e}")
+            return False
+    
+    def match_meal_item_foods(self, user_id=None, batch_size=ITEM_BATCH_SIZE):
+        """Link meal_items saved without a canonical food to the food index
+        
+        Returns (items checked, items matched). Raises on database errors.
+        """
+        if food_index is None:
+            return 0, 0
+        
+        filters = ["i.food_id IS NULL"]
+        params = []
+        if user_id is not None:
+            filters.append("m.user_id = %s")
+            params.append(user_id)
+        
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"""
+                SELECT i.id, i.item_name, m.user_id, m.meal_date
+                FROM meal_items i
+                JOIN meals m ON m.id = i.meal_id
+                WHERE {' AND '.join(filters)}
+            """, tuple(params))
+            rows = cursor.fetchall()
+            
+            updates = []
+            days = []
+            for item_id, item_name, owner_id, meal_date in rows:
+                food_id = match_food_id(item_name)
+                if food_id is not None:
+                    updates.append((food_id, item_id))
+                    days.append({'user_id': owner_id, 'meal_date': meal_date})
+            for start in range(0, len(updates), batch_size):
+                cursor.executemany(
+                    "UPDATE meal_items SET food_id = %s WHERE id = %s",
+                    updates[start:start + batch_size]
+                )
+            
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+        
+        self._invalidate_meal_days(days)
+        return len(rows), len(updates)
+    
+    def get_image_digests(self):
+        """Return the set of image_store digests referenced by any meal. Raises on database errors."""
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT DISTINCT image_sha256 FROM meals WHERE image_sha256 IS NOT NULL")
+            digests = {row[0] for row in cursor.fetchall()}
+            cursor.close()
+            return digests
+        finally:
+            connection.close()
+    
+    def rebuild_daily_nutrition(self, user_id=None, start_date=None, end_date=None):
+        """Recompute the daily rollup from meals (all users, or one user)
+        
+        start_date/end_date limit the rebuild to a window of days. Returns the
+        number of rollup rows written. Raises on database errors.
+        """
+        filters = []
+        params = []
+        if user_id is not None:
+            filters.append("user_id = %s")
+            params.append(user_id)
+        if start_date is not None:
+            filters.append("{date_column} >= %s")
+            params.append(start_date)
+        if end_date is not None:
+            filters.append("{date_column} <= %s")
+            params.append(end_date)
+        where = "WHERE " + " AND ".join(filters) if filters else ""
+        params = tuple(params)
+        
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor()
+            
+            cursor.execute(
+                f"DELETE FROM daily_nutrition {where.format(date_column='nutrition_date')}",
+                params
+            )
+            cursor.execute(f"""
+                INSERT INTO daily_nutrition (user_id, nutrition_date, meal_count, calories,
+                                             protein, carbs, fat, sugar, fiber)
+                SELECT user_id, meal_date, COUNT(*), SUM(total_calories), SUM(total_protein),
+                       SUM(total_carbs), SUM(total_fat), SUM(total_sugar), SUM(total_fiber)
+                FROM meals
+                {where.format(date_column='meal_date')}
+                GROUP BY user_id, meal_date
+            """, params)
+            rows = cursor.rowcount
+            
+            connection.commit()
+            cursor.close()
+            if user_id is None:
+                self.cache.clear()
+            else:
+                self.cache.invalidate(user_id)
+            return rows
+        finally:
+            connection.close()
+    
+    def verify_daily_nutrition(self, user_id=None, tolerance=0.01):
+        """Compare the daily rollup against totals recomputed from meals
+        
+        Returns a list of (user_id, date, rollup_row, expected_row) mismatches,
+        where either row may be None. Raises on database errors.
+        """
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor()
+            user_filter = "WHERE user_id = %s" if user_id is not None else ""
+            params = (user_id,) if user_id is not None else ()
+            
+            cursor.execute(f"""
+                SELECT user_id, nutrition_date, meal_count, calories, protein,
+                       carbs, fat, sugar, fiber
+                FROM daily_nutrition
+                {user_filter}
+            """, params)
+            rollup = {(row[0], row[1]): tuple(float(v) for v in row[2:]) for row in cursor.fetchall()}
+            
+            cursor.execute(f"""
+                SELECT user_id, meal_date, COUNT(*), SUM(total_calories), SUM(total_protein),
+                       SUM(total_carbs), SUM(total_fat), SUM(total_sugar), SUM(total_fiber)
+                FROM meals
+                {user_filter}
+                GROUP BY user_id, meal_date
+            """, params)
+            expected = {(row[0], row[1]): tuple(float(v) for v in row[2:]) for row in cursor.fetchall()}
+            cursor.close()
+        finally:
+            connection.close()
+        
+        mismatches = []
+        for key in sorted(set(rollup) | set(expected)):
+            actual_row = rollup.get(key)
+            expected_row = expected.get(key)
+            if actual_row is None or expected_row is None or any(
+                abs(a - b) > tolerance for a, b in zip(actual_row, expected_row)
+            ):
+                mismatches.append((key[0], key[1], actual_row, expected_row))
+        return mismatches
+    
     def get_daily_nutrition(self, user_id, target_date=None):
         """Get daily nutrition summary for a user"""
         if target_date is None:
             target_date = date.today()
+        
+        cache_key = ('nutrition', user_id, target_date)
+        found, cached = self.cache.get(cache_key)
+        if found:
+            return dict(cached)
+        generation = self.cache.generation(user_id)
             
         try:
             connection = self.get_connection()
@@ -244,40 +569,107 @@ class DatabaseManager:
             cursor = connection.cursor()
             
             cursor.execute("""
-                SELECT 
-                    COALESCE(SUM(total_calories), 0) as total_calories,
-                    COALESCE(SUM(total_protein), 0) as total_protein,
-                    COALESCE(SUM(total_carbs), 0) as total_carbs,
-                    COALESCE(SUM(total_fat), 0) as total_fat,
-                    COALESCE(SUM(total_sugar), 0) as total_sugar,
-                    COALESCE(SUM(total_fiber), 0) as total_fiber
-                FROM meals 
-                WHERE user_id = %s AND meal_date = %s
+                SELECT calories, protein, carbs, fat, sugar, fiber
+                FROM daily_nutrition
+                WHERE user_id = %s AND nutrition_date = %s
             """, (user_id, target_date))
             
             result = cursor.fetchone()
             cursor.close()
             connection.close()
             
-            if result:
-                return {
-                    'calories': float(result[0]),
-                    'protein': float(result[1]),
-                    'carbs': float(result[2]),
-                    'fat': float(result[3]),
-                    'sugar': float(result[4]),
-                    'fiber': float(result[5])
-                }
-            return None
+            # No rollup row means nothing was logged that day
+            if result is None:
+                result = (0, 0, 0, 0, 0, 0)
+            
+            nutrition = self._nutrition_from_row(result)
+            self.cache.set(cache_key, nutrition, generation)
+            return dict(nutrition)
             
         except Error as e:
             st.error(f"Error getting daily nutrition: {e}")
             return None
-    
+
+    def get_nutrition_range(self, user_id, start_date, end_date):
+        """Get per-day nutrition totals for a date range from the daily rollup
+
+        Returns one entry per day from start_date to end_date (inclusive),
+        oldest first, with days that have no meals filled with zeros.
+        Served from the per-day cache when every day in the range is cached.
+        """
+        days = []
+        current_date = start_date
+        while current_date <= end_date:
+            days.append(current_date)
+            current_date += timedelta(days=1)
+        
+        cached_days = []
+        for day in days:
+            found, cached = self.cache.get(('nutrition', user_id, day))
+            if not found:
+                break
+            cached_days.append(dict(cached, date=day))
+        else:
+            return cached_days
+        generation = self.cache.generation(user_id)
+        
+        try:
+            connection = self.get_connection()
+            if connection is None:
+                return []
+
+            cursor = connection.cursor()
+
+            cursor.execute("""
+                SELECT nutrition_date, calories, protein, carbs, fat, sugar, fiber
+                FROM daily_nutrition
+                WHERE user_id = %s AND nutrition_date BETWEEN %s AND %s
+            """, (user_id, start_date, end_date))
+
+            rows = cursor.fetchall()
+            cursor.close()
+            connection.close()
+
+            totals_by_date = {row[0]: row[1:] for row in rows}
+
+            nutrition_range = []
+            for day in days:
+                # No rollup row means nothing was logged that day
+                nutrition = self._nutrition_from_row(totals_by_date.get(day, (0, 0, 0, 0, 0, 0)))
+                self.cache.set(('nutrition', user_id, day), nutrition, generation)
+                nutrition_range.append(dict(nutrition, date=day))
+
+            return nutrition_range
+
+        except Error as e:
+            st.error(f"Error getting nutrition range: {e}")
+            return []
+
+    def _nutrition_from_row(self, row):
+        """Build a nutrition dict from (calories, protein, carbs, fat, sugar, fiber)"""
+        return {
+            'calories': float(row[0]),
+            'protein': float(row[1]),
+            'carbs': float(row[2]),
+            'fat': float(row[3]),
+            'sugar': float(row[4]),
+            'fiber': float(row[5])
+        }
+
     def get_meals_by_date(self, user_id, target_date=None):
-        """Get all meals for a specific date"""
+        """Get meal summaries for a specific date
+        
+        The ai_analysis body is left out; fetch it with get_meal_analysis()
+        when the user actually opens a meal.
+        """
         if target_date is None:
             target_date = date.today()
+        
+        cache_key = ('meals', user_id, target_date)
+        found, cached = self.cache.get(cache_key)
+        if found:
+            return [dict(meal) for meal in cached]
+        generation = self.cache.generation(user_id)
             
         try:
             connection = self.get_connection()
@@ -288,7 +680,7 @@ class DatabaseManager:
             
             cursor.execute("""
                 SELECT id, meal_type, meal_time, total_calories, total_protein,
-                       total_carbs, total_fat, ai_analysis, image_name
+                       total_carbs, total_fat, ai_analysis IS NOT NULL, image_name, image_sha256
                 FROM meals 
                 WHERE user_id = %s AND meal_date = %s
                 ORDER BY meal_time
@@ -308,16 +700,492 @@ class DatabaseManager:
                     'protein': float(meal[4]),
                     'carbs': float(meal[5]),
                     'fat': float(meal[6]),
-                    'analysis': meal[7],
-                    'image_name': meal[8]
+                    'has_analysis': bool(meal[7]),
+                    'image_name': meal[8],
+                    'image_sha256': meal[9]
                 })
             
-            return meal_list
+            self.cache.set(cache_key, meal_list, generation)
+            return [dict(meal) for meal in meal_list]
             
         except Error as e:
             st.error(f"Error getting meals: {e}")
             return []
     
+    def iter_meal_export_rows(self, user_id, start_date=None, end_date=None, chunk_size=1000):
+        """Stream a user's meals joined with their items, chunk by chunk
+        
+        Yields lists of up to chunk_size rows in EXPORT_COLUMNS order, read
+        through an unbuffered (server-side) cursor so memory stays flat no
+        matter how much history the user has. Meals without items yield one
+        row with empty item columns. Raises on database errors.
+        """
+        filters = ["m.user_id = %s"]
+        params = [user_id]
+        if start_date is not None:
+            filters.append("m.meal_date >= %s")
+            params.append(start_date)
+        if end_date is not None:
+            filters.append("m.meal_date <= %s")
+            params.append(end_date)
+        
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor(buffered=False)
+            cursor.execute(f"""
+                SELECT m.id, m.meal_date, m.meal_time, m.meal_type, m.image_name,
+                       m.total_calories, m.total_protein, m.total_carbs, m.total_fat,
+                       m.total_sugar, m.total_fiber,
+                       i.item_name, i.calories, i.protein, i.carbs, i.fat, i.sugar, i.fiber
+                FROM meals m
+                LEFT JOIN meal_items i ON i.meal_id = m.id
+                WHERE {' AND '.join(filters)}
+                ORDER BY m.meal_date, m.meal_time, m.id, i.id
+            """, tuple(params))
+            
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+            
+            cursor.close()
+        finally:
+            connection.close()
+    
+    def get_meal_analysis(self, user_id, meal_id):
+        """Get the full AI analysis text for a single meal"""
+        try:
+            connection = self.get_connection()
+            if connection is None:
+                return None
+            
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT ai_analysis
+                FROM meals
+                WHERE id = %s AND user_id = %s
+            """, (meal_id, user_id))
+            
+            result = cursor.fetchone()
+            cursor.close()
+            connection.close()
+            
+            return result[0] if result else None
+            
+        except Error as e:
+            st.error(f"Error getting meal analysis: {e}")
+            return None
+    
+    def get_image_hashes(self, user_id, after_id=0):
+        """Return (meal_id, image_phash, meal_date, meal_type) for hashed meals after after_id
+        
+        Raises on database errors.
+        """
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT id, image_phash, meal_date, meal_type
+                FROM meals
+                WHERE user_id = %s AND id > %s AND image_phash IS NOT NULL
+            """, (user_id, after_id))
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        finally:
+            connection.close()
+    
+    def get_meal_for_reuse(self, user_id, meal_id):
+        """Return a stored meal as a save_meals() dict (without date and time), or None"""
+        try:
+            connection = self.get_connection()
+            if connection is None:
+                return None
+            
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT meal_type, image_name, ai_analysis, image_phash,
+                       total_calories, total_protein, total_carbs,
+                       total_fat, total_sugar, total_fiber, image_sha256
+                FROM meals
+                WHERE id = %s AND user_id = %s
+            """, (meal_id, user_id))
+            meal = cursor.fetchone()
+            
+            if meal is None:
+                cursor.close()
+                connection.close()
+                return None
+            
+            cursor.execute("""
+                SELECT item_name, calories, protein, carbs, fat, sugar, fiber, food_id
+                FROM meal_items
+                WHERE meal_id = %s
+                ORDER BY id
+            """, (meal_id,))
+            items = cursor.fetchall()
+            cursor.close()
+            connection.close()
+            
+            nutrition_data = {
+                key: float(value or 0) for key, value in zip((
+                    'total_calories', 'total_protein', 'total_carbs',
+                    'total_fat', 'total_sugar', 'total_fiber'
+                ), meal[4:10])
+            }
+            nutrition_data['items'] = [
+                dict(zip(('calories', 'protein', 'carbs', 'fat', 'sugar', 'fiber'),
+                         (float(value or 0) for value in item[1:7])), name=item[0], food_id=item[7])
+                for item in items
+            ]
+            return {
+                'user_id': user_id,
+                'meal_type': meal[0],
+                'image_name': meal[1],
+                'ai_analysis': meal[2],
+                'image_phash': meal[3],
+                'image_sha256': meal[10],
+                'nutrition_data': nutrition_data
+            }
+            
+        except Error as e:
+            st.error(f"Error loading meal: {e}")
+            return None
+    
+    def get_cached_analysis(self, cache_key):
+        """Return (ai_analysis, nutrition_data) stored under cache_key, or None
+        
+        Marks the entry as recently used. Raises on database errors.
+        """
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                "SELECT ai_analysis, nutrition_json FROM analysis_cache WHERE cache_key = %s",
+                (cache_key,)
+            )
+            rows = cursor.fetchall()
+            
+            if rows:
+                cursor.execute(
+                    "UPDATE analysis_cache SET last_used_at = %s WHERE cache_key = %s",
+                    (datetime.now(), cache_key)
+                )
+                connection.commit()
+            cursor.close()
+            
+            if not rows:
+                return None
+            return rows[0][0], json.loads(rows[0][1])
+        finally:
+            connection.close()
+    
+    def store_cached_analysis(self, cache_key, model_id, ai_analysis, nutrition_data, max_entries):
+        """Store an AI response and evict the least recently used entries beyond max_entries
+        
+        Returns the number of evicted entries. Raises on database errors.
+        """
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                self.backend.upsert_sql(
+                    'analysis_cache', ['cache_key'],
+                    ['model_id', 'ai_analysis', 'nutrition_json', 'last_used_at']
+                ),
+                (cache_key, model_id, ai_analysis, json.dumps(nutrition_data), datetime.now())
+            )
+            
+            # Evict by key so entries sharing a last_used_at are not over-deleted
+            cursor.execute("SELECT COUNT(*) FROM analysis_cache")
+            excess = cursor.fetchone()[0] - max_entries
+            evicted = 0
+            if excess > 0:
+                cursor.execute(
+                    "SELECT cache_key FROM analysis_cache WHERE cache_key <> %s "
+                    "ORDER BY last_used_at, cache_key LIMIT %s",
+                    (cache_key, excess)
+                )
+                keys = [row[0] for row in cursor.fetchall()]
+                if keys:
+                    cursor.execute(
+                        f"DELETE FROM analysis_cache WHERE cache_key IN ({', '.join(['%s'] * len(keys))})",
+                        keys
+                    )
+                    evicted = cursor.rowcount
+            
+            connection.commit()
+            cursor.close()
+            return evicted
+        finally:
+            connection.close()
+    
+    def create_analysis_job(self, job):
+        """Queue a background analysis and return the job id
+        
+        job is a dict with user_id, meal_type, meal_date, meal_time,
+        user_prompt, image_name, image_mime, image_data, image_phash and
+        image_source_bytes (size before preprocessing). Raises on database errors.
+        """
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""
+                INSERT INTO analysis_jobs (user_id, meal_type, meal_date, meal_time, user_prompt,
+                                           image_name, image_mime, image_data, image_phash,
+                                           image_source_bytes)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (job['user_id'], job['meal_type'], job['meal_date'], job['meal_time'], job['user_prompt'],
+                  job['image_name'], job['image_mime'], job['image_data'], job['image_phash'],
+                  job.get('image_source_bytes')))
+            job_id = cursor.lastrowid
+            
+            connection.commit()
+            cursor.close()
+            return job_id
+        finally:
+            connection.close()
+    
+    def claim_analysis_job(self, job_id):
+        """Mark a queued job as running and return it with the owner's API key
+        
+        Returns None if the job is gone or another worker already claimed it.
+        Raises on database errors.
+        """
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                "UPDATE analysis_jobs SET status = 'running', started_at = %s WHERE id = %s AND status = 'queued'",
+                (datetime.now(), job_id)
+            )
+            if cursor.rowcount != 1:
+                connection.commit()
+                cursor.close()
+                return None
+            
+            cursor.execute("""
+                SELECT j.user_id, j.meal_type, j.meal_date, j.meal_time, j.user_prompt,
+                       j.image_name, j.image_mime, j.image_data, j.image_phash, j.image_source_bytes,
+                       u.gemini_api_key
+                FROM analysis_jobs j
+                JOIN users u ON u.id = j.user_id
+                WHERE j.id = %s
+            """, (job_id,))
+            row = cursor.fetchone()
+            connection.commit()
+            cursor.close()
+            
+            if row is None:
+                return None
+            return dict(zip((
+                'user_id', 'meal_type', 'meal_date', 'meal_time', 'user_prompt',
+                'image_name', 'image_mime', 'image_data', 'image_phash', 'image_source_bytes',
+                'gemini_api_key'
+            ), row), id=job_id)
+        finally:
+            connection.close()
+    
+    def complete_analysis_job(self, job_id, meal):
+        """Save the job's meal and mark the job done in one transaction
+        
+        meal is a save_meals() dict. Returns the new meal id. Raises on
+        database errors, in which case neither the meal nor the job changes.
+        """
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor()
+            meal_id = self._write_meals(cursor, [meal])[0]
+            cursor.execute("""
+                UPDATE analysis_jobs
+                SET status = 'done', meal_id = %s, ai_analysis = %s, image_data = NULL, finished_at = %s
+                WHERE id = %s
+            """, (meal_id, meal['ai_analysis'], datetime.now(), job_id))
+            
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+        
+        self._invalidate_meal_days([meal])
+        return meal_id
+    
+    def fail_analysis_job(self, job_id, error):
+        """Mark a job as failed with the given message. Raises on database errors."""
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""
+                UPDATE analysis_jobs
+                SET status = 'failed', error = %s, image_data = NULL, finished_at = %s
+                WHERE id = %s
+            """, (str(error)[:2000], datetime.now(), job_id))
+            
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+    
+    def requeue_analysis_jobs(self):
+        """Return ids of every queued job, first resetting jobs left running by a dead process
+        
+        Raises on database errors.
+        """
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("UPDATE analysis_jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+            cursor.execute("SELECT id FROM analysis_jobs WHERE status = 'queued' ORDER BY id")
+            job_ids = [row[0] for row in cursor.fetchall()]
+            
+            connection.commit()
+            cursor.close()
+            return job_ids
+        finally:
+            connection.close()
+    
+    def get_analysis_jobs(self, user_id, limit=20):
+        """Return the user's jobs that have not been dismissed, newest first (None on failure)"""
+        try:
+            connection = self.get_connection()
+            if connection is None:
+                return None
+            
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT j.id, j.status, j.meal_type, j.meal_date, j.meal_time, j.image_name,
+                       j.meal_id, j.ai_analysis, j.error, m.total_calories
+                FROM analysis_jobs j
+                LEFT JOIN meals m ON m.id = j.meal_id
+                WHERE j.user_id = %s AND j.dismissed = %s
+                ORDER BY j.id DESC
+                LIMIT %s
+            """, (user_id, False, limit))
+            rows = cursor.fetchall()
+            cursor.close()
+            connection.close()
+            
+            return [
+                dict(zip((
+                    'id', 'status', 'meal_type', 'meal_date', 'meal_time', 'image_name',
+                    'meal_id', 'ai_analysis', 'error', 'total_calories'
+                ), row))
+                for row in rows
+            ]
+            
+        except Error as e:
+            st.error(f"Error loading analysis jobs: {e}")
+            return None
+    
+    def dismiss_analysis_jobs(self, user_id, job_ids):
+        """Hide finished jobs from the user's job list"""
+        if not job_ids:
+            return True
+        try:
+            connection = self.get_connection()
+            if connection is None:
+                return False
+            
+            cursor = connection.cursor()
+            cursor.executemany(
+                "UPDATE analysis_jobs SET dismissed = %s WHERE id = %s AND user_id = %s AND status IN ('done', 'failed')",
+                [(True, job_id, user_id) for job_id in job_ids]
+            )
+            
+            connection.commit()
+            cursor.close()
+            connection.close()
+            return True
+            
+        except Error as e:
+            st.error(f"Error updating analysis jobs: {e}")
+            return False
+    
+    def insert_ai_telemetry(self, entries):
+        """Append AI request telemetry rows (dicts keyed by TELEMETRY_COLUMNS)
+        
+        Raises on database errors.
+        """
+        if not entries:
+            return
+        
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.executemany(f"""
+                INSERT INTO ai_telemetry ({', '.join(TELEMETRY_COLUMNS)})
+                VALUES ({', '.join(['%s'] * len(TELEMETRY_COLUMNS))})
+            """, [tuple(entry.get(column) for column in TELEMETRY_COLUMNS) for entry in entries])
+            
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+    
+    def prune_ai_telemetry(self, before):
+        """Delete telemetry recorded before the given datetime and return the row count
+        
+        Raises on database errors.
+        """
+        connection = self.backend.get_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("DELETE FROM ai_telemetry WHERE created_at < %s", (before,))
+            deleted = cursor.rowcount
+            
+            connection.commit()
+            cursor.close()
+            return deleted
+        finally:
+            connection.close()
+    
+    def get_ai_telemetry(self, since):
+        """Return telemetry rows recorded since the given datetime, oldest first (None on failure)"""
+        try:
+            connection = self.get_connection()
+            if connection is None:
+                return None
+            
+            cursor = connection.cursor()
+            cursor.execute(f"""
+                SELECT {', '.join(TELEMETRY_COLUMNS)}
+                FROM ai_telemetry
+                WHERE created_at >= %s
+                ORDER BY created_at
+            """, (since,))
+            rows = cursor.fetchall()
+            cursor.close()
+            connection.close()
+            
+            return [dict(zip(TELEMETRY_COLUMNS, row)) for row in rows]
+            
+        except Error as e:
+            st.error(f"Error loading AI telemetry: {e}")
+            return None
+    
+    def update_api_key(self, user_id, gemini_api_key):
+        """Update the Gemini API key stored for a user"""
+        try:
+            connection = self.get_connection()
+            if connection is None:
+                return False
+            
+            cursor = connection.cursor()
+            cursor.execute(
+                "UPDATE users SET gemini_api_key = %s WHERE id = %s",
+                (gemini_api_key, user_id)
+            )
+            
+            connection.commit()
+            cursor.close()
+            connection.close()
+            return True
+            
+        except Error as e:
+            st.error(f"Error updating API key: {e}")
+            return False
+    
     def update_user_goals(self, user_id, calorie_goal, protein_goal, carb_goal, fat_goal):
         """Update user's daily nutrition goals"""
         try:
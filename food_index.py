@@ -0,0 +1,243 @@
+"""
+Local food composition table with a fuzzy food-name index
+
+data/foods.csv is a USDA-style table of common foods: nutrients per 100 g,
+aliases separated by '|', and one typical serving. FoodIndex loads it into
+memory and resolves free-text item names ("Grilled chicken breast",
+"brocoli", "bowl of greek yogurt with honey") to canonical foods:
+
+1. exact match of the normalized name or an alias
+2. the longest known food named inside the phrase, clause by clause
+3. trigram similarity for misspellings (FOOD_MATCH_THRESHOLD)
+
+A character trie over every name and alias serves prefix completion. All
+lookups are in-memory and take well under a millisecond, so meals consult
+the index on every save. Point FOOD_DATA_PATH at another CSV with the same
+columns to use a different table (relative paths are resolved against this
+directory), or set it to 'off' to disable matching.
+"""
+
+import csv
+import os
+import re
+import unicodedata
+from collections import defaultdict
+
+from nutrition_parser import NUTRIENTS
+
+_MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FOOD_DATA_PATH = os.getenv('FOOD_DATA_PATH', os.path.join(_MODULE_DIR, 'data', 'foods.csv'))
+FOOD_MATCH_THRESHOLD = float(os.getenv('FOOD_MATCH_THRESHOLD', '0.6'))
+# Lowest lookup() score at which a saved meal item is linked to a food
+FOOD_LINK_MIN_SCORE = float(os.getenv('FOOD_LINK_MIN_SCORE', '0.72'))
+
+# Words that never change which food is meant
+_FILLER = frozenset((
+    'a', 'an', 'the', 'some', 'fresh', 'homemade', 'organic', 'plain', 'cooked',
+    'large', 'small', 'medium', 'big', 'little', 'serving', 'portion', 'bowl', 'plate',
+))
+# Connectors that separate the main food from its sides or toppings
+_CONNECTORS = frozenset(('with', 'and', 'on', 'in', 'of', 'plus', 'topped', 'over'))
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def _singular(word):
+    if len(word) <= 3 or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'ches', 'shes', 'xes')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def normalize_name(text):
+    """Lowercase, strip accents and punctuation, and singularize each word"""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+    return ' '.join(_singular(word) for word in _NON_WORD.split(text) if word and word not in _FILLER)
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+class Food:
+    """One canonical food with nutrients per gram"""
+
+    __slots__ = ('id', 'name', 'category', 'per_gram', 'serving', 'serving_grams')
+
+    def __init__(self, id, name, category, per_gram, serving, serving_grams):
+        self.id = id
+        self.name = name
+        self.category = category
+        self.per_gram = per_gram  # tuple in NUTRIENTS order
+        self.serving = serving
+        self.serving_grams = serving_grams
+
+    def nutrients(self, grams):
+        """Nutrients for the given weight, keyed like nutrition_parser.NUTRIENTS"""
+        return {nutrient: round(value * grams, 1) for nutrient, value in zip(NUTRIENTS, self.per_gram)}
+
+    def __repr__(self):
+        return f"Food({self.id}, {self.name!r})"
+
+
+class FoodIndex:
+    """Exact, phrase, prefix and trigram lookups over a food table"""
+
+    def __init__(self, foods, threshold=FOOD_MATCH_THRESHOLD):
+        self.foods = {}
+        self.threshold = threshold
+        self._keys = []          # normalized names and aliases
+        self._key_foods = []     # food for each key
+        self._key_trigrams = []  # trigram count of each key
+        self._exact = {}         # key -> food
+        self._trigrams = defaultdict(list)  # trigram -> key indexes
+        self._trie = {}
+        self._longest = 1        # words in the longest key
+
+        for food, names in foods:
+            self.foods[food.id] = food
+            for name in names:
+                key = normalize_name(name)
+                if not key or key in self._exact:
+                    continue
+                self._add_key(key, food)
+
+    @classmethod
+    def from_csv(cls, path, threshold=FOOD_MATCH_THRESHOLD):
+        """Load a table with the columns of data/foods.csv"""
+        foods = []
+        with open(path, newline='', encoding='utf-8') as handle:
+            for row in csv.DictReader(handle):
+                food = Food(
+                    int(row['id']),
+                    row['name'],
+                    row['category'],
+                    tuple(float(row[nutrient]) / 100 for nutrient in NUTRIENTS),
+                    row['serving'] or None,
+                    float(row['serving_grams']) if row['serving_grams'] else None,
+                )
+                aliases = [alias for alias in row['aliases'].split('|') if alias]
+                foods.append((food, [row['name']] + aliases))
+        return cls(foods, threshold)
+
+    def _add_key(self, key, food):
+        index = len(self._keys)
+        self._keys.append(key)
+        self._key_foods.append(food)
+        self._exact[key] = food
+        self._longest = max(self._longest, key.count(' ') + 1)
+        trigrams = _trigrams(key)
+        self._key_trigrams.append(len(trigrams))
+        for trigram in trigrams:
+            self._trigrams[trigram].append(index)
+
+        # Index every word start so "breast" completes to "chicken breast"
+        starts = [0] + [match.end() for match in re.finditer(' ', key)]
+        for start in starts:
+            node = self._trie
+            for char in key[start:]:
+                node = node.setdefault(char, {})
+            node.setdefault('', []).append(index)
+
+    def __len__(self):
+        return len(self.foods)
+
+    def get(self, food_id):
+        return self.foods.get(food_id)
+
+    def lookup(self, name):
+        """Return (food, score) for the best match of a free-text name, or None
+
+        score is 1.0 for exact matches, lower for partial or fuzzy ones: a
+        phrase match scores by how much of its clause the food covers, so
+        "chicken breast with rice" scores 0.9 but "banana bread" only 0.7.
+        """
+        key = normalize_name(name or '')
+        if not key:
+            return None
+        food = self._exact.get(key)
+        if food is not None:
+            return food, 1.0
+        return self._phrase_match(key) or self._fuzzy_match(key)
+
+    def _phrase_match(self, key):
+        """Longest known food inside the phrase, preferring the first clause"""
+        words = key.split()
+        clauses = [[]]
+        for word in words:
+            if word in _CONNECTORS:
+                clauses.append([])
+            else:
+                clauses[-1].append(word)
+
+        for clause in clauses:
+            # Longest span first; among equal spans the rightmost is the head noun
+            for size in range(min(len(clause), self._longest), 0, -1):
+                for start in range(len(clause) - size, -1, -1):
+                    food = self._exact.get(' '.join(clause[start:start + size]))
+                    if food is not None:
+                        return food, 0.5 + 0.4 * size / len(clause)
+        return None
+
+    def _fuzzy_match(self, key):
+        """Best Dice coefficient over trigrams, if it clears the threshold"""
+        trigrams = _trigrams(key)
+        shared = defaultdict(int)
+        for trigram in trigrams:
+            for index in self._trigrams.get(trigram, ()):
+                shared[index] += 1
+        if not shared:
+            return None
+
+        best_index, best_score = None, 0.0
+        for index, count in shared.items():
+            score = 2 * count / (len(trigrams) + self._key_trigrams[index])
+            if score > best_score:
+                best_index, best_score = index, score
+        if best_score < self.threshold:
+            return None
+        return self._key_foods[best_index], round(best_score * 0.9, 3)
+
+    def complete(self, prefix, limit=10):
+        """Foods with a name or alias word starting with prefix, shortest names first"""
+        node = self._trie
+        for char in normalize_name(prefix or ''):
+            node = node.get(char)
+            if node is None:
+                return []
+
+        indexes = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            for char, child in current.items():
+                if char == '':
+                    indexes.extend(child)
+                else:
+                    stack.append(child)
+
+        foods = []
+        for index in sorted(set(indexes), key=lambda index: len(self._keys[index])):
+            food = self._key_foods[index]
+            if food not in foods:
+                foods.append(food)
+                if len(foods) == limit:
+                    break
+        return foods
+
+
+def create_food_index(path=FOOD_DATA_PATH):
+    """Load the table at FOOD_DATA_PATH, or return None when set to 'off'"""
+    if not path or path.lower() == 'off':
+        return None
+    return FoodIndex.from_csv(os.path.join(_MODULE_DIR, path))
+
+
+# Global index shared by every page in the process
+food_index = create_food_index()
@@ -0,0 +1,110 @@
+"""
+Image preprocessing before upload to an AI provider
+
+Phone photos are usually several megabytes, far more detail than a vision
+model uses. Images are rotated according to their EXIF orientation, scaled
+down so the longest side is at most IMAGE_MAX_DIMENSION pixels, and
+re-encoded as JPEG or WebP at IMAGE_QUALITY without any metadata (GPS,
+camera, timestamps).
+"""
+
+import io
+import os
+from datetime import datetime
+
+from PIL import Image, ImageOps
+
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', '1568'))
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '85'))
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'jpeg').lower()
+
+# EXIF tags holding the capture time
+EXIF_IFD = 0x8769
+DATETIME_ORIGINAL = 0x9003
+DATETIME = 0x0132
+
+# format -> (Pillow format name, mime type)
+OUTPUT_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+
+def _flatten(image, pil_format):
+    """Convert to a mode the output format can encode"""
+    if pil_format == 'WEBP' and image.mode in ('RGB', 'RGBA'):
+        return image
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        # JPEG has no alpha channel; composite transparent areas onto white
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def preprocess_image(data, max_dimension=None, quality=None, image_format=None):
+    """Downscale, re-orient and re-encode raw image bytes
+
+    Returns (bytes, mime type, stats) where stats holds the original and
+    processed byte counts and pixel sizes. Raises ValueError if the bytes
+    are not an image Pillow can read.
+    """
+    max_dimension = max_dimension or IMAGE_MAX_DIMENSION
+    quality = quality or IMAGE_QUALITY
+    image_format = (image_format or IMAGE_FORMAT).lower()
+    if image_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported IMAGE_FORMAT '{image_format}'. Choose one of: {', '.join(OUTPUT_FORMATS)}")
+    pil_format, mime_type = OUTPUT_FORMATS[image_format]
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Could not read image: {e}")
+
+    original_dimensions = image.size
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    image = _flatten(image, pil_format)
+
+    out = io.BytesIO()
+    # Saving without exif=/icc_profile= drops all metadata from the original
+    image.save(out, format=pil_format, quality=quality, optimize=True)
+    processed = out.getvalue()
+
+    stats = {
+        'original_bytes': len(data),
+        'processed_bytes': len(processed),
+        'original_dimensions': original_dimensions,
+        'processed_dimensions': image.size,
+    }
+    return processed, mime_type, stats
+
+
+def describe_reduction(stats):
+    """One-line, human readable summary of a preprocess_image() result"""
+    original = stats['original_bytes']
+    processed = stats['processed_bytes']
+    saved = 1 - processed / original if original else 0.0
+    width, height = stats['processed_dimensions']
+    change = f"{saved:.0%} smaller" if saved > 0 else "no reduction"
+    return (
+        f"Image {original / 1024:,.0f} KB → {processed / 1024:,.0f} KB "
+        f"({change}, {width}×{height})"
+    )
+
+
+def photo_taken_at(data):
+    """Capture time from the photo's EXIF data, or None if it has none"""
+    try:
+        exif = Image.open(io.BytesIO(data)).getexif()
+    except OSError:
+        return None
+    value = exif.get_ifd(EXIF_IFD).get(DATETIME_ORIGINAL) or exif.get(DATETIME)
+    try:
+        return datetime.strptime(str(value).strip(), '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        return None
@@ -0,0 +1,158 @@
+"""
+Near-duplicate detection for meal photos
+
+Every analyzed photo gets a 64-bit difference hash (dHash), which changes
+only a few bits under different lighting, compression or slight reframing.
+Each user's hashes are kept in an in-process multi-index hash table: the
+hash is split into four 16-bit blocks, and by the pigeonhole principle any
+hash within distance d of the query matches at least one block within
+d // 4 bits, so only a few hundred candidates are ever compared even with
+tens of thousands of photos.
+"""
+
+import io
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from PIL import Image, ImageOps
+
+from database import db_manager
+
+PHASH_MAX_DISTANCE = int(os.getenv('PHASH_MAX_DISTANCE', '8'))
+PHASH_INDEX_USERS = int(os.getenv('PHASH_INDEX_USERS', '256'))
+
+HASH_BITS = 64
+BLOCKS = 4
+BLOCK_BITS = HASH_BITS // BLOCKS
+BLOCK_MASK = (1 << BLOCK_BITS) - 1
+
+
+def dhash(data, hash_size=8):
+    """Return the 64-bit difference hash of raw image bytes"""
+    image = Image.open(io.BytesIO(data))
+    # Let the JPEG decoder downscale while decoding; far cheaper than a full decode
+    image.draft('L', (hash_size * 8, hash_size * 8))
+    image = ImageOps.exif_transpose(image).convert('L')
+    image = image.resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+
+    pixels = image.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            value = (value << 1) | (pixels[offset + column] < pixels[offset + column + 1])
+    return value
+
+
+def to_db(value):
+    """Map an unsigned 64-bit hash onto a signed BIGINT"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def from_db(value):
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(radius):
+    """All BLOCK_BITS-bit masks with at most radius bits set"""
+    masks = []
+    for bits in range(radius + 1):
+        for positions in itertools.combinations(range(BLOCK_BITS), bits):
+            masks.append(sum(1 << position for position in positions))
+    return tuple(masks)
+
+
+class HashIndex:
+    """Multi-index hash table of 64-bit hashes for Hamming-radius search"""
+
+    def __init__(self):
+        self._entries = []
+        self._blocks = [{} for _ in range(BLOCKS)]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, value, payload):
+        position = len(self._entries)
+        self._entries.append((value, payload))
+        for block, table in enumerate(self._blocks):
+            table.setdefault((value >> (block * BLOCK_BITS)) & BLOCK_MASK, []).append(position)
+
+    def search(self, value, max_distance):
+        """Return [(distance, payload)] for every hash within max_distance"""
+        seen = set()
+        matches = []
+        masks = _flip_masks(max_distance // BLOCKS)
+        for block, table in enumerate(self._blocks):
+            key = (value >> (block * BLOCK_BITS)) & BLOCK_MASK
+            for mask in masks:
+                for position in table.get(key ^ mask, ()):
+                    if position in seen:
+                        continue
+                    seen.add(position)
+                    stored, payload = self._entries[position]
+                    distance = bin(stored ^ value).count('1')
+                    if distance <= max_distance:
+                        matches.append((distance, payload))
+        return matches
+
+
+class SimilarMealIndex:
+    """Per-user HashIndex of previously analyzed meal photos
+
+    A user's index is loaded from the database on first use and then topped
+    up with newer meals whenever the query cache reports a write for that
+    user. Deleted meals may linger in the index, so callers re-check the
+    meal before using a match.
+    """
+
+    def __init__(self, max_users=PHASH_INDEX_USERS):
+        self.max_users = max_users
+        self._users = OrderedDict()  # user_id -> (generation, last meal id, HashIndex)
+        self._lock = threading.Lock()
+
+    def _index_for(self, user_id):
+        generation = db_manager.cache.generation(user_id)
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is not None:
+                self._users.move_to_end(user_id)
+                if state[0] == generation:
+                    return state[2]
+
+        _, last_id, index = state if state is not None else (None, 0, HashIndex())
+        rows = db_manager.get_image_hashes(user_id, after_id=last_id)
+        with self._lock:
+            current = self._users.get(user_id)
+            if current is not None:
+                if current[2] is not index:
+                    return current[2]
+                # Another thread may have topped up the same index meanwhile
+                last_id = current[1]
+            newest = last_id
+            for meal_id, image_phash, meal_date, meal_type in rows:
+                if meal_id > last_id:
+                    index.add(from_db(image_phash), (meal_id, meal_date, meal_type))
+                    newest = max(newest, meal_id)
+            self._users[user_id] = (generation, newest, index)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return index
+
+    def find_similar(self, user_id, value, max_distance=PHASH_MAX_DISTANCE):
+        """Return [(distance, meal_id, meal_date, meal_type)], nearest and newest first"""
+        index = self._index_for(user_id)
+        with self._lock:
+            matches = index.search(value, max_distance)
+        matches = [(distance,) + payload for distance, payload in matches]
+        matches.sort(key=lambda match: (match[0], -match[1]))
+        return matches
+
+
+# Global index instance
+similar_meal_index = SimilarMealIndex()
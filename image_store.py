@@ -0,0 +1,159 @@
+"""
+Content-addressed on-disk store for meal photos and their thumbnails
+
+Each photo is saved under the SHA-256 of its bytes, sharded by the first two
+byte pairs of the digest (ab/cd/abcd...), so identical uploads share one
+file and no directory grows too large. The store keeps the preprocessed
+photo that was sent to the AI (already downscaled by image_processing, so
+it can be re-analyzed later) and a small WebP thumbnail generated at save
+time; pages only ever read thumbnails.
+
+Configure with IMAGE_STORE_PATH ('off' disables storing photos),
+IMAGE_THUMBNAIL_SIZE and IMAGE_THUMBNAIL_QUALITY. Files no meal refers to
+any more are removed by `python manage.py prune-images`.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+
+from image_processing import preprocess_image
+
+IMAGE_STORE_PATH = os.getenv('IMAGE_STORE_PATH', 'meal_images')
+IMAGE_THUMBNAIL_SIZE = int(os.getenv('IMAGE_THUMBNAIL_SIZE', '320'))
+IMAGE_THUMBNAIL_QUALITY = int(os.getenv('IMAGE_THUMBNAIL_QUALITY', '70'))
+
+THUMBNAIL_SUFFIX = '.thumb.webp'
+_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+
+class ImageStore:
+    """Photos and WebP thumbnails addressed by SHA-256"""
+
+    def __init__(self, root=IMAGE_STORE_PATH, thumbnail_size=IMAGE_THUMBNAIL_SIZE,
+                 thumbnail_quality=IMAGE_THUMBNAIL_QUALITY):
+        self.root = root
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_quality = thumbnail_quality
+        self._lock = threading.Lock()
+        self._stats = {'stored': 0, 'deduplicated': 0, 'thumbnail_reads': 0, 'errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def path(self, digest, suffix=''):
+        """Sharded path of a photo (or, with THUMBNAIL_SUFFIX, its thumbnail)"""
+        if not _DIGEST.match(digest or ''):
+            raise ValueError(f"invalid image digest: {digest!r}")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest + suffix)
+
+    def put(self, data):
+        """Store a photo and its thumbnail; return the digest, or None on failure
+
+        Storing the same bytes again only returns the existing digest.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        thumbnail_path = self.path(digest, THUMBNAIL_SUFFIX)
+        # The thumbnail is written last, so its presence means both files are complete
+        if os.path.exists(thumbnail_path):
+            try:
+                # A re-upload is as young as a new photo; keep prune() off it until its meal is saved
+                for path in (self.path(digest), thumbnail_path):
+                    os.utime(path)
+            except OSError:
+                pass  # pruned meanwhile; store it again below
+            else:
+                self._count('deduplicated')
+                return digest
+
+        try:
+            thumbnail, _, _ = preprocess_image(
+                data, max_dimension=self.thumbnail_size, quality=self.thumbnail_quality, image_format='webp'
+            )
+            os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+            _write_atomic(self.path(digest), data)
+            _write_atomic(thumbnail_path, thumbnail)
+        except (OSError, ValueError):
+            # Losing the photo must never lose the meal
+            self._count('errors')
+            return None
+        self._count('stored')
+        return digest
+
+    def read(self, digest):
+        """Bytes of the stored photo, or None if it is missing"""
+        try:
+            with open(self.path(digest), 'rb') as handle:
+                return handle.read()
+        except OSError:
+            return None
+
+    def read_thumbnail(self, digest):
+        """Bytes of a photo's thumbnail, or None if it is missing"""
+        try:
+            with open(self.path(digest, THUMBNAIL_SUFFIX), 'rb') as handle:
+                thumbnail = handle.read()
+        except (OSError, ValueError):
+            return None
+        self._count('thumbnail_reads')
+        return thumbnail
+
+    def digests(self):
+        """Yield (digest, modification time) for every stored photo"""
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if _DIGEST.match(name):
+                    yield name, os.path.getmtime(os.path.join(directory, name))
+
+    def prune(self, keep, min_age=3600):
+        """Delete photos and thumbnails whose digest is not in keep
+
+        Files younger than min_age seconds are left alone, since a photo is
+        stored just before its meal is saved. Returns the number of photos removed.
+        """
+        removed = 0
+        cutoff = time.time() - min_age
+        for digest, modified in list(self.digests()):
+            if digest in keep or modified > cutoff:
+                continue
+            for suffix in ('', THUMBNAIL_SUFFIX):
+                try:
+                    os.remove(self.path(digest, suffix))
+                except FileNotFoundError:
+                    pass
+            removed += 1
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def _write_atomic(path, data):
+    """Write a file under a temporary name and rename it into place"""
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            output.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        raise
+
+
+def create_image_store(path=IMAGE_STORE_PATH):
+    """Open the store at IMAGE_STORE_PATH, or return None when set to 'off'"""
+    if not path or path.lower() == 'off':
+        return None
+    return ImageStore(path)
+
+
+# Global store shared by every page in the process
+image_store = create_image_store()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Load generator for the analyze-and-save flow
+
+Runs N concurrent simulated users, each repeating one flow, and reports
+throughput and p50/p95/p99 latency per step. Pair it with mock_ai_server so
+no real quota is spent (--mock starts one in-process).
+
+    python loadtest.py app   --users 20 --iterations 10 --mock
+    python loadtest.py flask --users 20 --duration 60 --base-url http://127.0.0.1:5001
+
+app   drives the dashboard code in-process: preprocess, AI analysis through
+      ai_engine (rate limiter, streaming, analysis cache), parse, save the
+      meal and reload the day's totals. Users are created as loadtest-N in
+      the configured database, so point DB_BACKEND/SQLITE_PATH at a scratch
+      database.
+flask drives the prototype in test/main.py over HTTP: sign up, log in,
+      /analyze-meal, log the meal and /get-suggestion. Start it with
+      GEMINI_API_BASE set to the mock server.
+"""
+
+import argparse
+import base64
+import io
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from ai_metrics import percentile
+
+
+class Results:
+    """Thread-safe step timings and error counts"""
+
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.flows = 0
+        self.lock = threading.Lock()
+
+    def record(self, step, seconds):
+        with self.lock:
+            self.timings[step].append(seconds)
+
+    def fail(self, step, error):
+        with self.lock:
+            self.errors[f"{step}: {type(error).__name__}: {str(error)[:80]}"] += 1
+
+    def flow_done(self):
+        with self.lock:
+            self.flows += 1
+
+
+def timed(results, step, function, *args):
+    """Call function(*args), recording its latency under step"""
+    started = time.perf_counter()
+    value = function(*args)
+    results.record(step, time.perf_counter() - started)
+    return value
+
+
+def make_photo(rng, size=(1024, 768)):
+    """A random JPEG so every request misses the analysis cache"""
+    image = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        image.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, x + 200, y + 150))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+# --- Scenarios ---
+
+class AppScenario:
+    """Dashboard flow, in-process against the configured database"""
+
+    def __init__(self, args):
+        # Imported here so --mock can set GEMINI_API_BASE first
+        from database import db_manager
+        from image_similarity import to_db
+        from pages.ai_calculator import analyze_photo
+        if not db_manager.ensure_schema():
+            raise SystemExit("Database schema is not ready; run 'python manage.py migrate'")
+        self.db = db_manager
+        self.analyze_photo = analyze_photo
+        self.to_db = to_db
+        self.same_photo = args.same_photo
+
+    def setup(self, index):
+        username = f"loadtest-{index}"
+        password = 'loadtest-password'
+        self.db.create_user(username, f"{username}@example.com", password, f"loadtest-key-{index}")
+        ok, user, message = self.db.authenticate_user(username, password)
+        if not ok:
+            raise RuntimeError(message)
+        return {'user': user, 'rng': random.Random(0 if self.same_photo else index)}
+
+    def run(self, state, results):
+        user = state['user']
+        photo = make_photo(state['rng'])
+        analysis = timed(results, 'analyze', self.analyze_photo, photo, '', user['gemini_api_key'])
+        if analysis['timing'] is not None:
+            results.record('ai ttfb', analysis['timing']['ttfb'] or analysis['timing']['total'])
+        image_phash = self.to_db(analysis['image_hash']) if analysis['image_hash'] is not None else None
+        saved = timed(results, 'save', self.db.save_meal_analysis, user['id'], 'lunch',
+                      analysis['ai_analysis'], analysis['nutrition_data'], 'loadtest.jpg', image_phash,
+                      analysis['image_sha256'])
+        if not saved:
+            raise RuntimeError("meal was not saved")
+        timed(results, 'daily totals', self.db.get_daily_nutrition, user['id'])
+
+
+class FlaskScenario:
+    """Prototype flow over HTTP against test/main.py"""
+
+    def __init__(self, args):
+        import requests
+        self.requests = requests
+        self.base_url = args.base_url.rstrip('/')
+        self.same_photo = args.same_photo
+
+    def _post(self, session, path, payload):
+        response = session.post(self.base_url + path, json=payload, timeout=120)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{path} returned HTTP {response.status_code}")
+        return response.json()
+
+    def setup(self, index):
+        session = self.requests.Session()
+        email = f"loadtest-{index}@example.com"
+        account = {'email': email, 'password': 'loadtest-password', 'name': f"Load test {index}",
+                   'apiKey': f"loadtest-key-{index}"}
+        response = session.post(self.base_url + '/signup', json=account, timeout=30)
+        if response.status_code not in (201, 409):
+            raise RuntimeError(f"/signup returned HTTP {response.status_code}")
+        self._post(session, '/login', {'email': email, 'password': account['password']})
+        return {'session': session, 'email': email, 'rng': random.Random(0 if self.same_photo else index)}
+
+    def run(self, state, results):
+        session, email = state['session'], state['email']
+        today = time.strftime('%Y-%m-%d')
+        photo = base64.b64encode(make_photo(state['rng'])).decode('ascii')
+        meal = timed(results, 'analyze', self._post, session, '/analyze-meal',
+                     {'email': email, 'image': photo, 'mimeType': 'image/jpeg'})
+        meal['totalMealCalories'] = meal.get('totalCalories', 0)
+        timed(results, 'save', self._post, session, f"/daily-log/{email}/{today}/meal", meal)
+        log = session.get(f"{self.base_url}/daily-log/{email}/{today}", timeout=30).json()
+        timed(results, 'suggestion', self._post, session, '/get-suggestion', {'email': email, 'log': log})
+
+
+SCENARIOS = {'app': AppScenario, 'flask': FlaskScenario}
+
+
+# --- Runner ---
+
+def simulate_user(scenario, index, args, results, stop_at):
+    try:
+        state = scenario.setup(index)
+    except Exception as e:
+        results.fail('setup', e)
+        return
+
+    iteration = 0
+    while (args.duration and time.monotonic() < stop_at) or (not args.duration and iteration < args.iterations):
+        iteration += 1
+        started = time.perf_counter()
+        try:
+            scenario.run(state, results)
+        except Exception as e:
+            results.fail('flow', e)
+        else:
+            results.record('flow', time.perf_counter() - started)
+            results.flow_done()
+        if args.think_time:
+            time.sleep(random.uniform(0, 2 * args.think_time))
+
+
+def report(results, elapsed, args):
+    print(f"\n{args.scenario}: {args.users} users, {elapsed:.1f}s")
+    print(f"Completed flows: {results.flows} ({results.flows / elapsed:.2f}/s)")
+    print(f"Failed flows:    {sum(results.errors.values())}")
+    print(f"\n{'step':<14}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for step, values in results.timings.items():
+        print(f"{step:<14}{len(values):>7}" + "".join(
+            f"{percentile(values, fraction):>8.2f}s" for fraction in (0.5, 0.95, 0.99)
+        ) + f"{max(values):>8.2f}s")
+    if results.errors:
+        print("\nErrors:")
+        for message, count in sorted(results.errors.items(), key=lambda item: -item[1]):
+            print(f"  {count:>5} x {message}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Load test the analyze-and-save flow")
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--users', type=int, default=10, help="concurrent simulated users")
+    parser.add_argument('--iterations', type=int, default=5, help="flows per user (ignored with --duration)")
+    parser.add_argument('--duration', type=float, help="run for this many seconds instead")
+    parser.add_argument('--ramp-up', type=float, default=0.0, help="seconds over which users start")
+    parser.add_argument('--think-time', type=float, default=0.0, help="mean pause between flows (seconds)")
+    parser.add_argument('--same-photo', action='store_true', help="reuse one photo to exercise the analysis cache")
+    parser.add_argument('--base-url', default='http://127.0.0.1:5001', help="Flask app URL (flask scenario)")
+    parser.add_argument('--mock', action='store_true',
+                        help="start mock_ai_server in-process and point the app scenario at it")
+    parser.add_argument('--mock-ttfb', default='lognormal:1.2,0.4', help="mock latency before the first chunk")
+    parser.add_argument('--mock-error-rate', type=float, default=0.0)
+    parser.add_argument('--mock-rate-limit-rate', type=float, default=0.0)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.mock:
+        import mock_ai_server
+        config = mock_ai_server.MockConfig(
+            mock_ai_server.parse_distribution(args.mock_ttfb),
+            mock_ai_server.parse_distribution('fixed:0.05'),
+            error_rate=args.mock_error_rate,
+            rate_limit_rate=args.mock_rate_limit_rate
+        )
+        _, base_url = mock_ai_server.start_in_background(config)
+        os.environ['GEMINI_API_BASE'] = f"{base_url}/v1beta"
+        os.environ['OPENAI_API_BASE'] = f"{base_url}/v1"
+        print(f"Mock AI server on {base_url}")
+
+    scenario = SCENARIOS[args.scenario](args)
+    results = Results()
+    started = time.monotonic()
+    stop_at = started + (args.duration or 0)
+
+    with ThreadPoolExecutor(max_workers=args.users, thread_name_prefix='loadtest') as pool:
+        for index in range(args.users):
+            pool.submit(simulate_user, scenario, index, args, results, stop_at)
+            if args.ramp_up and args.users > 1:
+                time.sleep(args.ramp_up / (args.users - 1))
+
+    report(results, time.monotonic() - started, args)
+    if args.mock:
+        print(f"Mock server: {config.snapshot()}")
+    return 1 if results.flows == 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,11 @@
 import streamlit as st
+from PIL import Image
+from streamlit_local_storage import LocalStorage
+
+from ai_engine import AIRequest
+from ai_metrics import describe_timing
+from ai_router import route_response
+from image_processing import describe_reduction, preprocess_image
 
 st.markdown("""
 # 🍽️ AI Calories Calculator - Dashboard Version
@@ -31,6 +38,35 @@ st.info("The dashboard version is now available in `app.py`. Run it to experienc
 
 st.markdown("---")
 st.subheader("Original Calculator (Legacy)")
+
+# --- Sidebar: provider, API key and model selection ---
+
+GEMINI_MODELS = [
+    ("gemini-2.5-pro", "gemini-2.5-pro"),
+    ("gemini-2.5-flash", "gemini-2.5-flash"),
+    ("gemini-1.5-pro-latest", "gemini-1.5-pro-latest"),
+    ("gemini-1.5-pro", "gemini-1.5-pro"),
+    ("gemini-1.0-pro", "gemini-1.0-pro")
+]
+
+OPENAI_MODELS = [
+    ("gpt-5", "gpt-5"),
+    ("gpt-4.1", "gpt-4.1"),
+    ("gpt-4o", "gpt-4o"),
+    ("gpt-4", "gpt-4"),
+    ("gpt-4-mini", "gpt-4-mini"),
+    ("gpt-3.5-turbo", "gpt-3.5-turbo")
+]
+
+# Providers whose models can back each other up with the same API key
+ROUTABLE_MODELS = {"Gemini": GEMINI_MODELS, "OpenAI": OPENAI_MODELS}
+
+with st.sidebar:
+    st.title("Settings")
+
+    try:
+        localS = LocalStorage()
+    except Exception:
         st.warning("Could not initialize browser storage. API key will not be saved.")
         localS = None
 
@@ -65,27 +101,14 @@ st.subheader("Original Calculator (Legacy)")
     if provider == "Gemini":
         model_choice = st.selectbox(
             "Gemini Model",
-            options=[
-                ("gemini-2.5-pro", "gemini-2.5-pro"),
-                ("gemini-2.5-flash", "gemini-2.5-flash"),
-                ("gemini-1.5-pro-latest", "gemini-1.5-pro-latest"),
-                ("gemini-1.5-pro", "gemini-1.5-pro"),
-                ("gemini-1.0-pro", "gemini-1.0-pro")
-            ],
+            options=GEMINI_MODELS,
             format_func=lambda x: x[1],
             key="model-gemini"
         )
     elif provider == "OpenAI":
         model_choice = st.selectbox(
             "OpenAI Model",
-            options=[
-                ("gpt-5", "gpt-5"),
-                ("gpt-4.1", "gpt-4.1"),
-                ("gpt-4o", "gpt-4o"),
-                ("gpt-4", "gpt-4"),
-                ("gpt-4-mini", "gpt-4-mini"),
-                ("gpt-3.5-turbo", "gpt-3.5-turbo")
-            ],
+            options=OPENAI_MODELS,
             format_func=lambda x: x[1],
             key="model-openai"
         )
@@ -125,6 +148,23 @@ st.subheader("Original Calculator (Legacy)")
             format_func=lambda x: x[1],
             key="model-claude"
         )
+
+    backup_models = []
+    if provider in ROUTABLE_MODELS:
+        hedging = st.toggle(
+            "Hedged routing",
+            key=f"routing-{provider.lower()}",
+            help="If the model is slow to start answering, also ask a backup model and keep whichever answers first. Errors fail over to the backups."
+        )
+        if hedging:
+            backup_options = [option for option in ROUTABLE_MODELS[provider] if option != model_choice]
+            backup_models = st.multiselect(
+                "Backup Models",
+                options=backup_options,
+                default=backup_options[:1],
+                format_func=lambda x: x[1],
+                key=f"backup-{provider.lower()}"
+            )
     st.markdown("""<hr style='margin:10px 0 10px 0;border:1px solid #eee;'>""", unsafe_allow_html=True)
 
     with st.expander("Learn More About Privacy"):
@@ -142,37 +182,14 @@ st.subheader("Original Calculator (Legacy)")
 if not api_key:
     st.warning(f"Please enter your {provider} API key in the sidebar.")
     st.stop()
-else:
-    if provider == "Gemini":
-        genai.configure(api_key=api_key)
-    # For OpenAI, configuration will be handled in the OpenAI logic
+# Provider clients are created and cached per key by ai_engine
 
 # --- Function Definitions ---
 
-def get_gemini_response(input_prompt, image_parts, user_prompt, model_id):
-    """
-    Calls the Gemini API to get a response based on an image and text prompts.
-    
-    Args:
-        input_prompt (str): The main system prompt for the model.
-        image_parts (list): A list containing the image data and mime type.
-        user_prompt (str): Additional text input from the user.
-        model_id (str): The ID of the model to use for the request.
-
-    Returns:
-        str: The text response from the Gemini model.
-    """
-    try:
-        model = genai.GenerativeModel(model_id)
-        response = model.generate_content([input_prompt, image_parts[0], user_prompt])
-        return response.text
-    except Exception as e:
-        st.error(f"An error occurred with the JThweb API: {e}")
-        return None
-
 def setup_image_data(uploaded_file_or_camera_input):
     """
     Processes an uploaded file or camera input into the format needed for the Gemini API.
+    The image is downscaled and re-encoded by image_processing.preprocess_image.
     
     Args:
         uploaded_file_or_camera_input: The file object from st.file_uploader or st.camera_input.
@@ -181,16 +198,19 @@ def setup_image_data(uploaded_file_or_camera_input):
         list: A list containing a dictionary with the image's mime type and byte data.
     """
     if uploaded_file_or_camera_input is not None:
-        # Read the file into bytes
-        bytes_data = uploaded_file_or_camera_input.getvalue()
-        
-        # Determine the mime type
-        mime_type = uploaded_file_or_camera_input.type if hasattr(uploaded_file_or_camera_input, 'type') else 'image/jpeg'
+        # Downscale, fix orientation and strip metadata before upload
+        try:
+            bytes_data, mime_type, stats = preprocess_image(uploaded_file_or_camera_input.getvalue())
+        except ValueError as e:
+            st.error(f"Could not process image: {e}")
+            return None
+        st.caption(describe_reduction(stats))
 
         image_parts = [
             {
                 "mime_type": mime_type,
-                "data": bytes_data
+                "data": bytes_data,
+                "source_bytes": stats['original_bytes']
             }
         ]
         return image_parts
@@ -198,54 +218,63 @@ def setup_image_data(uploaded_file_or_camera_input):
         # This case should ideally not be hit if the function is called correctly
         return None
 
-def get_openai_response(input_prompt, image_parts, user_prompt, model_id, api_key):
+def get_ai_response(provider, input_prompt, image_parts, user_prompt, model_ids, api_key, placeholder=None):
     """
-    Calls the OpenAI API to get a response based on an image and text prompts.
+    Calls the selected AI provider through ai_router and streams the answer
+    into the placeholder as it is generated. With more than one model the
+    later ones are hedges and failover backups for the first.
+    
     Args:
+        provider (str): Provider name as shown in the sidebar, e.g. "Gemini".
         input_prompt (str): The main system prompt for the model.
-        image_parts (list): A list containing the image data and mime type (for vision models).
+        image_parts (list): A list containing the image data and mime type.
         user_prompt (str): Additional text input from the user.
-        model_id (str): The OpenAI model name.
-        api_key (str): The OpenAI API key.
+        model_ids (list): Model IDs to use, the preferred model first.
+        api_key (str): The provider API key.
+        placeholder: Optional st.empty() element for incremental rendering.
+
     Returns:
-        str: The text response from the OpenAI model.
+        str: The text response from the model.
     """
+    requests = [
+        AIRequest(
+            provider.lower(),
+            model_id,
+            api_key,
+            input_prompt + "\n" + user_prompt,
+            images=image_parts,
+            max_tokens=2048 if provider == "OpenAI" else None
+        )
+        for model_id in model_ids
+    ]
+    chunks = []
+
+    def restart(request):
+        # A backup took over; drop any partial answer from the failed model
+        chunks.clear()
+
+    def show_progress(fragment):
+        chunks.append(fragment)
+        if placeholder is not None:
+            placeholder.markdown("".join(chunks) + " ▌")
+
+    def show_queue(position, eta):
+        if placeholder is not None:
+            placeholder.info(f"⏳ Waiting for AI capacity: #{position} in queue (about {eta:.0f}s)")
+
     try:
-        openai.api_key = api_key
-        # If image is provided and model supports vision (e.g., gpt-4o, gpt-4-vision-preview)
-        if image_parts and model_id in ["gpt-4o", "gpt-4-vision-preview"]:
-            image_data = image_parts[0]["data"]
-            mime_type = image_parts[0]["mime_type"]
-            import base64
-            b64_image = base64.b64encode(image_data).decode()
-            content = [
-                {"type": "text", "text": input_prompt + "\n" + user_prompt},
-                {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{b64_image}"}}
-            ]
-            response = openai.chat.completions.create(
-                model=model_id,
-                messages=[{"role": "user", "content": content}],
-                max_tokens=2048
-            )
-            return response.choices[0].message.content
-        else:
-            # Text-only models
-            prompt = input_prompt + "\n" + user_prompt
-            response = openai.chat.completions.create(
-                model=model_id,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=2048
-            )
-            return response.choices[0].message.content
+        response = route_response(requests, show_progress, restart, on_wait=show_queue)
     except Exception as e:
-        st.error(f"An error occurred with the OpenAI API: {e}")
+        st.error(f"An error occurred with the {provider} API: {e}")
         return None
 
-# Placeholder for other AI providers
-
-def get_other_ai_response(input_prompt, image_parts, user_prompt, model_id, api_key, provider):
-    st.error(f"Provider '{provider}' is not yet supported.")
-    return None
+    if placeholder is not None:
+        placeholder.markdown(response.text)
+    caption = f"⏱️ {describe_timing(response.timing)}"
+    if response.model != model_ids[0]:
+        caption += f" · answered by {response.model}"
+    st.caption(caption)
+    return response.text
 
 # --- Streamlit App UI ---
 
@@ -327,16 +356,14 @@ if submit:
         with st.spinner("Analyzing your meal..."):
             image_data = setup_image_data(image_input)
             if image_data:
-                if provider == "Gemini":
-                    response = get_gemini_response(input_prompt, image_data, user_prompt, model_choice[0])
-                elif provider == "OpenAI":
-                    response = get_openai_response(input_prompt, image_data, user_prompt, model_choice[0], api_key)
-                else:
-                    response = get_other_ai_response(input_prompt, image_data, user_prompt, model_choice[0], api_key, provider)
+                st.subheader("Nutritional Analysis")
+                output = st.empty()
+                response = get_ai_response(
+                    provider, input_prompt, image_data, user_prompt,
+                    [model_choice[0]] + [model[0] for model in backup_models], api_key, output
+                )
 
                 if response:
-                    st.subheader("Nutritional Analysis")
-                    st.markdown(response)
                     # Clear the input field after a successful response
                     st.session_state.user_prompt = ""
     else:
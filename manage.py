@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Management commands for the AI Calories Tracker
+
+Usage:
+    python manage.py migrate [--target VERSION]
+    python manage.py showmigrations
+    python manage.py rebuild-rollup [--user-id ID]
+    python manage.py verify-rollup [--user-id ID]
+    python manage.py import --user-id ID [--format csv|jsonl] FILE
+    python manage.py match-foods [--user-id ID]
+    python manage.py prune-images [--min-age SECONDS]
+"""
+
+import argparse
+import sys
+
+import data_import
+import migrations
+from database import db_manager
+from image_store import image_store
+
+
+def cmd_migrate(args):
+    """Apply pending schema migrations"""
+    applied = db_manager.migrate(target=args.target, log=print)
+
+    if applied:
+        print(f"Applied {len(applied)} migration(s); schema is at version {applied[-1]}.")
+    else:
+        print("No migrations to apply; schema is up to date.")
+    return 0
+
+
+def cmd_showmigrations(args):
+    """List every migration and whether it has been applied"""
+    applied = db_manager.applied_migrations()
+
+    for version, description, _ in migrations.MIGRATIONS:
+        marker = "X" if version in applied else " "
+        print(f"[{marker}] {version:04d} {description}")
+    return 0
+
+
+def cmd_rebuild_rollup(args):
+    """Recompute the daily_nutrition rollup from meals"""
+    rows = db_manager.rebuild_daily_nutrition(user_id=args.user_id)
+    print(f"Rebuilt daily_nutrition: {rows} day row(s) written.")
+    return 0
+
+
+def cmd_verify_rollup(args):
+    """Check the daily_nutrition rollup against meals without changing it"""
+    mismatches = db_manager.verify_daily_nutrition(user_id=args.user_id)
+    for user_id, day, actual, expected in mismatches:
+        print(f"user {user_id} {day}: rollup={actual} expected={expected}")
+
+    if mismatches:
+        print(f"{len(mismatches)} mismatched day(s). Run 'python manage.py rebuild-rollup' to fix.")
+        return 1
+    print("daily_nutrition matches meals.")
+    return 0
+
+
+def cmd_import(args):
+    """Bulk-load historical meals for a user from CSV or JSONL"""
+    import_format = args.format or data_import.detect_format(args.path)
+
+    def progress(meals):
+        print(f"  {meals} meal(s) committed...")
+
+    try:
+        with open(args.path, 'rb') as source:
+            result = data_import.import_meals(args.user_id, source, import_format,
+                                              batch_size=args.batch_size, progress=progress)
+    except (OSError, data_import.ImportRowError) as e:
+        print(f"Import failed: {e}")
+        return 1
+
+    for error in result['errors']:
+        print(f"  skipped {error}")
+    print(
+        f"Imported {result['meals']} meal(s) and {result['items']} item(s) from {result['rows']} row(s) "
+        f"in {result['seconds']:.1f}s ({result['rows_per_second']:.0f} rows/s); "
+        f"{result['error_count']} row(s) skipped."
+    )
+    return 1 if result['error_count'] else 0
+
+
+def cmd_match_foods(args):
+    """Link meal items saved before the food index existed to canonical foods"""
+    checked, matched = db_manager.match_meal_item_foods(user_id=args.user_id)
+    print(f"Matched {matched} of {checked} unlinked meal item(s) to canonical foods.")
+    return 0
+
+
+def cmd_prune_images(args):
+    """Delete stored photos and thumbnails that no meal refers to"""
+    if image_store is None:
+        print("The image store is disabled (IMAGE_STORE_PATH=off).")
+        return 0
+    removed = image_store.prune(db_manager.get_image_digests(), min_age=args.min_age)
+    print(f"Removed {removed} unreferenced photo(s) from {image_store.root}.")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="AI Calories Tracker management commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Apply pending schema migrations")
+    migrate_parser.add_argument("--target", type=int, default=None,
+                                help="Stop after this migration version")
+    migrate_parser.set_defaults(func=cmd_migrate)
+
+    show_parser = subparsers.add_parser("showmigrations", help="List applied and pending migrations")
+    show_parser.set_defaults(func=cmd_showmigrations)
+
+    rebuild_parser = subparsers.add_parser("rebuild-rollup", help="Recompute daily_nutrition from meals")
+    rebuild_parser.add_argument("--user-id", type=int, default=None, help="Only rebuild this user")
+    rebuild_parser.set_defaults(func=cmd_rebuild_rollup)
+
+    verify_parser = subparsers.add_parser("verify-rollup", help="Compare daily_nutrition against meals")
+    verify_parser.add_argument("--user-id", type=int, default=None, help="Only verify this user")
+    verify_parser.set_defaults(func=cmd_verify_rollup)
+
+    import_parser = subparsers.add_parser("import", help="Bulk-load historical meals from CSV or JSONL")
+    import_parser.add_argument("path", help="CSV or JSONL file to import")
+    import_parser.add_argument("--user-id", type=int, required=True, help="User who owns the meals")
+    import_parser.add_argument("--format", choices=sorted(data_import.READERS), default=None,
+                               help="File format (default: guessed from the extension)")
+    import_parser.add_argument("--batch-size", type=int, default=data_import.IMPORT_BATCH_SIZE,
+                               help="Meals per transaction")
+    import_parser.set_defaults(func=cmd_import)
+
+    match_parser = subparsers.add_parser("match-foods", help="Link meal items to canonical foods")
+    match_parser.add_argument("--user-id", type=int, default=None, help="Only match this user's items")
+    match_parser.set_defaults(func=cmd_match_foods)
+
+    prune_parser = subparsers.add_parser("prune-images", help="Delete photos no meal refers to")
+    prune_parser.add_argument("--min-age", type=float, default=3600,
+                              help="Keep files younger than this many seconds")
+    prune_parser.set_defaults(func=cmd_prune_images)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
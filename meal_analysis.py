@@ -0,0 +1,90 @@
+"""
+AI analysis of one meal photo or description, independent of any Streamlit page
+
+Used by the AI Calculator page, its batch and quick-log modes and the
+background job workers in analysis_jobs. Nothing here touches Streamlit elements, so every
+function is safe to call from worker threads.
+"""
+
+from ai_engine import AIRequest, stream_response
+from analysis_cache import analysis_cache, analysis_cache_key
+from nutrition_parser import ANALYSIS_SCHEMA, StreamingItemParser, parse_analysis, parse_structured_analysis
+
+ANALYSIS_PROMPT = """
+You are an expert nutritionist and food scientist. Analyze the provided food image and identify all visible food items with their estimated portion sizes. Calculate the calories and macronutrients for each item using the latest scientific nutritional data.
+
+Respond with JSON only:
+- "items": one entry per food item with its name, estimated portion size, calories (kcal) and protein, carbs, fat, sugar and fiber in grams for that portion
+- "insights": brief health insights (1-2 sentences)
+
+Be as accurate as possible with portion size estimation and use standard nutritional values. Consider cooking methods and food preparation when calculating nutritional content.
+"""
+
+TEXT_ANALYSIS_PROMPT = """
+You are an expert nutritionist. Estimate the calories and macronutrients of the foods the user describes below, one entry per food item. Use the amounts given; where no amount is given, assume one typical portion.
+
+Respond with JSON only:
+- "items": one entry per food item with its name, portion size, calories (kcal) and protein, carbs, fat, sugar and fiber in grams for that portion
+- "insights": brief health insights (1 sentence)
+
+Foods eaten: """
+
+GEMINI_MODEL = 'gemini-2.5-flash'
+
+
+def request_gemini_analysis(image_parts, user_prompt, api_key, on_items=None, on_wait=None):
+    """Stream an analysis from Gemini 2.5 Flash; returns (text, timing) and raises on errors
+
+    on_items(items so far) is called whenever another food item is complete,
+    on_wait(position, eta_seconds) while the key's rate limiter queues the call.
+    """
+    full_prompt = ANALYSIS_PROMPT
+    if user_prompt:
+        full_prompt += f"\n\nAdditional context from user: {user_prompt}"
+
+    # Use Gemini 2.5 Flash model, constrained to the analysis schema
+    request = AIRequest('gemini', GEMINI_MODEL, api_key, full_prompt,
+                        images=image_parts[:1], response_schema=ANALYSIS_SCHEMA)
+    items = StreamingItemParser()
+
+    def on_text(fragment):
+        if items.feed(fragment) and on_items is not None:
+            on_items(items.items)
+
+    response = stream_response(request, on_text, on_wait=on_wait)
+    return response.text, response.timing
+
+
+def analyze_image(image_bytes, mime_type, user_prompt, api_key, on_items=None, on_wait=None,
+                  source_bytes=None):
+    """Analyze a preprocessed image, reusing the analysis cache
+
+    source_bytes is the photo's size before preprocessing, for telemetry.
+    Returns (ai_analysis markdown, nutrition_data, timing, cached); timing is
+    None for cache hits. Raises on AI errors.
+    """
+    cache_key = analysis_cache_key(image_bytes, ANALYSIS_PROMPT, user_prompt, GEMINI_MODEL)
+    cached = analysis_cache.get(cache_key) if analysis_cache else None
+    if cached:
+        return cached[0], cached[1], None, True
+
+    text, timing = request_gemini_analysis(
+        [{"mime_type": mime_type, "data": image_bytes, "source_bytes": source_bytes}],
+        user_prompt, api_key, on_items, on_wait
+    )
+    ai_analysis, nutrition_data = parse_analysis(text)
+    if analysis_cache:
+        analysis_cache.set(cache_key, GEMINI_MODEL, ai_analysis, nutrition_data)
+    return ai_analysis, nutrition_data, timing, False
+
+
+def analyze_text(description, api_key, on_wait=None):
+    """Estimate nutrition for a text description of foods with a text-only call
+
+    Returns the validated analysis dict (items and insights). Raises on AI
+    errors and SchemaError if the answer does not match ANALYSIS_SCHEMA.
+    """
+    request = AIRequest('gemini', GEMINI_MODEL, api_key, TEXT_ANALYSIS_PROMPT + description,
+                        response_schema=ANALYSIS_SCHEMA)
+    response = stream_response(request, on_wait=on_wait)
+    return parse_structured_analysis(response.text)
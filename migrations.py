@@ -0,0 +1,422 @@
+"""
+Versioned schema migrations for the AI Calories Tracker database
+
+Each migration is applied exactly once and recorded in the schema_version
+table. Run pending migrations with: python manage.py migrate
+"""
+
+import re
+from contextlib import contextmanager
+
+# Serializes concurrent migrate() runs on MySQL (GET_LOCK name and wait in seconds)
+MIGRATION_LOCK_NAME = 'calories_tracker_migrate'
+MIGRATION_LOCK_TIMEOUT = 60
+
+_CREATE_INDEX = re.compile(r'\s*CREATE\s+INDEX\s+(\w+)\s+ON\s+(\w+)', re.IGNORECASE)
+_ADD_COLUMN = re.compile(r'\s*ALTER\s+TABLE\s+(\w+)\s+ADD\s+COLUMN\s+(\w+)', re.IGNORECASE)
+
+# Ordered list of (version, description, statements). A statement is either a
+# portable SQL string or a dict of dialect -> SQL for backend-specific DDL.
+# Never edit a migration that has shipped; append a new one instead.
+MIGRATIONS = [
+    (1, "Create users, meals and meal_items tables", [
+        {'mysql': """
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            gemini_api_key TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            daily_calorie_goal INT DEFAULT 2000,
+            daily_protein_goal INT DEFAULT 150,
+            daily_carb_goal INT DEFAULT 250,
+            daily_fat_goal INT DEFAULT 65
+        )
+        """, 'sqlite': """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            gemini_api_key TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            daily_calorie_goal INT DEFAULT 2000,
+            daily_protein_goal INT DEFAULT 150,
+            daily_carb_goal INT DEFAULT 250,
+            daily_fat_goal INT DEFAULT 65
+        )
+        """},
+        {'mysql': """
+        CREATE TABLE IF NOT EXISTS meals (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            meal_date DATE NOT NULL,
+            meal_time TIME NOT NULL,
+            meal_type ENUM('breakfast', 'lunch', 'dinner', 'snack') NOT NULL,
+            image_name VARCHAR(255),
+            total_calories DECIMAL(10,2) DEFAULT 0,
+            total_protein DECIMAL(10,2) DEFAULT 0,
+            total_carbs DECIMAL(10,2) DEFAULT 0,
+            total_fat DECIMAL(10,2) DEFAULT 0,
+            total_sugar DECIMAL(10,2) DEFAULT 0,
+            total_fiber DECIMAL(10,2) DEFAULT 0,
+            ai_analysis TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        """, 'sqlite': """
+        CREATE TABLE IF NOT EXISTS meals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INT NOT NULL,
+            meal_date DATE NOT NULL,
+            meal_time TIME NOT NULL,
+            meal_type TEXT NOT NULL CHECK (meal_type IN ('breakfast', 'lunch', 'dinner', 'snack')),
+            image_name VARCHAR(255),
+            total_calories DECIMAL(10,2) DEFAULT 0,
+            total_protein DECIMAL(10,2) DEFAULT 0,
+            total_carbs DECIMAL(10,2) DEFAULT 0,
+            total_fat DECIMAL(10,2) DEFAULT 0,
+            total_sugar DECIMAL(10,2) DEFAULT 0,
+            total_fiber DECIMAL(10,2) DEFAULT 0,
+            ai_analysis TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        """},
+        {'mysql': """
+        CREATE TABLE IF NOT EXISTS meal_items (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            meal_id INT NOT NULL,
+            item_name VARCHAR(255) NOT NULL,
+            calories DECIMAL(10,2) DEFAULT 0,
+            protein DECIMAL(10,2) DEFAULT 0,
+            carbs DECIMAL(10,2) DEFAULT 0,
+            fat DECIMAL(10,2) DEFAULT 0,
+            sugar DECIMAL(10,2) DEFAULT 0,
+            fiber DECIMAL(10,2) DEFAULT 0,
+            FOREIGN KEY (meal_id) REFERENCES meals(id) ON DELETE CASCADE
+        )
+        """, 'sqlite': """
+        CREATE TABLE IF NOT EXISTS meal_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            meal_id INT NOT NULL,
+            item_name VARCHAR(255) NOT NULL,
+            calories DECIMAL(10,2) DEFAULT 0,
+            protein DECIMAL(10,2) DEFAULT 0,
+            carbs DECIMAL(10,2) DEFAULT 0,
+            fat DECIMAL(10,2) DEFAULT 0,
+            sugar DECIMAL(10,2) DEFAULT 0,
+            fiber DECIMAL(10,2) DEFAULT 0,
+            FOREIGN KEY (meal_id) REFERENCES meals(id) ON DELETE CASCADE
+        )
+        """},
+    ]),
+    (2, "Index meals by user, date and time", [
+        "CREATE INDEX idx_meals_user_date_time ON meals (user_id, meal_date, meal_time)",
+    ]),
+    (3, "Index meal_items by meal", [
+        "CREATE INDEX idx_meal_items_meal_id ON meal_items (meal_id)",
+    ]),
+    (4, "Add daily_nutrition rollup table", [
+        """
+        CREATE TABLE IF NOT EXISTS daily_nutrition (
+            user_id INT NOT NULL,
+            nutrition_date DATE NOT NULL,
+            meal_count INT DEFAULT 0,
+            calories DECIMAL(12,2) DEFAULT 0,
+            protein DECIMAL(12,2) DEFAULT 0,
+            carbs DECIMAL(12,2) DEFAULT 0,
+            fat DECIMAL(12,2) DEFAULT 0,
+            sugar DECIMAL(12,2) DEFAULT 0,
+            fiber DECIMAL(12,2) DEFAULT 0,
+            PRIMARY KEY (user_id, nutrition_date),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        """,
+        # Backfill from existing meals
+        """
+        INSERT INTO daily_nutrition (user_id, nutrition_date, meal_count, calories,
+                                     protein, carbs, fat, sugar, fiber)
+        SELECT user_id, meal_date, COUNT(*), SUM(total_calories), SUM(total_protein),
+               SUM(total_carbs), SUM(total_fat), SUM(total_sugar), SUM(total_fiber)
+        FROM meals
+        GROUP BY user_id, meal_date
+        """,
+    ]),
+    (5, "Add analysis_cache table for reusing AI responses", [
+        {'mysql': """
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            cache_key CHAR(64) PRIMARY KEY,
+            model_id VARCHAR(100) NOT NULL,
+            ai_analysis MEDIUMTEXT NOT NULL,
+            nutrition_json TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at DATETIME(6) NOT NULL
+        )
+        """, 'sqlite': """
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            cache_key CHAR(64) PRIMARY KEY,
+            model_id VARCHAR(100) NOT NULL,
+            ai_analysis TEXT NOT NULL,
+            nutrition_json TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP NOT NULL
+        )
+        """},
+        "CREATE INDEX idx_analysis_cache_last_used ON analysis_cache (last_used_at)",
+    ]),
+    (6, "Add perceptual image hash to meals", [
+        "ALTER TABLE meals ADD COLUMN image_phash BIGINT NULL",
+    ]),
+    (7, "Add analysis_jobs table for background AI analysis", [
+        {'mysql': """
+        CREATE TABLE IF NOT EXISTS analysis_jobs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            status ENUM('queued', 'running', 'done', 'failed') NOT NULL DEFAULT 'queued',
+            meal_type ENUM('breakfast', 'lunch', 'dinner', 'snack') NOT NULL,
+            meal_date DATE NOT NULL,
+            meal_time TIME NOT NULL,
+            user_prompt TEXT,
+            image_name VARCHAR(255),
+            image_mime VARCHAR(50),
+            image_data MEDIUMBLOB,
+            image_phash BIGINT NULL,
+            meal_id INT NULL,
+            ai_analysis MEDIUMTEXT,
+            error TEXT,
+            dismissed BOOLEAN NOT NULL DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME NULL,
+            finished_at DATETIME NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (meal_id) REFERENCES meals(id) ON DELETE SET NULL
+        )
+        """, 'sqlite': """
+        CREATE TABLE IF NOT EXISTS analysis_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+            meal_type TEXT NOT NULL CHECK (meal_type IN ('breakfast', 'lunch', 'dinner', 'snack')),
+            meal_date DATE NOT NULL,
+            meal_time TIME NOT NULL,
+            user_prompt TEXT,
+            image_name VARCHAR(255),
+            image_mime VARCHAR(50),
+            image_data BLOB,
+            image_phash BIGINT NULL,
+            meal_id INT NULL,
+            ai_analysis TEXT,
+            error TEXT,
+            dismissed BOOLEAN NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP NULL,
+            finished_at TIMESTAMP NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (meal_id) REFERENCES meals(id) ON DELETE SET NULL
+        )
+        """},
+        "CREATE INDEX idx_analysis_jobs_user ON analysis_jobs (user_id, dismissed, id)",
+        "CREATE INDEX idx_analysis_jobs_status ON analysis_jobs (status)",
+    ]),
+    (8, "Add ai_telemetry table for per-request AI metrics", [
+        {'mysql': """
+        CREATE TABLE IF NOT EXISTS ai_telemetry (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            created_at DATETIME(3) NOT NULL,
+            provider VARCHAR(20) NOT NULL,
+            model VARCHAR(100) NOT NULL,
+            outcome ENUM('ok', 'error', 'cancelled', 'rejected') NOT NULL,
+            http_status SMALLINT NULL,
+            error VARCHAR(255) NULL,
+            retries SMALLINT NOT NULL DEFAULT 0,
+            queue_seconds DOUBLE NULL,
+            ttfb_seconds DOUBLE NULL,
+            total_seconds DOUBLE NULL,
+            image_count SMALLINT NOT NULL DEFAULT 0,
+            image_source_bytes INT NULL,
+            image_sent_bytes INT NULL,
+            prompt_tokens INT NULL,
+            completion_tokens INT NULL,
+            cost_usd DECIMAL(12,6) NULL
+        )
+        """, 'sqlite': """
+        CREATE TABLE IF NOT EXISTS ai_telemetry (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TIMESTAMP NOT NULL,
+            provider VARCHAR(20) NOT NULL,
+            model VARCHAR(100) NOT NULL,
+            outcome TEXT NOT NULL CHECK (outcome IN ('ok', 'error', 'cancelled', 'rejected')),
+            http_status SMALLINT NULL,
+            error VARCHAR(255) NULL,
+            retries SMALLINT NOT NULL DEFAULT 0,
+            queue_seconds DOUBLE NULL,
+            ttfb_seconds DOUBLE NULL,
+            total_seconds DOUBLE NULL,
+            image_count SMALLINT NOT NULL DEFAULT 0,
+            image_source_bytes INT NULL,
+            image_sent_bytes INT NULL,
+            prompt_tokens INT NULL,
+            completion_tokens INT NULL,
+            cost_usd DECIMAL(12,6) NULL
+        )
+        """},
+        "CREATE INDEX idx_ai_telemetry_created ON ai_telemetry (created_at)",
+        "ALTER TABLE analysis_jobs ADD COLUMN image_source_bytes INT NULL",
+    ]),
+    (9, "Link meal_items to canonical foods", [
+        "ALTER TABLE meal_items ADD COLUMN food_id INT NULL",
+        "CREATE INDEX idx_meal_items_food_id ON meal_items (food_id)",
+    ]),
+    (10, "Reference stored meal photos by content hash", [
+        "ALTER TABLE meals ADD COLUMN image_sha256 CHAR(64) NULL",
+    ]),
+]
+
+
+def latest_version():
+    """Return the version the schema reaches once every migration is applied"""
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def ensure_version_table(connection):
+    """Create the schema_version bookkeeping table if it is missing"""
+    cursor = connection.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    connection.commit()
+    cursor.close()
+
+
+def applied_versions(connection):
+    """Return the set of migration versions already applied"""
+    ensure_version_table(connection)
+    cursor = connection.cursor()
+    cursor.execute("SELECT version FROM schema_version")
+    versions = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return versions
+
+
+def pending_migrations(connection, target=None):
+    """Return the migrations that still need to run, in order"""
+    applied = applied_versions(connection)
+    return [
+        migration for migration in MIGRATIONS
+        if migration[0] not in applied and (target is None or migration[0] <= target)
+    ]
+
+
+def statement_for(statement, dialect):
+    """Resolve a migration statement to SQL for the given dialect"""
+    if isinstance(statement, dict):
+        return statement[dialect]
+    return statement
+
+
+def _already_applied(cursor, statement, dialect):
+    """Return True if statement adds an index or column that already exists
+
+    CREATE TABLE steps use IF NOT EXISTS; this covers the index and column
+    steps, so a migration interrupted partway can simply be run again.
+    """
+    match = _CREATE_INDEX.match(statement)
+    if match:
+        index, table = match.groups()
+        if dialect == 'sqlite':
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name = %s", (index,))
+        else:
+            cursor.execute("""
+                SELECT COUNT(*) FROM information_schema.statistics
+                WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+            """, (table, index))
+        return cursor.fetchone()[0] > 0
+
+    match = _ADD_COLUMN.match(statement)
+    if match:
+        table, column = match.groups()
+        if dialect == 'sqlite':
+            cursor.execute(f"PRAGMA table_info({table})")
+            return any(row[1] == column for row in cursor.fetchall())
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        """, (table, column))
+        return cursor.fetchone()[0] > 0
+    return False
+
+
+@contextmanager
+def _migration_lock(connection, dialect):
+    """Hold a server-wide lock on MySQL while migrations run
+
+    SQLite needs no session lock: each migration runs under BEGIN IMMEDIATE.
+    """
+    if dialect != 'mysql':
+        yield
+        return
+
+    cursor = connection.cursor()
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT))
+    if cursor.fetchone()[0] != 1:
+        cursor.close()
+        raise RuntimeError(f"Another process has been migrating the schema for over {MIGRATION_LOCK_TIMEOUT}s")
+    try:
+        yield
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+        cursor.fetchone()
+        cursor.close()
+
+
+def migrate(connection, dialect='mysql', target=None, log=None):
+    """Apply pending migrations up to target (default: latest)
+
+    Returns the list of versions applied. Concurrent runs from several app
+    processes are serialized and each re-checks schema_version once it holds
+    the lock, so a version is never applied twice. DDL auto-commits on
+    MySQL, so a migration that fails partway is not recorded; existing
+    indexes and columns are skipped when it is run again.
+    """
+    ensure_version_table(connection)
+    applied = []
+    with _migration_lock(connection, dialect):
+        for version, description, statements in MIGRATIONS:
+            if target is not None and version > target:
+                continue
+
+            cursor = connection.cursor()
+            try:
+                if dialect == 'sqlite':
+                    # Take the write lock before checking, so two processes cannot both apply it
+                    cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("SELECT COUNT(*) FROM schema_version WHERE version = %s", (version,))
+                if cursor.fetchone()[0]:
+                    connection.rollback()
+                    continue
+
+                if log:
+                    log(f"Applying migration {version}: {description}")
+                for statement in statements:
+                    sql = statement_for(statement, dialect)
+                    if not _already_applied(cursor, sql, dialect):
+                        cursor.execute(sql)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+            applied.append(version)
+
+    return applied
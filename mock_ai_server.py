@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Gemini and OpenAI HTTP APIs
+
+Serves canned answers so the analyzers and the Flask prototype in test/ can
+be load-tested without spending real quota:
+
+    POST /v1beta/models/{model}:generateContent
+    POST /v1beta/models/{model}:streamGenerateContent[?alt=sse]
+    POST /v1/chat/completions                 (stream true or false)
+    GET  /stats                               request and error counts
+
+Point the app at it with
+    GEMINI_API_BASE=http://127.0.0.1:8765/v1beta
+    OPENAI_API_BASE=http://127.0.0.1:8765/v1
+
+Latencies are distributions such as fixed:0.5, uniform:0.2,1.5 or
+lognormal:MEDIAN,SIGMA. --ttfb delays the first chunk, --chunk-delay each
+later one. A share of requests fails with 500 (--error-rate) or with 429 and
+a Retry-After header (--rate-limit-rate). Canned answers can be replaced with
+--responses FILE, a JSON object with any of the keys "schema" (requests with
+a responseSchema), "json" (JSON mode without a schema) and "text".
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSES = {
+    # Matches nutrition_parser.ANALYSIS_SCHEMA
+    'schema': json.dumps({
+        'items': [
+            {'name': 'Grilled chicken breast', 'portion': '150 g', 'calories': 248, 'protein': 46.5,
+             'carbs': 0, 'fat': 5.4, 'sugar': 0, 'fiber': 0},
+            {'name': 'Steamed rice', 'portion': '1 cup', 'calories': 205, 'protein': 4.3,
+             'carbs': 44.5, 'fat': 0.4, 'sugar': 0.1, 'fiber': 0.6},
+            {'name': 'Broccoli', 'portion': '80 g', 'calories': 27, 'protein': 2.3,
+             'carbs': 5.3, 'fat': 0.3, 'sugar': 1.4, 'fiber': 2.1},
+        ],
+        'insights': 'A balanced, high-protein plate; add healthy fats for longer satiety.',
+    }),
+    # Shape expected by /analyze-meal in test/main.py
+    'json': json.dumps({
+        'totalCalories': 480,
+        'foodItems': [
+            {'item': 'Grilled chicken breast', 'calories': 248, 'fat': 5.4, 'carbs': 0, 'protein': 46.5},
+            {'item': 'Steamed rice', 'calories': 205, 'fat': 0.4, 'carbs': 44.5, 'protein': 4.3},
+            {'item': 'Broccoli', 'calories': 27, 'fat': 0.3, 'carbs': 5.3, 'protein': 2.3},
+        ],
+    }),
+    'text': (
+        "### Next meal ideas\n\n"
+        "1. **Greek yogurt bowl** with berries and oats (about 350 kcal)\n"
+        "2. **Turkey wrap** with salad (about 420 kcal)\n"
+        "3. **Lentil soup** and a slice of wholegrain bread (about 380 kcal)\n\n"
+        "You're doing great, keep it up!"
+    ),
+}
+
+_GEMINI_PATH = re.compile(r'^/v1beta/models/(?P<model>[^/:]+):(?P<method>generateContent|streamGenerateContent)$')
+
+
+_INLINE_DATA = re.compile(r'"(?:data|url)": "[^"]*"')
+
+
+def _estimate_tokens(body):
+    """Rough prompt token count: 4 characters of text per token, 258 per image"""
+    text = json.dumps(body)
+    images = text.count('"inline_data"') + text.count('"image_url"')
+    return max(1, len(_INLINE_DATA.sub('', text)) // 4 + 258 * images)
+
+
+def parse_distribution(spec):
+    """Return a sampler for 'fixed:S', 'uniform:A,B' or 'lognormal:MEDIAN,SIGMA' (seconds)"""
+    kind, _, args = spec.partition(':')
+    try:
+        values = [float(value) for value in args.split(',')] if args else []
+        if kind == 'fixed' and len(values) == 1:
+            return lambda: values[0]
+        if kind == 'uniform' and len(values) == 2:
+            return lambda: random.uniform(values[0], values[1])
+        if kind == 'lognormal' and len(values) == 2:
+            mu = math.log(values[0]) if values[0] > 0 else 0.0
+            return lambda: random.lognormvariate(mu, values[1])
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"invalid latency distribution: {spec!r}")
+
+
+class MockConfig:
+    """Behaviour shared by every request the server handles"""
+
+    def __init__(self, ttfb, chunk_delay, chunk_chars=40, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1, responses=None):
+        self.ttfb = ttfb
+        self.chunk_delay = chunk_delay
+        self.chunk_chars = max(1, chunk_chars)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.responses = dict(DEFAULT_RESPONSES, **(responses or {}))
+        self.counts = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'streamed': 0}
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Request handler; the server's config attribute holds the MockConfig"""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real APIs
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    @property
+    def config(self):
+        return self.server.config
+
+    # --- plumbing ---
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _write_chunk(self, data):
+        encoded = data.encode('utf-8')
+        self.wfile.write(f"{len(encoded):X}\r\n".encode('ascii') + encoded + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            return None
+
+    def _inject_failure(self):
+        """Send a 429 or 500 for the configured share of requests; True if one was sent"""
+        roll = random.random()
+        if roll < self.config.rate_limit_rate:
+            self.config.count('rate_limited')
+            self._send_json(429, {'error': {'code': 429, 'status': 'RESOURCE_EXHAUSTED',
+                                            'message': 'Mock quota exceeded'}},
+                            {'Retry-After': str(self.config.retry_after)})
+            return True
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            self.config.count('errors')
+            self._send_json(500, {'error': {'code': 500, 'status': 'INTERNAL',
+                                            'message': 'Mock internal error'}})
+            return True
+        return False
+
+    def _chunks(self, text):
+        size = self.config.chunk_chars
+        return [text[start:start + size] for start in range(0, len(text), size)] or ['']
+
+    # --- routes ---
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send_json(200, self.config.snapshot())
+        else:
+            self._send_json(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+    def do_POST(self):
+        self.config.count('requests')
+        path, _, query = self.path.partition('?')
+        body = self._read_body()
+        if body is None:
+            self._send_json(400, {'error': {'code': 400, 'message': 'Invalid JSON payload'}})
+            return
+
+        gemini = _GEMINI_PATH.match(path)
+        if gemini:
+            if not (self.headers.get('x-goog-api-key') or 'key=' in query):
+                self._send_json(403, {'error': {'code': 403, 'message': 'API key missing'}})
+                return
+            if not self._inject_failure():
+                self._gemini(body, gemini.group('method') == 'streamGenerateContent', 'alt=sse' in query)
+        elif path == '/v1/chat/completions':
+            if not self.headers.get('Authorization'):
+                self._send_json(401, {'error': {'message': 'API key missing'}})
+                return
+            if not self._inject_failure():
+                self._openai(body)
+        else:
+            self._send_json(404, {'error': {'code': 404, 'message': f'Unknown endpoint {path}'}})
+
+    def _gemini(self, body, stream, sse):
+        config = body.get('generationConfig') or {}
+        if 'responseSchema' in config:
+            text = self.config.responses['schema']
+        elif config.get('responseMimeType') == 'application/json':
+            text = self.config.responses['json']
+        else:
+            text = self.config.responses['text']
+
+        prompt_tokens = _estimate_tokens(body)
+        completion_tokens = max(1, len(text) // 4)
+
+        def event(fragment, last):
+            candidate = {'content': {'role': 'model', 'parts': [{'text': fragment}]}, 'index': 0}
+            result = {'candidates': [candidate], 'modelVersion': 'mock'}
+            if last:
+                candidate['finishReason'] = 'STOP'
+                result['usageMetadata'] = {
+                    'promptTokenCount': prompt_tokens,
+                    'candidatesTokenCount': completion_tokens,
+                    'totalTokenCount': prompt_tokens + completion_tokens,
+                }
+            return result
+
+        time.sleep(self.config.ttfb())
+        if not stream:
+            self._send_json(200, event(text, True))
+            return
+
+        self.config.count('streamed')
+        chunks = self._chunks(text)
+        self._start_stream('text/event-stream' if sse else 'application/json')
+        for index, fragment in enumerate(chunks):
+            if index:
+                time.sleep(self.config.chunk_delay())
+            payload = json.dumps(event(fragment, index == len(chunks) - 1))
+            if sse:
+                self._write_chunk(f"data: {payload}\r\n\r\n")
+            else:
+                self._write_chunk(('[' if index == 0 else ',') + payload)
+        if not sse:
+            self._write_chunk(']')
+        self._end_stream()
+
+    def _openai(self, body):
+        if (body.get('response_format') or {}).get('type') == 'json_object':
+            text = self.config.responses['schema']
+        else:
+            text = self.config.responses['text']
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        model = body.get('model', 'mock')
+        prompt_tokens, completion_tokens = _estimate_tokens(body), max(1, len(text) // 4)
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                 'total_tokens': prompt_tokens + completion_tokens}
+
+        time.sleep(self.config.ttfb())
+        if not body.get('stream'):
+            self._send_json(200, {
+                'id': completion_id, 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+            return
+
+        self.config.count('streamed')
+        self._start_stream('text/event-stream')
+        for index, fragment in enumerate(self._chunks(text)):
+            if index:
+                time.sleep(self.config.chunk_delay())
+            chunk = {
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'delta': {'content': fragment}, 'finish_reason': None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+        if (body.get('stream_options') or {}).get('include_usage'):
+            chunk = {
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                'choices': [], 'usage': usage,
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self._end_stream()
+
+
+def create_server(config, host='127.0.0.1', port=8765, verbose=False):
+    """Build (but do not start) a threaded mock server; port 0 picks a free one"""
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.config = config
+    server.verbose = verbose
+    return server
+
+
+def start_in_background(config, host='127.0.0.1', port=0):
+    """Start a mock server on a daemon thread; returns (server, base_url)"""
+    server = create_server(config, host, port)
+    threading.Thread(target=server.serve_forever, name='mock-ai-server', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mock Gemini/OpenAI server for load tests")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--ttfb', type=parse_distribution, default='lognormal:1.2,0.4',
+                        help="delay before the first chunk (default lognormal:1.2,0.4)")
+    parser.add_argument('--chunk-delay', type=parse_distribution, default='fixed:0.05',
+                        help="delay between streamed chunks (default fixed:0.05)")
+    parser.add_argument('--chunk-chars', type=int, default=40, help="characters per streamed chunk")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests failing with 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="share of requests failing with 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument('--responses', type=argparse.FileType('r'), help="JSON file overriding canned answers")
+    parser.add_argument('--seed', type=int, help="random seed for repeatable runs")
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+    responses = json.load(args.responses) if args.responses else None
+    config = MockConfig(args.ttfb, args.chunk_delay, args.chunk_chars, args.error_rate,
+                        args.rate_limit_rate, args.retry_after, responses)
+    server = create_server(config, args.host, args.port, args.verbose)
+    print(f"Mock AI server on http://{args.host}:{server.server_address[1]}")
+    print(f"  GEMINI_API_BASE=http://{args.host}:{server.server_address[1]}/v1beta")
+    print(f"  OPENAI_API_BASE=http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""
+Parsing of AI meal analyses into nutrition data
+
+The analyzer asks the model for JSON that matches ANALYSIS_SCHEMA, checks it
+with validate(), and renders the markdown table shown to the user from the
+parsed data. Free-form markdown answers (older cached analyses, or a model
+that ignores the JSON instruction) go through parse_markdown_analysis(), a
+single pass over the lines that reads the table by its header.
+"""
+
+import json
+import math
+import re
+
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fat', 'sugar', 'fiber')
+
+DISCLAIMER = "_AI Calories Calculator – AI can make mistakes. Please verify information before making conclusions._"
+
+_NUTRIENT_PROPERTIES = {
+    'calories': {'type': 'number', 'description': 'Energy in kcal'},
+    'protein': {'type': 'number', 'description': 'Protein in grams'},
+    'carbs': {'type': 'number', 'description': 'Carbohydrates in grams'},
+    'fat': {'type': 'number', 'description': 'Fat in grams'},
+    'sugar': {'type': 'number', 'description': 'Sugar in grams'},
+    'fiber': {'type': 'number', 'description': 'Fiber in grams'},
+}
+
+# OpenAPI-style schema accepted by Gemini's response_schema and by validate()
+ANALYSIS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'items': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': dict(
+                    {
+                        'name': {'type': 'string', 'description': 'Food item'},
+                        'portion': {'type': 'string', 'description': 'Estimated portion size'},
+                    },
+                    **_NUTRIENT_PROPERTIES
+                ),
+                'required': ['name', 'portion'] + list(NUTRIENTS),
+            },
+        },
+        'insights': {'type': 'string', 'description': 'Brief health insights, 1-2 sentences'},
+    },
+    'required': ['items', 'insights'],
+}
+
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'number': (int, float),
+    'integer': int,
+    'boolean': bool,
+}
+
+
+class SchemaError(ValueError):
+    """The AI response does not match ANALYSIS_SCHEMA"""
+
+
+def validate(value, schema, path='$'):
+    """Check value against a schema subset (type, properties, required, items, enum, nullable)"""
+    if value is None:
+        if schema.get('nullable'):
+            return
+        raise SchemaError(f"{path}: value is required")
+
+    expected = schema.get('type')
+    if expected is not None:
+        # bool is an int subclass but never a valid number here
+        if not isinstance(value, _TYPES[expected]) or (isinstance(value, bool) and expected != 'boolean'):
+            raise SchemaError(f"{path}: expected {expected}, got {type(value).__name__}")
+
+    if 'enum' in schema and value not in schema['enum']:
+        raise SchemaError(f"{path}: {value!r} is not one of {schema['enum']}")
+
+    if expected == 'object':
+        for key in schema.get('required', ()):
+            if key not in value:
+                raise SchemaError(f"{path}: missing '{key}'")
+        for key, subschema in schema.get('properties', {}).items():
+            if key in value:
+                validate(value[key], subschema, f"{path}.{key}")
+    elif expected == 'array' and 'items' in schema:
+        for index, element in enumerate(value):
+            validate(element, schema['items'], f"{path}[{index}]")
+
+
+def empty_nutrition():
+    nutrition_data = {f'total_{nutrient}': 0 for nutrient in NUTRIENTS}
+    nutrition_data['items'] = []
+    return nutrition_data
+
+
+def parse_structured_analysis(text):
+    """Parse and validate a JSON analysis; returns the decoded dict
+
+    Raises SchemaError if the text is not valid JSON or does not match the
+    schema, including negative or non-finite (NaN, Infinity) nutrient values.
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise SchemaError(f"response is not JSON: {e}")
+
+    validate(data, ANALYSIS_SCHEMA)
+    for index, item in enumerate(data['items']):
+        for nutrient in NUTRIENTS:
+            if not math.isfinite(item[nutrient]):
+                raise SchemaError(f"$.items[{index}].{nutrient}: must be a finite number")
+            if item[nutrient] < 0:
+                raise SchemaError(f"$.items[{index}].{nutrient}: cannot be negative")
+    return data
+
+
+def nutrition_from_analysis(data):
+    """Turn a validated analysis into the nutrition_data dict used by save_meals"""
+    nutrition_data = empty_nutrition()
+    for item in data['items']:
+        entry = {'name': item['name'].strip()[:255] or 'Unknown item'}
+        for nutrient in NUTRIENTS:
+            entry[nutrient] = float(item[nutrient])
+            nutrition_data[f'total_{nutrient}'] += entry[nutrient]
+        nutrition_data['items'].append(entry)
+    return nutrition_data
+
+
+def _cell(text):
+    return str(text).replace('|', '\\|').replace('\n', ' ')
+
+
+def _amount(value):
+    return f"{value:.0f}" if float(value).is_integer() else f"{value:.1f}"
+
+
+def render_markdown(data, disclaimer=True):
+    """Markdown table, totals and insights for a validated analysis"""
+    lines = [
+        "| Item | Portion Size | Calories (kcal) | Protein (g) | Carbs (g) | Fat (g) | Fiber (g) | Sugar (g) |",
+        "|---|---|---:|---:|---:|---:|---:|---:|",
+    ]
+    columns = ('calories', 'protein', 'carbs', 'fat', 'fiber', 'sugar')
+    totals = dict.fromkeys(columns, 0.0)
+    for item in data['items']:
+        for column in columns:
+            totals[column] += item[column]
+        lines.append(
+            f"| {_cell(item['name'])} | {_cell(item['portion'])} | "
+            + " | ".join(_amount(item[column]) for column in columns) + " |"
+        )
+    lines.append("| **Total** | | " + " | ".join(f"**{_amount(totals[column])}**" for column in columns) + " |")
+
+    insights = data.get('insights', '').strip()
+    if insights:
+        lines += ["", insights]
+    if disclaimer:
+        lines += ["", DISCLAIMER]
+    return "\n".join(lines)
+
+
+class StreamingItemParser:
+    """Pull complete food items out of a JSON analysis while it is streaming
+
+    feed() scans each new character once, tracking strings and brace depth
+    inside the "items" array, and returns the items completed by that chunk.
+    """
+
+    _ITEMS_KEY = re.compile(r'"items"\s*:\s*\[')
+
+    def __init__(self):
+        self.items = []
+        self._buffer = ''
+        self._position = None  # scan offset once the items array has started
+        self._depth = 0
+        self._start = None
+        self._in_string = False
+        self._escaped = False
+        self._done = False
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        if self._done:
+            return []
+        if self._position is None:
+            match = self._ITEMS_KEY.search(self._buffer)
+            if match is None:
+                return []
+            self._position = match.end()
+
+        completed = []
+        buffer = self._buffer
+        for index in range(self._position, len(buffer)):
+            char = buffer[index]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                if self._depth == 0:
+                    self._start = index
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    item = self._decode(buffer[self._start:index + 1])
+                    if item is not None:
+                        completed.append(item)
+            elif char == ']' and self._depth == 0:
+                self._done = True
+                break
+        self._position = len(buffer)
+        self.items.extend(completed)
+        return completed
+
+    @staticmethod
+    def _decode(text):
+        try:
+            item = json.loads(text)
+            validate(item, ANALYSIS_SCHEMA['properties']['items']['items'])
+        except (json.JSONDecodeError, SchemaError):
+            return None
+        return item
+
+
+def parse_analysis(text):
+    """Return (markdown, nutrition_data) for any AI response
+
+    JSON responses are validated and rendered; anything else is treated as
+    a markdown answer and parsed with the legacy table reader.
+    """
+    try:
+        data = parse_structured_analysis(text)
+    except SchemaError:
+        return text, parse_markdown_analysis(text)
+    return render_markdown(data), nutrition_from_analysis(data)
+
+
+# --- Legacy markdown answers ---
+
+_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+# Header keyword -> nutrient; checked in order so "Fat (%DV)" is skipped before "fat"
+_HEADER_KEYWORDS = (
+    ('%', None),
+    ('calor', 'calories'),
+    ('kcal', 'calories'),
+    ('protein', 'protein'),
+    ('carb', 'carbs'),
+    ('sugar', 'sugar'),
+    ('fiber', 'fiber'),
+    ('fibre', 'fiber'),
+    ('fat', 'fat'),
+)
+
+_TOTAL_PATTERNS = {
+    # "30g protein" first, then "Protein: 30g"
+    nutrient: (
+        re.compile(rf'(\d+(?:\.\d+)?)\s*(?:g|kcal|grams)?\s*(?:of\s+)?{keyword}', re.IGNORECASE),
+        re.compile(rf'{keyword}\w*[^\d\n]{{0,20}}?(\d+(?:\.\d+)?)', re.IGNORECASE),
+    )
+    for nutrient, keyword in (
+        ('calories', '(?:calorie|kcal)'), ('protein', 'protein'), ('carbs', 'carb'),
+        ('fat', 'fat'), ('sugar', 'sugar'), ('fiber', 'fib'),
+    )
+}
+
+
+def _first_number(text):
+    match = _NUMBER.search(text)
+    return float(match.group()) if match else 0.0
+
+
+def _header_columns(cells):
+    """Map nutrient -> column index from a table header row, or None if it is not one"""
+    columns = {}
+    for index, cell in enumerate(cells):
+        lowered = cell.lower()
+        if 'item' in lowered or 'food' in lowered:
+            columns.setdefault('name', index)
+            continue
+        for keyword, nutrient in _HEADER_KEYWORDS:
+            if keyword in lowered:
+                if nutrient is not None:
+                    columns.setdefault(nutrient, index)
+                break
+    return columns if 'calories' in columns else None
+
+
+def parse_markdown_analysis(text):
+    """Read items and totals from a markdown answer in one pass over its lines"""
+    nutrition_data = empty_nutrition()
+    stated_totals = {}
+    columns = None
+
+    for line in (text or '').splitlines():
+        stripped = line.strip()
+
+        if stripped.startswith('|'):
+            cells = [cell.strip() for cell in stripped.strip('|').split('|')]
+            if columns is None:
+                columns = _header_columns(cells)
+                continue
+            if all(not cell.strip('-: ') for cell in cells):
+                continue  # separator row
+
+            if len(cells) <= max(columns.get('name', 0), *columns.values()):
+                continue  # row is missing some of the header's columns
+
+            name = cells[columns.get('name', 0)].strip('* ')
+            values = {
+                nutrient: _first_number(cells[index])
+                for nutrient, index in columns.items() if nutrient != 'name'
+            }
+            if 'total' in name.lower():
+                stated_totals.update(values)
+            elif name:
+                item = {'name': name[:255]}
+                item.update({nutrient: values.get(nutrient, 0.0) for nutrient in NUTRIENTS})
+                nutrition_data['items'].append(item)
+            continue
+
+        columns = None
+        lowered = stripped.lower()
+        if 'total' in lowered:
+            for nutrient, (before, after) in _TOTAL_PATTERNS.items():
+                match = before.search(stripped) or after.search(stripped)
+                if match and nutrient not in stated_totals:
+                    stated_totals[nutrient] = float(match.group(1))
+
+    for nutrient in NUTRIENTS:
+        if nutrient in stated_totals:
+            nutrition_data[f'total_{nutrient}'] = stated_totals[nutrient]
+        else:
+            nutrition_data[f'total_{nutrient}'] = sum(item[nutrient] for item in nutrition_data['items'])
+    return nutrition_data
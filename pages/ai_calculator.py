@@ -1,23 +1,45 @@
 import streamlit as st
-import google.generativeai as genai
 from PIL import Image
+from datetime import date, time
 from database import db_manager
-import re
-import json
+from connection_pool import PoolTimeoutError
+from storage import Error
+from image_similarity import dhash, similar_meal_index, to_db
+from image_processing import describe_reduction, photo_taken_at, preprocess_image
+from batch_analysis import AI_MAX_CONCURRENCY_PER_KEY, run_batch
+from nutrition_parser import render_markdown
+from ai_metrics import describe_timing
+from meal_analysis import analyze_image
+from analysis_jobs import ACTIVE_STATUSES, analysis_jobs
+from quick_log import quick_log
+from image_store import image_store
+
+MEAL_TYPES = ["breakfast", "lunch", "dinner", "snack"]
+
+# Seconds between job status refreshes while an analysis is in flight
+JOB_POLL_SECONDS = 1.5
 
 def show_ai_calculator():
     """Show the AI Calories Calculator page"""
     user = st.session_state.user
     
-    # Configure Gemini with user's API key
-    if user['gemini_api_key']:
-        genai.configure(api_key=user['gemini_api_key'])
-    else:
+    st.title("🤖 AI Calories Calculator")
+    st.markdown("Upload a photo of your meal and let AI analyze the nutritional content!")
+    
+    mode = st.radio("Mode", ["Single photo", "Batch", "Quick log"], horizontal=True, label_visibility="collapsed")
+    if mode == "Quick log":
+        # Works without an API key as long as every food is in the local table
+        show_quick_log(user)
+        return
+    
+    # Requests are sent with the user's own Gemini API key
+    if not user['gemini_api_key']:
         st.error("No Gemini API key found. Please update your API key in Settings.")
         return
     
-    st.title("🤖 AI Calories Calculator")
-    st.markdown("Upload a photo of your meal and let AI analyze the nutritional content!")
+    if mode == "Batch":
+        show_batch_calculator(user)
+        return
     
     # Image input
     col1, col2 = st.columns(2, gap="large")
@@ -38,7 +60,7 @@ def show_ai_calculator():
     with col1:
         meal_type = st.selectbox(
             "Meal Type",
-            options=["breakfast", "lunch", "dinner", "snack"],
+            options=MEAL_TYPES,
             help="Select the type of meal for better tracking"
         )
     
@@ -50,9 +72,20 @@ def show_ai_calculator():
         )
     
     # Display image if uploaded
+    image_hash = None
     if image_input:
         image = Image.open(image_input)
         st.image(image, caption="Your Food Image", use_column_width=True)
+        
+        # Offer a near-identical earlier meal before spending an AI call
+        image_hash = compute_image_hash(image_input)
+        similar = find_similar_meal(user['id'], image_hash)
+        if similar:
+            _, similar_meal_id, similar_date, similar_type = similar
+            st.info(f"👀 This looks like your {similar_type} from {describe_day(similar_date)}. Reuse it?")
+            if st.button("♻️ Reuse that meal", use_container_width=True):
+                reuse_meal(user['id'], similar_meal_id, meal_type, image_hash)
+                return
     
     # Analyze button
     analyze_button = st.button("🔬 Analyze with Gemini AI", type="primary", use_container_width=True)
@@ -62,152 +95,275 @@ def show_ai_calculator():
             st.warning("Please upload an image or take a photo first!")
             return
         
-        with st.spinner("🤖 AI is analyzing your meal..."):
-            # Setup image data
-            image_data = setup_image_data(image_input)
-            if image_data:
-                # Get AI response
-                response = get_gemini_response(image_data, user_prompt)
-                
-                if response:
-                    st.success("✅ Analysis complete!")
-                    
-                    # Display AI analysis
-                    st.subheader("📊 Nutritional Analysis")
-                    st.markdown(response)
-                    
-                    # Parse nutrition data from response
-                    nutrition_data = parse_nutrition_from_response(response)
-                    
-                    # Save to database
-                    success = db_manager.save_meal_analysis(
-                        user_id=user['id'],
-                        meal_type=meal_type,
-                        ai_analysis=response,
-                        nutrition_data=nutrition_data,
-                        image_name=f"meal_{user['id']}_{meal_type}.jpg"
-                    )
-                    
-                    if success:
-                        st.success("💾 Meal data saved to your profile!")
-                        
-                        # Option to add another meal
-                        if st.button("Add Another Meal"):
-                            st.rerun()
-                    else:
-                        st.error("Failed to save meal data. Please try again.")
-                else:
-                    st.error("Failed to analyze image. Please try again.")
-
-def setup_image_data(uploaded_file_or_camera_input):
-    """Process image for Gemini API"""
-    if uploaded_file_or_camera_input is not None:
-        bytes_data = uploaded_file_or_camera_input.getvalue()
-        mime_type = uploaded_file_or_camera_input.type if hasattr(uploaded_file_or_camera_input, 'type') else 'image/jpeg'
-        
-        return [{
-            "mime_type": mime_type,
-            "data": bytes_data
-        }]
-    return None
+        # Analysis runs on a background worker; the job list below shows its progress
+        image_data = setup_image_data(image_input)
+        if image_data:
+            try:
+                analysis_jobs.submit(
+                    user['id'],
+                    meal_type,
+                    image_data[0]['data'],
+                    image_data[0]['mime_type'],
+                    user_prompt,
+                    image_name=image_input.name,
+                    image_phash=to_db(image_hash) if image_hash is not None else None,
+                    source_bytes=image_data[0]['source_bytes']
+                )
+            except (*Error, PoolTimeoutError) as e:
+                st.error(f"Could not start the analysis: {e}")
+            else:
+                st.toast("🤖 Analysis started — feel free to keep using the app.")
+    
+    show_analysis_jobs(user['id'])
 
-def get_gemini_response(image_parts, user_prompt):
-    """Get response from Gemini 2.5 Flash model"""
+def show_quick_log(user):
+    """Log a meal from a text description, using the AI only for unknown foods"""
+    st.subheader("⚡ Quick Log")
+    st.caption("Type what you ate, e.g. '2 eggs and a slice of toast'. Foods in the local nutrient table "
+               "are logged instantly; anything else is estimated by Gemini.")
+    
+    with st.form("quick_log_form", clear_on_submit=True):
+        text = st.text_input("What did you eat?", placeholder="e.g., 150g chicken breast, 1 cup of rice and broccoli")
+        meal_type = st.selectbox("Meal Type", options=MEAL_TYPES)
+        submitted = st.form_submit_button("⚡ Log Meal", type="primary", use_container_width=True)
+    
+    if not submitted:
+        return
+    
     try:
-        # Enhanced prompt for better nutrition analysis
-        system_prompt = """
-        You are an expert nutritionist and food scientist. Analyze the provided food image and identify all visible food items with their estimated portion sizes. Calculate the total calories and macronutrients for each item using the latest scientific nutritional data.
+        with st.spinner("Logging your meal..."):
+            ai_analysis, nutrition_data, unresolved = quick_log(text, user['gemini_api_key'])
+    except ValueError as e:
+        st.warning(str(e))
+        return
+    except Exception as e:
+        st.error(f"Error estimating foods: {e}")
+        return
+    
+    if db_manager.save_meal_analysis(user['id'], meal_type, ai_analysis, nutrition_data):
+        source = "with help from Gemini" if unresolved else "from the local nutrient table — no AI call needed"
+        st.success(f"💾 Logged {nutrition_data['total_calories']:.0f} kcal {source}!")
+        st.markdown(ai_analysis)
 
-        IMPORTANT: Respond with a structured analysis that includes:
-        1. A detailed markdown table with columns: Item, Portion Size, Calories (kcal), Protein (g), Carbs (g), Fat (g), Fiber (g), Sugar (g)
-        2. Total nutritional summary at the end
-        3. Brief health insights (1-2 sentences)
+def show_analysis_jobs(user_id):
+    """List the user's background analyses, refreshing while any is still in flight"""
+    jobs = db_manager.get_analysis_jobs(user_id)
+    if not jobs:
+        return
+    
+    st.subheader("📊 Your Analyses")
+    if any(job['status'] in ACTIVE_STATUSES for job in jobs):
+        poll_analysis_jobs(user_id)
+    else:
+        render_analysis_jobs(user_id, jobs)
 
-        Be as accurate as possible with portion size estimation and use standard nutritional values. Consider cooking methods and food preparation when calculating nutritional content.
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def poll_analysis_jobs(user_id):
+    jobs = db_manager.get_analysis_jobs(user_id)
+    if jobs is None:
+        return
+    if not any(job['status'] in ACTIVE_STATUSES for job in jobs):
+        # Everything finished: rerun the page once to stop polling
+        st.rerun()
+    render_analysis_jobs(user_id, jobs)
 
-        Format your response clearly with proper markdown formatting.
-        
-        End with: _AI Calories Calculator – AI can make mistakes. Please verify information before making conclusions._
-        """
-        
-        full_prompt = system_prompt
-        if user_prompt:
-            full_prompt += f"\n\nAdditional context from user: {user_prompt}"
-        
-        # Use Gemini 2.5 Flash model
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content([full_prompt, image_parts[0]])
-        
-        return response.text
-        
-    except Exception as e:
-        st.error(f"Error with Gemini API: {e}")
-        return None
+def render_analysis_jobs(user_id, jobs):
+    for job in jobs:
+        title = f"{job['meal_type'].title()} · {describe_day(job['meal_date'])}"
+        with st.container(border=True):
+            if job['status'] in ACTIVE_STATUSES:
+                progress = analysis_jobs.progress(job['id'])
+                st.markdown(f"**{title}** — ⏳ analyzing…")
+                if progress and progress['position']:
+                    st.info(f"⏳ Waiting for AI capacity: #{progress['position']} in queue")
+                elif progress and progress['items']:
+                    st.markdown(render_markdown({'items': progress['items']}, disclaimer=False))
+                continue
+            
+            if job['status'] == 'done':
+                calories = f" ({job['total_calories']:.0f} kcal)" if job['total_calories'] is not None else ""
+                st.markdown(f"**{title}** — ✅ saved to your profile{calories}")
+                if job['ai_analysis']:
+                    st.markdown(job['ai_analysis'])
+            else:
+                st.markdown(f"**{title}** — ❌ analysis failed")
+                st.error(job['error'] or "Failed to analyze image. Please try again.")
+            if st.button("Dismiss", key=f"dismiss_job_{job['id']}"):
+                if db_manager.dismiss_analysis_jobs(user_id, [job['id']]):
+                    st.rerun()
 
-def parse_nutrition_from_response(response):
-    """Parse nutrition data from AI response"""
-    nutrition_data = {
-        'total_calories': 0,
-        'total_protein': 0,
-        'total_carbs': 0,
-        'total_fat': 0,
-        'total_sugar': 0,
-        'total_fiber': 0,
-        'items': []
-    }
+def show_batch_calculator(user):
+    """Analyze many meal photos at once and save them in one write"""
+    uploaded_files = st.file_uploader(
+        "Choose meal photos...",
+        type=["jpg", "jpeg", "png"],
+        accept_multiple_files=True,
+        help=f"Up to {AI_MAX_CONCURRENCY_PER_KEY} photos are analyzed at the same time"
+    )
+    if not uploaded_files:
+        st.info("📸 Select several photos to log a whole day of meals in one go.")
+        return
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        meal_date = st.date_input("Date", value=date.today(), max_value=date.today())
+    with col2:
+        user_prompt = st.text_input(
+            "Additional Notes (Optional)",
+            placeholder="Applied to every photo",
+            key="batch_notes"
+        )
+    
+    # One row per photo with its own meal type and time
+    entries = []
+    for uploaded in uploaded_files:
+        data = uploaded.getvalue()
+        taken_at = photo_taken_at(data)
+        col1, col2, col3 = st.columns([1, 2, 2])
+        with col1:
+            st.image(data, use_column_width=True)
+        with col2:
+            entry_type = st.selectbox("Meal Type", MEAL_TYPES, key=f"batch_type_{uploaded.file_id}")
+            status = st.empty()
+        with col3:
+            entry_time = st.time_input(
+                "Time",
+                value=taken_at.time().replace(second=0, microsecond=0) if taken_at else time(12, 0),
+                key=f"batch_time_{uploaded.file_id}"
+            )
+        status.caption(f"📄 {uploaded.name}")
+        entries.append({'data': data, 'name': uploaded.name, 'meal_type': entry_type,
+                        'meal_time': entry_time, 'status': status})
+    
+    if not st.button(f"🔬 Analyze {len(entries)} Photos", type="primary", use_container_width=True):
+        return
+    
+    for entry in entries:
+        entry['status'].caption("⏳ Queued")
+    progress = st.progress(0.0, text="Analyzing photos...")
+    results = [None] * len(entries)
+    
+    batch = run_batch(
+        [entry['data'] for entry in entries],
+        user['gemini_api_key'],
+        lambda data: analyze_photo(data, user_prompt, user['gemini_api_key'])
+    )
+    for done, (index, result, error) in enumerate(batch, start=1):
+        if error is not None:
+            entries[index]['status'].error(f"❌ {error}")
+        else:
+            results[index] = result
+            source = "cache" if result['cached'] else describe_timing(result['timing'])
+            entries[index]['status'].success(
+                f"✅ {result['nutrition_data']['total_calories']:.0f} kcal ({source})"
+            )
+        progress.progress(done / len(entries), text=f"Analyzed {done} of {len(entries)} photos")
+    
+    meals = [
+        {
+            'user_id': user['id'],
+            'meal_date': meal_date,
+            'meal_time': entry['meal_time'],
+            'meal_type': entry['meal_type'],
+            'image_name': entry['name'],
+            'ai_analysis': result['ai_analysis'],
+            'nutrition_data': result['nutrition_data'],
+            'image_phash': to_db(result['image_hash']) if result['image_hash'] is not None else None,
+            'image_sha256': result['image_sha256']
+        }
+        for entry, result in zip(entries, results) if result is not None
+    ]
+    if not meals:
+        st.error("No photos could be analyzed. Please try again.")
+        return
+    
+    # All successful photos go to the database in one transaction
+    if db_manager.save_meals(meals) is not None:
+        total = sum(meal['nutrition_data']['total_calories'] for meal in meals)
+        st.success(f"💾 Saved {len(meals)} of {len(entries)} meals ({total:.0f} kcal) to your profile!")
+
+def analyze_photo(data, user_prompt, api_key):
+    """Preprocess, analyze and parse one photo without touching Streamlit elements"""
+    image_bytes, mime_type, _ = preprocess_image(data)
+    response, nutrition_data, timing, cached = analyze_image(
+        image_bytes, mime_type, user_prompt, api_key, source_bytes=len(data)
+    )
+    image_sha256 = image_store.put(image_bytes) if image_store is not None else None
     
     try:
-        # Look for total values in the response
-        lines = response.split('\n')
-        
-        for line in lines:
-            line_lower = line.lower()
-            
-            # Extract total calories
-            if 'total' in line_lower and 'calorie' in line_lower:
-                calories_match = re.search(r'(\d+(?:\.\d+)?)', line)
-                if calories_match:
-                    nutrition_data['total_calories'] = float(calories_match.group(1))
-            
-            # Extract protein
-            if 'protein' in line_lower and 'total' in line_lower:
-                protein_match = re.search(r'(\d+(?:\.\d+)?)', line)
-                if protein_match:
-                    nutrition_data['total_protein'] = float(protein_match.group(1))
-            
-            # Extract carbs
-            if ('carb' in line_lower or 'carbohydrate' in line_lower) and 'total' in line_lower:
-                carbs_match = re.search(r'(\d+(?:\.\d+)?)', line)
-                if carbs_match:
-                    nutrition_data['total_carbs'] = float(carbs_match.group(1))
-            
-            # Extract fat
-            if 'fat' in line_lower and 'total' in line_lower:
-                fat_match = re.search(r'(\d+(?:\.\d+)?)', line)
-                if fat_match:
-                    nutrition_data['total_fat'] = float(fat_match.group(1))
-        
-        # If we couldn't parse totals, try to extract from table format
-        if nutrition_data['total_calories'] == 0:
-            # Look for table rows and sum up values
-            table_pattern = r'\|[^|]*\|[^|]*\|[^|]*(\d+(?:\.\d+)?)[^|]*\|[^|]*(\d+(?:\.\d+)?)[^|]*\|[^|]*(\d+(?:\.\d+)?)[^|]*\|[^|]*(\d+(?:\.\d+)?)[^|]*\|'
-            matches = re.findall(table_pattern, response)
-            
-            for match in matches:
-                try:
-                    calories = float(match[0]) if match[0] else 0
-                    protein = float(match[1]) if match[1] else 0
-                    carbs = float(match[2]) if match[2] else 0
-                    fat = float(match[3]) if match[3] else 0
-                    
-                    nutrition_data['total_calories'] += calories
-                    nutrition_data['total_protein'] += protein
-                    nutrition_data['total_carbs'] += carbs
-                    nutrition_data['total_fat'] += fat
-                except:
-                    continue
+        image_hash = dhash(data)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        image_hash = None
     
-    except Exception as e:
-        st.warning(f"Could not parse nutrition data: {e}")
+    return {
+        'ai_analysis': response,
+        'nutrition_data': nutrition_data,
+        'image_hash': image_hash,
+        'image_sha256': image_sha256,
+        'cached': cached,
+        'timing': timing
+    }
+
+def compute_image_hash(uploaded_file_or_camera_input):
+    """Perceptual hash of the photo, or None if it cannot be decoded"""
+    try:
+        return dhash(uploaded_file_or_camera_input.getvalue())
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+def find_similar_meal(user_id, image_hash):
+    """Return the closest earlier meal as (distance, meal_id, meal_date, meal_type), or None"""
+    if image_hash is None:
+        return None
+    try:
+        matches = similar_meal_index.find_similar(user_id, image_hash)
+    except (*Error, PoolTimeoutError):
+        # The lookup is only a shortcut; fall back to a normal analysis
+        return None
+    return matches[0] if matches else None
+
+def describe_day(meal_date):
+    """Short relative description of a past date, e.g. 'yesterday' or 'Tuesday'"""
+    days_ago = (date.today() - meal_date).days
+    if days_ago <= 0:
+        return "earlier today"
+    if days_ago == 1:
+        return "yesterday"
+    if days_ago < 7:
+        return meal_date.strftime("%A")
+    return meal_date.strftime("%b %d")
+
+def reuse_meal(user_id, meal_id, meal_type, image_hash):
+    """Log a copy of an earlier meal for today without calling the AI"""
+    meal = db_manager.get_meal_for_reuse(user_id, meal_id)
+    if meal is None:
+        st.warning("That meal is no longer available. Please analyze the photo instead.")
+        return False
+    
+    meal['meal_type'] = meal_type
+    meal['image_phash'] = to_db(image_hash)
+    if db_manager.save_meals([meal]) is None:
+        return False
     
-    return nutrition_data
\ No newline at end of file
+    st.success("💾 Meal logged from your earlier analysis — no AI call needed!")
+    if meal['ai_analysis']:
+        st.subheader("📊 Nutritional Analysis")
+        st.markdown(meal['ai_analysis'])
+    return True
+
+def setup_image_data(uploaded_file_or_camera_input):
+    """Downscale and re-encode the image for the Gemini API"""
+    if uploaded_file_or_camera_input is not None:
+        try:
+            bytes_data, mime_type, stats = preprocess_image(uploaded_file_or_camera_input.getvalue())
+        except ValueError as e:
+            st.error(f"Could not process image: {e}")
+            return None
+        
+        st.caption(f"📦 {describe_reduction(stats)}")
+        return [{
+            "mime_type": mime_type,
+            "data": bytes_data,
+            "source_bytes": stats['original_bytes']
+        }]
+    return None
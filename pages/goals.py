@@ -156,17 +156,12 @@ def show_goals_page():
         start_date = end_date - timedelta(days=days_back-1)
         st.info(f"From: {start_date}")
     
-    # Get progress data
+    # Get progress data for the whole range in a single query
     progress_data = []
-    current_date = start_date
     
-    while current_date <= end_date:
-        daily_nutrition = db_manager.get_daily_nutrition(user['id'], current_date)
-        if daily_nutrition is None:
-            daily_nutrition = {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0}
-        
+    for daily_nutrition in db_manager.get_nutrition_range(user['id'], start_date, end_date):
         progress_data.append({
-            'Date': current_date,
+            'Date': daily_nutrition['date'],
             'Calories': daily_nutrition['calories'],
             'Protein': daily_nutrition['protein'],
             'Carbs': daily_nutrition['carbs'],
@@ -176,7 +171,6 @@ def show_goals_page():
             'Carbs_Goal': user['daily_carb_goal'],
             'Fat_Goal': user['daily_fat_goal']
         })
-        current_date += timedelta(days=1)
     
     progress_df = pd.DataFrame(progress_data)
     
@@ -1,10 +1,21 @@
 import streamlit as st
 from database import db_manager
+from image_store import image_store
 from datetime import date, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 
+def get_cached_meal_analysis(user_id, meal_id):
+    """Fetch a meal's AI analysis once per session and reuse it on reruns"""
+    analysis_cache = st.session_state.setdefault('meal_analysis_cache', {})
+    if meal_id not in analysis_cache:
+        analysis = db_manager.get_meal_analysis(user_id, meal_id)
+        if analysis is None:
+            return None
+        analysis_cache[meal_id] = analysis
+    return analysis_cache[meal_id]
+
 def show_home_page():
     """Display the main dashboard home page"""
     user = st.session_state.user
@@ -169,33 +180,46 @@ def show_home_page():
                 col1, col2 = st.columns([1, 2])
                 
                 with col1:
+                    # Cards only ever load the small thumbnail, never the stored photo
+                    thumbnail = None
+                    if image_store is not None and meal['image_sha256']:
+                        thumbnail = image_store.read_thumbnail(meal['image_sha256'])
+                    if thumbnail:
+                        st.image(thumbnail, width=160)
                     st.write(f"**Calories:** {int(meal['calories'])} kcal")
                     st.write(f"**Protein:** {meal['protein']:.1f}g")
                     st.write(f"**Carbs:** {meal['carbs']:.1f}g")
                     st.write(f"**Fat:** {meal['fat']:.1f}g")
                 
                 with col2:
-                    if meal['analysis']:
-                        st.markdown("**AI Analysis:**")
-                        st.write(meal['analysis'])
+                    # Only fetch the analysis body once the user asks for it
+                    if meal['has_analysis'] and st.toggle("Show AI Analysis", key=f"show_analysis_{meal['id']}"):
+                        analysis = get_cached_meal_analysis(user['id'], meal['id'])
+                        if analysis:
+                            st.markdown("**AI Analysis:**")
+                            st.write(analysis)
+                
+                if st.button("🗑️ Delete Meal", key=f"delete_meal_{meal['id']}"):
+                    if db_manager.delete_meal(user['id'], meal['id']):
+                        st.session_state.get('meal_analysis_cache', {}).pop(meal['id'], None)
+                        st.success("Meal deleted.")
+                        st.rerun()
     else:
         st.info("No meals logged for this date. Use the AI Calculator to add your first meal!")
     
     # Weekly trend (if we have data for multiple days)
     st.subheader("📈 Weekly Calorie Trend")
     
-    # Get data for the past 7 days
-    weekly_data = []
-    for i in range(7):
-        day = selected_date - timedelta(days=i)
-        day_nutrition = db_manager.get_daily_nutrition(user['id'], day)
-        weekly_data.append({
-            'Date': day,
-            'Calories': day_nutrition['calories'] if day_nutrition else 0
-        })
+    # Get data for the past 7 days in a single query
+    weekly_nutrition = db_manager.get_nutrition_range(
+        user['id'], selected_date - timedelta(days=6), selected_date
+    )
+    weekly_data = [
+        {'Date': day['date'], 'Calories': day['calories']}
+        for day in weekly_nutrition
+    ]
     
-    weekly_df = pd.DataFrame(weekly_data)
-    weekly_df = weekly_df.sort_values('Date')
+    weekly_df = pd.DataFrame(weekly_data, columns=['Date', 'Calories'])
     
     if weekly_df['Calories'].sum() > 0:
         fig = px.line(
@@ -1,5 +1,16 @@
 import streamlit as st
+from datetime import date, datetime, timedelta
+import pandas as pd
+import plotly.express as px
 from database import db_manager
+from auth import is_admin
+from analysis_cache import analysis_cache
+from ai_metrics import latency_recorder, percentile
+from ai_telemetry import telemetry_writer
+from image_store import image_store
+from rate_limiter import rate_limit_stats
+from data_export import EXPORT_FORMATS, available_formats, export_meals_to_file
+from data_import import detect_format, import_meals
 
 def show_settings_page():
     """Show the settings page"""
@@ -36,26 +47,11 @@ def show_settings_page():
             submit_api = st.form_submit_button("Update API Key")
             
             if submit_api and new_api_key:
-                try:
-                    connection = db_manager.get_connection()
-                    if connection:
-                        cursor = connection.cursor()
-                        cursor.execute(
-                            "UPDATE users SET gemini_api_key = %s WHERE id = %s",
-                            (new_api_key, user['id'])
-                        )
-                        connection.commit()
-                        cursor.close()
-                        connection.close()
-                        
-                        # Update session state
-                        st.session_state.user['gemini_api_key'] = new_api_key
-                        st.success("✅ API key updated successfully!")
-                        st.rerun()
-                    else:
-                        st.error("Database connection failed")
-                except Exception as e:
-                    st.error(f"Error updating API key: {e}")
+                if db_manager.update_api_key(user['id'], new_api_key):
+                    # Update session state
+                    st.session_state.user['gemini_api_key'] = new_api_key
+                    st.success("✅ API key updated successfully!")
+                    st.rerun()
     
     # App Preferences
     with st.expander("🎨 App Preferences"):
@@ -82,14 +78,72 @@ def show_settings_page():
         st.markdown("### Export Data")
         st.info("Export your nutrition data for personal use or backup.")
         
+        export_format = st.selectbox(
+            "Export Format",
+            options=available_formats(),
+            format_func=lambda name: name.upper(),
+            help="CSV and Parquet have one row per food item; JSONL has one object per meal"
+        )
+        
+        export_range = None
         col1, col2 = st.columns(2)
         with col1:
             if st.button("📥 Export All Data", use_container_width=True):
-                st.info("Export feature coming soon!")
+                export_range = (None, None)
         
         with col2:
             if st.button("📋 Export Last 30 Days", use_container_width=True):
-                st.info("Export feature coming soon!")
+                export_range = (date.today() - timedelta(days=29), date.today())
+        
+        if export_range is not None:
+            previous = st.session_state.pop('export_file', None)
+            if previous is not None:
+                previous.discard()
+            
+            with st.spinner("Exporting your data..."):
+                try:
+                    st.session_state.export_file = export_meals_to_file(user['id'], export_format, *export_range)
+                except Exception as e:
+                    st.error(f"Error exporting data: {e}")
+        
+        export_file = st.session_state.get('export_file')
+        if export_file is not None and export_file.available:
+            extension, mime_type = EXPORT_FORMATS[export_file.format]
+            st.success(f"✅ Export ready: {export_file.rows} rows")
+            # Read only when clicked, and only once: the file is deleted after it is served
+            st.download_button(
+                "⬇️ Download Export",
+                data=export_file.take,
+                file_name=f"calories_export_{date.today().isoformat()}.{extension}",
+                mime=mime_type,
+                use_container_width=True
+            )
+        elif export_file is not None:
+            del st.session_state.export_file
+        
+        st.markdown("### Import Data")
+        st.info("Import historical meals from a CSV or JSONL file in the export format.")
+        
+        uploaded = st.file_uploader("Meal history file", type=['csv', 'jsonl'])
+        if uploaded is not None and st.button("📤 Import Meals", use_container_width=True):
+            import_format = detect_format(uploaded.name)
+            status = st.empty()
+            try:
+                with st.spinner("Importing your meals..."):
+                    result = import_meals(
+                        user['id'], uploaded, import_format,
+                        progress=lambda meals: status.caption(f"{meals} meals imported...")
+                    )
+                status.empty()
+                st.success(
+                    f"✅ Imported {result['meals']} meals ({result['items']} items) in "
+                    f"{result['seconds']:.1f}s — {result['rows_per_second']:.0f} rows/s"
+                )
+                if result['error_count']:
+                    st.warning(f"Skipped {result['error_count']} invalid row(s):")
+                    st.code("\n".join(result['errors']))
+            except Exception as e:
+                st.error(f"Error importing data: {e}")
         
         st.markdown("### Reset Data")
         st.warning("⚠️ Danger Zone")
@@ -102,22 +156,86 @@ def show_settings_page():
             
             if reset_button:
                 if confirm_text == "DELETE":
-                    try:
-                        connection = db_manager.get_connection()
-                        if connection:
-                            cursor = connection.cursor()
-                            cursor.execute("DELETE FROM meals WHERE user_id = %s", (user['id'],))
-                            connection.commit()
-                            cursor.close()
-                            connection.close()
-                            st.success("All data deleted successfully.")
-                        else:
-                            st.error("Database connection failed")
-                    except Exception as e:
-                        st.error(f"Error deleting data: {e}")
+                    if db_manager.delete_user_meals(user['id']):
+                        st.success("All data deleted successfully.")
                 else:
                     st.error("Please type 'DELETE' to confirm")
     
+    # Diagnostics
+    with st.expander("🩺 Diagnostics"):
+        st.markdown("### Database Connections")
+        pool_stats = db_manager.pool_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Checkouts", pool_stats['checkouts'])
+        col2.metric("Waits", pool_stats['waits'])
+        col3.metric("Timeouts", pool_stats['timeouts'])
+        col4.metric("Open", pool_stats['open'])
+        
+        st.markdown("### Query Cache")
+        cache_stats = db_manager.cache_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Hits", cache_stats['hits'])
+        col2.metric("Misses", cache_stats['misses'])
+        col3.metric("Hit Rate", f"{cache_stats['hit_rate']:.0%}")
+        col4.metric("Entries", f"{cache_stats['size']} / {cache_stats['max_size']}")
+        
+        st.markdown("### AI Analysis Cache")
+        if analysis_cache is None:
+            st.caption("Disabled (ANALYSIS_CACHE_BACKEND=off)")
+        else:
+            analysis_stats = analysis_cache.stats()
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Hits", analysis_stats['hits'])
+            col2.metric("Misses", analysis_stats['misses'])
+            col3.metric("Evictions", analysis_stats['evictions'])
+            col4.metric("Errors", analysis_stats['errors'])
+        
+        st.markdown("### Meal Photo Store")
+        if image_store is None:
+            st.caption("Disabled (IMAGE_STORE_PATH=off)")
+        else:
+            image_stats = image_store.stats()
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Stored", image_stats['stored'])
+            col2.metric("Deduplicated", image_stats['deduplicated'])
+            col3.metric("Thumbnail Reads", image_stats['thumbnail_reads'])
+            col4.metric("Errors", image_stats['errors'])
+        
+        st.markdown("### AI Latency")
+        latency = latency_recorder.summary()
+        format_seconds = lambda value: f"{value:.1f}s" if value is not None else "–"
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Requests", latency['requests'], help=f"{latency['errors']} failed")
+        col2.metric("First Token (p50)", format_seconds(latency['ttfb_p50']))
+        col3.metric("Total (p50)", format_seconds(latency['total_p50']))
+        col4.metric("Total (p95)", format_seconds(latency['total_p95']))
+        
+        model_stats = latency_recorder.model_stats()
+        if model_stats:
+            st.table([
+                {
+                    "Model": f"{provider} / {model}",
+                    "Requests": stats['requests'],
+                    "Errors": f"{stats['error_rate']:.0%}",
+                    "First Token (p95)": format_seconds(stats['ttfb_p95']),
+                    "Total (p95)": format_seconds(stats['total_p95']),
+                }
+                for (provider, model), stats in sorted(model_stats.items())
+            ])
+        
+        st.markdown("### AI Rate Limiting")
+        limits = rate_limit_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Admitted", limits['admitted'], help=f"{limits['keys']} API keys")
+        col2.metric("Queued Now", limits['queued'])
+        col3.metric("Rejected", limits['rejected'])
+        col4.metric("429 Backoffs", limits['throttled'])
+    
+    # AI telemetry (admins only)
+    if is_admin(user):
+        with st.expander("📈 AI Telemetry"):
+            show_ai_telemetry()
+    
     # About section
     with st.expander("ℹ️ About"):
         st.markdown("""
@@ -139,7 +257,7 @@ def show_settings_page():
         **Privacy:**
         - Your data is stored securely in your database
         - API keys are encrypted and never shared
-        - Images are processed in real-time and not stored
+        - Meal photos are stored downscaled, with small thumbnails for the dashboard
         
         **Support:**
         Visit [GitHub Repository](https://github.com/jthweb/AI-Calories-Calculator) for issues and updates.
@@ -153,4 +271,71 @@ def show_settings_page():
             st.session_state.authenticated = False
             st.session_state.user = None
             st.success("Logged out successfully!")
-            st.rerun()
\ No newline at end of file
+            st.rerun()
+
+TELEMETRY_WINDOWS = {"Last 24 hours": timedelta(hours=24), "Last 7 days": timedelta(days=7), "Last 30 days": timedelta(days=30)}
+TELEMETRY_BUCKETS = {"Hour": "h", "Day": "D"}
+
+def show_ai_telemetry():
+    """Show per-model latency, tokens and cost from the ai_telemetry table"""
+    if telemetry_writer is None:
+        st.caption("Disabled (AI_TELEMETRY=false)")
+        return
+    
+    col1, col2 = st.columns(2)
+    window = col1.selectbox("Window", list(TELEMETRY_WINDOWS), key="telemetry_window")
+    bucket = col2.selectbox("Bucket", list(TELEMETRY_BUCKETS), key="telemetry_bucket")
+    
+    writer_stats = telemetry_writer.stats()
+    st.caption(
+        f"Written {writer_stats['written']} · pending {writer_stats['pending']} · "
+        f"dropped {writer_stats['dropped']} · failed {writer_stats['failed']}"
+    )
+    
+    rows = db_manager.get_ai_telemetry(datetime.now() - TELEMETRY_WINDOWS[window])
+    if not rows:
+        st.info("No AI calls recorded in this window.")
+        return
+    
+    df = pd.DataFrame(rows)
+    df['model'] = df['provider'] + " / " + df['model']
+    format_seconds = lambda value: f"{value:.1f}s" if value is not None else "–"
+    format_kb = lambda value: f"{value / 1024:.0f} KB" if pd.notna(value) else "–"
+    
+    summary = []
+    for model, group in df.groupby('model'):
+        succeeded = group[group['outcome'] == 'ok']
+        latencies = succeeded['total_seconds'].dropna().tolist()
+        ttfbs = succeeded['ttfb_seconds'].dropna().tolist()
+        summary.append({
+            "Model": model,
+            "Requests": len(group),
+            "Errors": f"{(group['outcome'] == 'error').mean():.0%}",
+            "Retries": int(group['retries'].sum()),
+            "First Token (p50)": format_seconds(percentile(ttfbs, 0.5)),
+            "Total (p50)": format_seconds(percentile(latencies, 0.5)),
+            "Total (p95)": format_seconds(percentile(latencies, 0.95)),
+            "Total (p99)": format_seconds(percentile(latencies, 0.99)),
+            "Tokens In": int(group['prompt_tokens'].fillna(0).sum()),
+            "Tokens Out": int(group['completion_tokens'].fillna(0).sum()),
+            "Cost": f"${group['cost_usd'].fillna(0).astype(float).sum():.4f}",
+            "Image Before": format_kb(group['image_source_bytes'].mean()),
+            "Image After": format_kb(group['image_sent_bytes'].mean()),
+        })
+    st.table(summary)
+    
+    succeeded = df[(df['outcome'] == 'ok') & df['total_seconds'].notna()].copy()
+    if succeeded.empty:
+        return
+    succeeded['period'] = pd.to_datetime(succeeded['created_at']).dt.floor(TELEMETRY_BUCKETS[bucket])
+    trend = [
+        {"Period": period, "Model": model, "Percentile": name, "Seconds": percentile(group['total_seconds'].tolist(), fraction)}
+        for (period, model), group in succeeded.groupby(['period', 'model'])
+        for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+    ]
+    fig = px.line(
+        pd.DataFrame(trend), x="Period", y="Seconds", color="Model", line_dash="Percentile",
+        markers=True, title="Total latency per model"
+    )
+    fig.update_layout(height=400)
+    st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
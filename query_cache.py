@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """Size-bounded LRU cache with a TTL for per-user query results
+
+    Keys are tuples whose second element is the user id, e.g.
+    ('nutrition', user_id, date). Writers invalidate a single day or a whole
+    user; readers pass the generation they saw before querying so a result
+    computed before an invalidation is never stored after it.
+    """
+
+    def __init__(self, max_size=2048, ttl=300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        # Generations only ever grow, so a reader's snapshot never matches again
+        # after an invalidation, even one made by clear()
+        self._version = 0  # bumped by every invalidation
+        self._generations = {}  # user_id -> _version at the user's last invalidation
+        self._cleared = 0  # _version at the last clear()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def get(self, key):
+        """Return (True, value) on a fresh hit, otherwise (False, None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return True, entry[1]
+                del self._entries[key]
+            self._stats['misses'] += 1
+            return False, None
+
+    def generation(self, user_id):
+        """Return the user's current invalidation generation"""
+        with self._lock:
+            return self._generation(user_id)
+
+    def _generation(self, user_id):
+        # Caller holds the lock
+        return max(self._generations.get(user_id, 0), self._cleared)
+
+    def set(self, key, value, generation=None):
+        """Store a value unless the user was invalidated since ``generation``"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation(key[1]):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, user_id, dates=None):
+        """Drop cached entries for a user, either for the given dates or all of them"""
+        with self._lock:
+            self._version += 1
+            self._generations[user_id] = self._version
+            if dates is None:
+                stale = [key for key in self._entries if key[1] == user_id]
+            else:
+                dates = set(dates)
+                stale = [key for key in self._entries if key[1] == user_id and key[2] in dates]
+            for key in stale:
+                del self._entries[key]
+            self._stats['invalidations'] += len(stale)
+
+    def clear(self):
+        """Drop every entry and invalidate reads in flight for all users"""
+        with self._lock:
+            self._entries.clear()
+            self._version += 1
+            self._cleared = self._version
+            # Every user's generation is now _cleared, above any stored one
+            self._generations.clear()
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = len(self._entries)
+            snapshot['max_size'] = self.max_size
+            lookups = snapshot['hits'] + snapshot['misses']
+            snapshot['hit_rate'] = snapshot['hits'] / lookups if lookups else 0.0
+        return snapshot
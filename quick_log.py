@@ -0,0 +1,230 @@
+"""
+Quick meal logging from a short text description
+
+parse_quick_log("2 eggs and a slice of toast") splits the text into food
+phrases, reads each phrase's quantity and unit, and resolves the food
+against the local nutrient table in food_index, so known foods are logged
+in milliseconds without a network call. quick_log() sends only the phrases
+the table cannot resolve confidently to a text-only model call and merges
+both into one analysis ready for save_meal_analysis().
+"""
+
+import os
+import re
+
+from food_index import food_index
+from meal_analysis import analyze_text
+from nutrition_parser import NUTRIENTS, nutrition_from_analysis, render_markdown
+
+# Lowest food_index score accepted without asking the model; the default
+# takes only exact name or alias matches, since a partial match such as
+# "banana bread" -> white bread is a different food
+QUICK_LOG_MIN_SCORE = float(os.getenv('QUICK_LOG_MIN_SCORE', '1.0'))
+
+_NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12,
+    'half': 0.5, 'quarter': 0.25, 'couple': 2, 'few': 3, 'dozen': 12,
+}
+_FRACTIONS = {'½': 0.5, '¼': 0.25, '¾': 0.75, '⅓': 1 / 3, '⅔': 2 / 3}
+
+# Grams per unit
+_MASS_UNITS = {
+    'g': 1, 'gr': 1, 'gram': 1, 'kg': 1000, 'kilo': 1000, 'kilogram': 1000,
+    'oz': 28.35, 'ounce': 28.35, 'lb': 453.6, 'pound': 453.6,
+}
+# Millilitres per unit; converted at 1 g/ml unless the food's serving uses the unit
+_VOLUME_UNITS = {
+    'ml': 1, 'milliliter': 1, 'millilitre': 1, 'l': 1000, 'liter': 1000, 'litre': 1000,
+    'cup': 240, 'tablespoon': 15, 'teaspoon': 5, 'glass': 240, 'mug': 300,
+}
+# Units that mean "one of the food's servings"
+_COUNT_UNITS = frozenset((
+    'slice', 'piece', 'serving', 'portion', 'bowl', 'plate', 'handful', 'bar', 'scoop',
+    'can', 'bottle', 'pack', 'package', 'bag', 'stick', 'fillet', 'wedge', 'square',
+))
+_UNIT_ALIASES = {
+    'grams': 'g', 'kgs': 'kg', 'ozs': 'oz', 'lbs': 'lb', 'tbsp': 'tablespoon', 'tbs': 'tablespoon',
+    'tsp': 'teaspoon', 'pc': 'piece', 'pcs': 'piece',
+}
+
+# "1,000" (groups of three) is a thousands separator, "1,5" a decimal comma
+_THOUSANDS = re.compile(r'\d{1,3}(?:,\d{3})+')
+_TOKEN = re.compile(
+    r"\d{1,3}(?:,\d{3})+(?![\d.,])|\d+(?:[.,]\d+)?(?:/\d+)?|[½¼¾⅓⅔]|[^\W\d_]+(?:'[^\W\d_]+)?"
+)
+# Always separate foods; "and"/"with" only when the whole chunk is not a known food.
+# A comma between two digits is part of a number, not a separator.
+_HARD_SEPARATORS = re.compile(r'\s*(?:(?<!\d),|,(?!\d)|[;+\n]|\bthen\b)\s*')
+_SOFT_SEPARATORS = re.compile(r'\s+(?:and|with|plus|on)\s+|\s*&\s*')
+
+
+def _number(token):
+    """Numeric value of a quantity token, or None"""
+    if token in _NUMBER_WORDS:
+        return _NUMBER_WORDS[token]
+    if token in _FRACTIONS:
+        return _FRACTIONS[token]
+    if token[0].isdigit():
+        if '/' in token:
+            numerator, denominator = token.split('/')
+            return int(numerator) / int(denominator) if int(denominator) else None
+        if _THOUSANDS.fullmatch(token):
+            return float(token.replace(',', ''))
+        return float(token.replace(',', '.'))
+    return None
+
+
+def _unit(token):
+    """Canonical unit name for a token, or None"""
+    token = _UNIT_ALIASES.get(token, token)
+    # Plurals: "cups", "slices", "glasses"
+    candidates = (token, token[:-1], token[:-2]) if token.endswith('s') else (token,)
+    for candidate in candidates:
+        if candidate in _MASS_UNITS or candidate in _VOLUME_UNITS or candidate in _COUNT_UNITS:
+            return candidate
+    return None
+
+
+def parse_phrase(phrase):
+    """Split one food phrase into (quantity, unit, food name)
+
+    quantity and unit are None when the phrase does not give them, e.g.
+    "1 1/2 cups of rice" -> (1.5, 'cup', 'rice'), "banana" -> (None, None, 'banana').
+    """
+    tokens = _TOKEN.findall(phrase.lower())
+    quantity = None
+    from_digits = False
+    index = 0
+    # Leave at least one token for the food name
+    while index < len(tokens) - 1:
+        value = _number(tokens[index])
+        if value is None:
+            break
+        if quantity is None:
+            quantity = value
+        elif value < 1 and from_digits:
+            quantity += value  # "1 1/2"
+        else:
+            quantity *= value  # "half a", "a dozen", "two dozen"
+        from_digits = tokens[index][0].isdigit()
+        index += 1
+        if index < len(tokens) and tokens[index] == 'of':
+            index += 1  # "a couple of eggs"
+
+    unit = _unit(tokens[index]) if index < len(tokens) - 1 else None
+    if unit is not None:
+        index += 1
+        if index < len(tokens) - 1 and tokens[index] == 'of':
+            index += 1
+    name_tokens = tokens[index:]
+
+    # Trailing amounts: "chicken breast 200 g", "rice 1 cup"
+    if quantity is None and len(name_tokens) >= 3:
+        trailing_unit = _unit(name_tokens[-1])
+        trailing_quantity = _number(name_tokens[-2]) if name_tokens[-2][0].isdigit() else None
+        if trailing_unit is not None and trailing_quantity is not None:
+            quantity, unit, name_tokens = trailing_quantity, trailing_unit, name_tokens[:-2]
+
+    return quantity, unit, ' '.join(name_tokens)
+
+
+def portion_grams(food, quantity, unit):
+    """Weight in grams of quantity x unit of a food"""
+    quantity = 1 if quantity is None else quantity
+    if unit in _MASS_UNITS:
+        return quantity * _MASS_UNITS[unit]
+    serving_words = (food.serving or '').split()
+    if unit is not None and unit in serving_words:
+        return quantity * food.serving_grams
+    if unit in _VOLUME_UNITS:
+        return quantity * _VOLUME_UNITS[unit]
+    return quantity * (food.serving_grams or 100)
+
+
+def _describe_portion(food, quantity, unit, grams):
+    if unit in _MASS_UNITS:
+        return f"{grams:.0f} g"
+    count = f"{1 if quantity is None else quantity:g}"
+    return f"{count} × {unit or food.serving or 'serving'} ({grams:.0f} g)"
+
+
+def _resolve(phrase, min_score=QUICK_LOG_MIN_SCORE):
+    """Local item for a phrase, or None if the nutrient table does not know it"""
+    quantity, unit, name = parse_phrase(phrase)
+    match = food_index.lookup(name) if food_index is not None and name else None
+    if match is None or match[1] < min_score:
+        return None
+
+    food = match[0]
+    grams = portion_grams(food, quantity, unit)
+    item = {
+        'name': food.name.capitalize(),
+        'portion': _describe_portion(food, quantity, unit, grams),
+        'food_id': food.id,
+    }
+    item.update(food.nutrients(grams))
+    return item
+
+
+def parse_quick_log(text):
+    """Resolve a text description against the local nutrient table
+
+    Returns (items, unresolved): items are dicts with name, portion, food_id
+    and every nutrient; unresolved lists the phrases the table does not know.
+    """
+    items = []
+    unresolved = []
+    for chunk in _HARD_SEPARATORS.split(text or ''):
+        chunk = chunk.strip()
+        if not chunk:
+            continue
+        # "mac and cheese" is one food; "eggs and toast" is two
+        item = _resolve(chunk, min_score=1.0) if _SOFT_SEPARATORS.search(chunk) else None
+        if item is not None:
+            items.append(item)
+            continue
+        for phrase in _SOFT_SEPARATORS.split(chunk):
+            phrase = phrase.strip()
+            if not phrase:
+                continue
+            item = _resolve(phrase)
+            if item is None:
+                unresolved.append(phrase)
+            else:
+                items.append(item)
+    return items, unresolved
+
+
+def quick_log(text, api_key=None, on_wait=None):
+    """Turn a text description into (ai_analysis markdown, nutrition_data, unresolved)
+
+    Phrases the local table cannot resolve are estimated with one text-only
+    model call; unresolved lists them. Raises ValueError if nothing can be
+    logged, or if the model is needed but there is no API key, and the AI
+    errors of meal_analysis.analyze_text().
+    """
+    items, unresolved = parse_quick_log(text)
+    if not items and not unresolved:
+        raise ValueError("Describe what you ate, e.g. '2 eggs and a slice of toast'.")
+
+    insights = f"Logged {len(items)} item(s) from the local nutrient table."
+    if unresolved:
+        if not api_key:
+            raise ValueError(
+                f"Couldn't recognize: {', '.join(unresolved)}. "
+                "Add a Gemini API key in Settings to estimate foods that are not in the table."
+            )
+        estimated = analyze_text(', '.join(unresolved), api_key, on_wait)
+        items = items + [dict(item, food_id=None) for item in estimated['items']]
+        insights = f"{insights} Estimated by AI: {', '.join(unresolved)}. {estimated['insights']}".strip()
+
+    data = {'items': items, 'insights': insights}
+    nutrition_data = nutrition_from_analysis(data)
+    # Keep the canonical food of local items; AI items are matched on save
+    for entry, item in zip(nutrition_data['items'], items):
+        if item['food_id'] is not None:
+            entry['food_id'] = item['food_id']
+    for key in NUTRIENTS:
+        nutrition_data[f'total_{key}'] = round(nutrition_data[f'total_{key}'], 1)
+    return render_markdown(data), nutrition_data, unresolved
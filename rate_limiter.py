@@ -0,0 +1,175 @@
+"""
+Per-API-key rate limiting for AI provider calls
+
+Every request for a key takes a token from that key's bucket, which refills
+at AI_RATE_LIMIT_RPM requests per minute up to AI_RATE_LIMIT_BURST. Callers
+without a token wait in a FIFO queue of at most AI_QUEUE_MAX requests and
+can report their position while they wait.
+
+A 429 from the provider pauses the key for the Retry-After time (or an
+exponential backoff), lets a single request probe once the pause ends and
+halves the refill rate; each success then raises the rate again in small
+steps. The limiter thus settles just under the provider's real quota
+instead of repeatedly tipping over it.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+
+AI_RATE_LIMIT_RPM = float(os.getenv('AI_RATE_LIMIT_RPM', '60'))
+AI_RATE_LIMIT_BURST = int(os.getenv('AI_RATE_LIMIT_BURST', '5'))
+AI_QUEUE_MAX = int(os.getenv('AI_QUEUE_MAX', '20'))
+AI_QUEUE_TIMEOUT = float(os.getenv('AI_QUEUE_TIMEOUT', '60'))
+
+_MAX_BACKOFF = 60.0
+_MIN_RATE_FRACTION = 0.125   # never throttle below 1/8 of the configured rate
+_RECOVERY_FRACTION = 0.1     # each success restores 10% of the configured rate
+_POLL_INTERVAL = 0.25        # how often waiters re-check cancellation
+
+
+class AdmissionError(RuntimeError):
+    """The request could not get a slot: the queue is full or the wait timed out"""
+
+
+class KeyRateLimiter:
+    """Token bucket with a bounded FIFO wait queue for one API key"""
+
+    def __init__(self, requests_per_minute=AI_RATE_LIMIT_RPM, burst=AI_RATE_LIMIT_BURST,
+                 max_queue=AI_QUEUE_MAX):
+        self.max_rate = requests_per_minute / 60.0
+        self.rate = self.max_rate
+        self.burst = max(1, burst)
+        self.max_queue = max_queue
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.consecutive_429s = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self._queue = deque()
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def _wait_for_token(self, now):
+        """Seconds until the head of the queue may go"""
+        paused = max(0.0, self.blocked_until - now)
+        if self.tokens >= 1:
+            return paused
+        return max(paused, (1 - self.tokens) / self.rate)
+
+    def acquire(self, timeout=AI_QUEUE_TIMEOUT, on_wait=None, cancel=None):
+        """Wait for a token; returns True once admitted, False if cancel was set
+
+        on_wait(position, eta_seconds) is called from this thread whenever the
+        caller's 1-based queue position changes. Raises AdmissionError if the
+        queue is full or no token is free within timeout seconds.
+        """
+        ticket = object()
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionError(f"AI request queue is full ({self.max_queue} waiting); try again shortly")
+            self._queue.append(ticket)
+            try:
+                reported = None
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    position = self._queue.index(ticket)
+                    wait = self._wait_for_token(now)
+                    if position == 0 and wait <= 0:
+                        self.tokens -= 1
+                        self.admitted += 1
+                        return True
+                    if cancel is not None and cancel.is_set():
+                        return False
+                    if now >= deadline:
+                        self.rejected += 1
+                        raise AdmissionError(f"No AI capacity within {timeout:.1f}s; try again shortly")
+
+                    if on_wait is not None and position + 1 != reported:
+                        reported = position + 1
+                        eta = wait + position / self.rate
+                        self._condition.release()
+                        try:
+                            on_wait(reported, eta)
+                        finally:
+                            self._condition.acquire()
+                        continue
+
+                    nap = min(deadline - now, _POLL_INTERVAL if position else max(wait, 0.001))
+                    if cancel is not None:
+                        nap = min(nap, _POLL_INTERVAL)
+                    self._condition.wait(nap)
+            finally:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+
+    def backoff(self, retry_after=None):
+        """Record a 429: pause the key, then allow one probe at half the refill rate"""
+        with self._condition:
+            now = time.monotonic()
+            self.throttled += 1
+            self.consecutive_429s += 1
+            delay = retry_after if retry_after else min(_MAX_BACKOFF, 2.0 ** (self.consecutive_429s - 1))
+            self.blocked_until = max(self.blocked_until, now + delay)
+            # The bucket holds exactly one token and only starts refilling after the pause
+            self.tokens = 1.0
+            self.updated = self.blocked_until
+            self.rate = max(self.max_rate * _MIN_RATE_FRACTION, self.rate / 2)
+            return delay
+
+    def succeeded(self):
+        """Record a successful request: creep the refill rate back up"""
+        with self._condition:
+            self.consecutive_429s = 0
+            if self.rate < self.max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.max_rate * _RECOVERY_FRACTION)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'throttled': self.throttled,
+                'queued': len(self._queue),
+                'rate_fraction': self.rate / self.max_rate,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(api_key):
+    """Process-wide rate limiter for one API key"""
+    # Never keep the raw key around as a dict key
+    key_id = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()
+    with _limiters_lock:
+        limiter = _limiters.get(key_id)
+        if limiter is None:
+            limiter = KeyRateLimiter()
+            _limiters[key_id] = limiter
+        return limiter
+
+
+def rate_limit_stats():
+    """Totals over every key for the Diagnostics panel"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    totals = {'keys': len(limiters), 'admitted': 0, 'rejected': 0, 'throttled': 0, 'queued': 0}
+    for limiter in limiters:
+        stats = limiter.stats()
+        for name in ('admitted', 'rejected', 'throttled', 'queued'):
+            totals[name] += stats[name]
+    return totals
@@ -0,0 +1,320 @@
+"""
+Storage backends for DatabaseManager
+
+A backend hands out DB-API style connections that accept MySQL-style %s
+placeholders, so DatabaseManager can issue the same SQL against MySQL or
+SQLite. Dialect-specific statements are produced by the backend itself.
+Select one with DB_BACKEND=mysql (default) or DB_BACKEND=sqlite in .env.
+"""
+
+import os
+import sqlite3
+import threading
+import weakref
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from connection_pool import ConnectionPool
+
+try:
+    import mysql.connector
+    from mysql.connector import Error as MySQLError
+except ImportError:  # MySQL support is optional when running on SQLite
+    mysql = None
+    MySQLError = None
+
+# Catch-all for database errors from whichever backend is active. This is a
+# tuple: combine it with other exceptions as `except (*Error, Other)`
+Error = tuple(error for error in (sqlite3.Error, MySQLError) if error is not None)
+
+
+class StorageBackend:
+    """Common interface implemented by every storage backend"""
+
+    dialect = None
+
+    def get_connection(self):
+        """Return a connection; close() releases it. Raises on failure."""
+        raise NotImplementedError
+
+    def stats(self):
+        """Return connection counters for diagnostics"""
+        raise NotImplementedError
+
+    def is_duplicate_error(self, error):
+        """Return True if error is a unique-constraint violation"""
+        raise NotImplementedError
+
+    def upsert_sql(self, table, key_columns, columns, accumulate=False):
+        """Build an INSERT that updates columns when key_columns already exist
+
+        With accumulate=True the inserted values are added to the stored ones
+        instead of replacing them.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release every connection held by the backend"""
+
+
+class MySQLBackend(StorageBackend):
+    """MySQL backend with a process-wide connection pool"""
+
+    dialect = 'mysql'
+
+    def __init__(self):
+        if mysql is None:
+            raise RuntimeError("mysql-connector-python is required for DB_BACKEND=mysql")
+
+        self.host = os.getenv('DB_HOST', 'localhost')
+        self.port = os.getenv('DB_PORT', '3306')
+        self.database = os.getenv('DB_NAME', 'calories_tracker')
+        self.user = os.getenv('DB_USER', 'placeholder_username')
+        self.password = os.getenv('DB_PASSWORD', 'placeholder_password')
+
+        self.pool = ConnectionPool(
+            self._connect,
+            max_size=int(os.getenv('DB_POOL_SIZE', '10')),
+            timeout=float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            max_idle=float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+            ping=lambda connection: connection.is_connected(),
+            ping_after=float(os.getenv('DB_POOL_PING_AFTER', '5'))
+        )
+
+    def _connect(self):
+        """Open a new raw MySQL connection"""
+        return mysql.connector.connect(
+            host=self.host,
+            port=self.port,
+            database=self.database,
+            user=self.user,
+            password=self.password
+        )
+
+    def get_connection(self):
+        return self.pool.get()
+
+    def stats(self):
+        return self.pool.stats()
+
+    def is_duplicate_error(self, error):
+        return "Duplicate entry" in str(error)
+
+    def upsert_sql(self, table, key_columns, columns, accumulate=False):
+        all_columns = list(key_columns) + list(columns)
+        if accumulate:
+            updates = [f"{column} = {column} + VALUES({column})" for column in columns]
+        else:
+            updates = [f"{column} = VALUES({column})" for column in columns]
+        return (
+            f"INSERT INTO {table} ({', '.join(all_columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(all_columns))}) "
+            f"ON DUPLICATE KEY UPDATE {', '.join(updates)}"
+        )
+
+    def close(self):
+        self.pool.close_all()
+
+
+def _register_sqlite_types():
+    """Round-trip date/time values the way mysql-connector does"""
+    sqlite3.register_adapter(date, lambda value: value.isoformat())
+    sqlite3.register_adapter(time, lambda value: value.isoformat())
+    sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+    sqlite3.register_adapter(Decimal, float)
+    sqlite3.register_converter("DATE", lambda raw: date.fromisoformat(raw.decode()))
+    sqlite3.register_converter("TIME", lambda raw: time.fromisoformat(raw.decode()))
+    sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.fromisoformat(raw.decode()))
+
+
+class _SQLiteCursor:
+    """Cursor wrapper that accepts %s placeholders"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, statement, params=()):
+        self._cursor.execute(statement.replace('%s', '?'), params)
+        return self
+
+    def executemany(self, statement, seq_of_params):
+        self._cursor.executemany(statement.replace('%s', '?'), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class _SQLiteConnection:
+    """One checkout of a thread's SQLite connection
+
+    Checkouts on the same thread share one connection, so close() only ends
+    the transaction when the outermost checkout is released; a nested
+    get_connection()/close() must not discard its caller's pending writes.
+    """
+
+    def __init__(self, holder):
+        self._holder = holder
+        self._raw = holder.raw
+        self._closed = False
+        holder.depth += 1
+
+    def cursor(self, **kwargs):
+        # MySQL-only options such as buffered= have no SQLite equivalent
+        return _SQLiteCursor(self._raw.cursor())
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._holder.depth -= 1
+        # The thread keeps its connection; just never leak an open transaction
+        if self._holder.depth == 0 and self._holder.raw is self._raw:
+            try:
+                self._raw.rollback()
+            except sqlite3.Error:
+                pass
+
+    def __del__(self):
+        # Error paths that skip close() still end the transaction
+        self.close()
+
+
+class _ThreadConnection:
+    """Owns one thread's SQLite connection and closes it when the thread ends"""
+
+    def __init__(self, backend, raw):
+        self.backend = backend
+        self.raw = raw
+        self.depth = 0  # open _SQLiteConnection checkouts
+
+    def close(self):
+        if self.raw is not None:
+            raw, self.raw = self.raw, None
+            try:
+                raw.close()
+            except sqlite3.Error:
+                pass
+            with self.backend._lock:
+                self.backend._open -= 1
+
+    def __del__(self):
+        # Streamlit runs every rerun on a fresh thread; thread-locals die with it
+        self.close()
+
+
+class SQLiteBackend(StorageBackend):
+    """SQLite backend in WAL mode with one connection per thread"""
+
+    dialect = 'sqlite'
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('SQLITE_PATH', 'calories_tracker.db')
+        self._local = threading.local()
+        self._holders = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._checkouts = 0
+        _register_sqlite_types()
+
+    def _connect(self):
+        raw = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            # Each thread only uses its own connection; close() may run elsewhere
+            check_same_thread=False,
+            timeout=float(os.getenv('SQLITE_BUSY_TIMEOUT', '5'))
+        )
+        raw.execute("PRAGMA journal_mode=WAL")
+        raw.execute("PRAGMA synchronous=NORMAL")
+        raw.execute("PRAGMA foreign_keys=ON")
+        return raw
+
+    def get_connection(self):
+        holder = getattr(self._local, 'holder', None)
+        if holder is None or holder.raw is None:
+            holder = _ThreadConnection(self, self._connect())
+            self._local.holder = holder
+            with self._lock:
+                self._holders.add(holder)
+                self._open += 1
+        with self._lock:
+            self._checkouts += 1
+        return _SQLiteConnection(holder)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'checkouts': self._checkouts,
+                'waits': 0,
+                'timeouts': 0,
+                'open': self._open,
+            }
+
+    def is_duplicate_error(self, error):
+        return isinstance(error, sqlite3.IntegrityError) and "UNIQUE" in str(error)
+
+    def upsert_sql(self, table, key_columns, columns, accumulate=False):
+        all_columns = list(key_columns) + list(columns)
+        if accumulate:
+            updates = [f"{column} = {column} + excluded.{column}" for column in columns]
+        else:
+            updates = [f"{column} = excluded.{column}" for column in columns]
+        return (
+            f"INSERT INTO {table} ({', '.join(all_columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(all_columns))}) "
+            f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {', '.join(updates)}"
+        )
+
+    def close(self):
+        with self._lock:
+            holders = list(self._holders)
+        for holder in holders:
+            holder.close()
+
+
+BACKENDS = {
+    'mysql': MySQLBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+def create_backend(name=None):
+    """Instantiate the backend named by DB_BACKEND (default: mysql)"""
+    name = (name or os.getenv('DB_BACKEND', 'mysql')).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown DB_BACKEND '{name}'. Choose one of: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
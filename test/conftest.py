@@ -0,0 +1,44 @@
+"""
+Shared fixtures: tests run against a throwaway SQLite database
+
+The environment is set before any app module is imported, so the global
+db_manager opens its backend on a temporary SQLITE_PATH.
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+
+_DB_DIR = tempfile.mkdtemp(prefix='calories-tracker-test-')
+os.environ['DB_BACKEND'] = 'sqlite'
+os.environ['SQLITE_PATH'] = os.path.join(_DB_DIR, 'test.db')
+os.environ['IMAGE_STORE_PATH'] = 'off'
+os.environ['AI_TELEMETRY'] = 'false'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+_user_numbers = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def db():
+    """The app's db_manager with every migration applied"""
+    from database import db_manager
+
+    db_manager.migrate()
+    yield db_manager
+    db_manager.backend.close()
+
+
+@pytest.fixture
+def user_id(db):
+    """Id of a fresh user, so tests never see each other's meals"""
+    number = next(_user_numbers)
+    ok, message = db.create_user(f'user{number}', f'user{number}@example.com', 'secret', '')
+    assert ok, message
+    ok, user, message = db.authenticate_user(f'user{number}', 'secret')
+    assert ok, message
+    return user['id']
@@ -7,6 +7,9 @@ from werkzeug.security import generate_password_hash, check_password_hash
 # --- App Initialization ---
 app = Flask(__name__, template_folder='templates')
 
+# Point at mock_ai_server.py for load tests
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+
 # --- In-Memory Database (Placeholder for MySQL) ---
 # This dictionary will act as our database for now.
 # In a real application, you would replace this with MySQL queries.
@@ -141,7 +144,7 @@ def analyze_meal():
     base64_image = data.get("image")
     mime_type = data.get("mimeType")
     
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={api_key}"
+    api_url = f"{GEMINI_API_BASE}/models/gemini-2.5-flash:generateContent?key={api_key}"
 
     system_prompt = """
     You are a nutrition expert. Analyze the food image. Identify all food items, estimate portion sizes, and calculate nutritional info.
@@ -179,7 +182,7 @@ def get_suggestion():
     if not api_key:
         return jsonify({"error": "API Key not found for user."}), 400
 
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={api_key}"
+    api_url = f"{GEMINI_API_BASE}/models/gemini-2.5-flash:generateContent?key={api_key}"
 
     remaining_calories = log_data.get('calorieGoal', 2000) - log_data.get('totalCalories', 0)
     eaten_foods = ", ".join(item['item'] for meal in log_data.get('meals', []) for item in meal.get('foodItems', [])) or "nothing yet"
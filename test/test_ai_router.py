@@ -0,0 +1,99 @@
+import pytest
+
+import ai_router
+from ai_engine import AIProviderError, AIRequest, AIResponse
+from ai_metrics import latency_recorder
+from ai_router import order_candidates, route_response
+
+
+def _request(model):
+    return AIRequest('gemini', model, 'key', 'prompt')
+
+
+def _answer(text):
+    def behavior(request, on_text, cancel):
+        on_text(text)
+        return AIResponse(text, request.provider, request.model, None)
+    return behavior
+
+
+def _hang(request, on_text, cancel):
+    cancel.wait(5)
+    raise AIProviderError(f"{request.model} cancelled")
+
+
+def _fail(request, on_text, cancel):
+    raise AIProviderError(f"{request.model} failed", status=500)
+
+
+@pytest.fixture
+def cancels():
+    """model name -> the cancel event route_response handed its attempt"""
+    return {}
+
+
+@pytest.fixture
+def models(monkeypatch, cancels):
+    """model name -> behavior(request, on_text, cancel) standing in for the provider"""
+    behaviors = {}
+
+    def stream_response(request, on_text, cancel, on_wait):
+        cancels[request.model] = cancel
+        return behaviors[request.model](request, on_text, cancel)
+
+    monkeypatch.setattr(ai_router, 'stream_response', stream_response)
+    monkeypatch.setattr(ai_router, 'AI_HEDGE_DELAY', 0.05)
+    monkeypatch.setattr(latency_recorder, 'model_stats', lambda: {})
+    return behaviors
+
+
+def test_slow_primary_is_hedged_and_cancelled(models, cancels):
+    models['primary'] = _hang
+    models['backup'] = _answer('backup text')
+    started = []
+    texts = []
+
+    response = route_response([_request('primary'), _request('backup')],
+                              on_text=texts.append, on_start=lambda request: started.append(request.model))
+
+    assert response.model == 'backup'
+    assert started == ['backup'] and texts == ['backup text']
+    assert cancels['primary'].is_set()
+
+
+def test_failed_primary_fails_over_without_waiting_for_the_hedge(models, monkeypatch):
+    monkeypatch.setattr(ai_router, 'AI_HEDGE_DELAY', 30)
+    models['primary'] = _fail
+    models['backup'] = _answer('backup text')
+
+    assert route_response([_request('primary'), _request('backup')], deadline=5).model == 'backup'
+
+
+def test_last_error_is_raised_when_every_model_fails(models):
+    models['primary'] = _fail
+    models['backup'] = _fail
+
+    with pytest.raises(AIProviderError, match='backup failed'):
+        route_response([_request('primary'), _request('backup')])
+
+
+def test_nothing_runs_past_the_deadline(models, cancels):
+    models['primary'] = _hang
+    models['backup'] = _hang
+
+    with pytest.raises(AIProviderError, match='within'):
+        route_response([_request('primary'), _request('backup')], deadline=0.3)
+    assert set(cancels) == {'primary', 'backup'}
+    assert all(cancel.is_set() for cancel in cancels.values())
+
+
+def test_failing_primary_is_tried_after_a_healthy_backup():
+    primary, slow, fast = _request('primary'), _request('slow'), _request('fast')
+    stats = {
+        ('gemini', 'primary'): {'requests': 10, 'errors': 8, 'error_rate': 0.8, 'ttfb_p50': 1.0},
+        ('gemini', 'slow'): {'requests': 10, 'errors': 0, 'error_rate': 0.0, 'ttfb_p50': 4.0},
+        ('gemini', 'fast'): {'requests': 10, 'errors': 0, 'error_rate': 0.0, 'ttfb_p50': 2.0},
+    }
+
+    assert order_candidates([primary, slow, fast], stats) == [fast, primary, slow]
+    assert order_candidates([primary, slow, fast], {}) == [primary, slow, fast]
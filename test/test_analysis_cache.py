@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from analysis_cache import MemoryAnalysisCache, analysis_cache_key
+
+
+def test_cache_key_covers_every_field():
+    key = analysis_cache_key(b'image', 'prompt', ' no sauce ', 'gemini')
+    assert key == analysis_cache_key(b'image', 'prompt', 'no sauce', 'gemini')
+    assert key != analysis_cache_key(b'image', 'prompt', 'no sauce', 'gpt')
+    assert analysis_cache_key(b'ab', 'c', None, 'm') != analysis_cache_key(b'a', 'bc', None, 'm')
+
+
+def test_memory_analysis_cache_evicts_least_recently_used():
+    cache = MemoryAnalysisCache(max_size=2)
+    cache.set('a', 'model', 'A', {})
+    cache.set('b', 'model', 'B', {})
+    assert cache.get('a') == ('A', {})
+    cache.set('c', 'model', 'C', {})
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_analysis_cache_evicts_the_oldest_entries_by_key(db):
+    connection = db.backend.get_connection()
+    try:
+        connection.cursor().execute("DELETE FROM analysis_cache")
+        connection.commit()
+    finally:
+        connection.close()
+
+    for number in range(3):
+        db.store_cached_analysis(f'key-{number}', 'model', 'text', {'items': []}, max_entries=3)
+
+    # Entries that share a timestamp must not all go at once
+    connection = db.backend.get_connection()
+    try:
+        connection.cursor().execute("UPDATE analysis_cache SET last_used_at = %s", (datetime(2024, 1, 1),))
+        connection.commit()
+    finally:
+        connection.close()
+
+    assert db.store_cached_analysis('key-new', 'model', 'text', {'items': []}, max_entries=3) == 1
+    assert db.get_cached_analysis('key-0') is None
+    assert db.get_cached_analysis('key-1') is not None
+    assert db.get_cached_analysis('key-new') is not None
+
+
+def test_memory_analysis_cache_hands_out_copies():
+    cache = MemoryAnalysisCache(max_size=1)
+    nutrition = {'items': [{'name': 'Egg'}]}
+    cache.set('key', 'model', 'text', nutrition)
+    nutrition['items'].append({'name': 'Toast'})
+
+    _, cached = cache.get('key')
+    cached['items'].clear()
+    assert cache.get('key')[1] == {'items': [{'name': 'Egg'}]}
@@ -0,0 +1,79 @@
+import sqlite3
+from datetime import date, time
+
+import pytest
+
+from analysis_jobs import AnalysisJobQueue
+
+
+def _create_job(db, user_id):
+    return db.create_analysis_job({
+        'user_id': user_id, 'meal_type': 'lunch', 'meal_date': date.today(), 'meal_time': time(12, 0),
+        'user_prompt': '', 'image_name': 'lunch.jpg', 'image_mime': 'image/jpeg',
+        'image_data': b'jpeg', 'image_phash': None,
+    })
+
+
+def _job(db, user_id, job_id):
+    return next(job for job in db.get_analysis_jobs(user_id) if job['id'] == job_id)
+
+
+def _set_status(db, job_id, status):
+    connection = db.backend.get_connection()
+    try:
+        connection.cursor().execute("UPDATE analysis_jobs SET status = %s WHERE id = %s", (status, job_id))
+        connection.commit()
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def jobs():
+    queue = AnalysisJobQueue(workers=1, recover=False)
+    yield queue
+    if queue._executor is not None:
+        queue._executor.shutdown(wait=True)
+
+
+def test_job_without_api_key_fails_with_a_message(db, user_id, jobs):
+    job_id = _create_job(db, user_id)
+    jobs._run(job_id)
+
+    job = _job(db, user_id, job_id)
+    assert job['status'] == 'failed'
+    assert 'API key' in job['error']
+    assert jobs.progress(job_id) is None
+
+
+def test_job_is_claimed_only_once(db, user_id, jobs):
+    job_id = _create_job(db, user_id)
+    assert db.claim_analysis_job(job_id)['user_id'] == user_id
+
+    jobs._run(job_id)
+    assert _job(db, user_id, job_id)['status'] == 'running'
+
+
+def test_job_fails_when_it_cannot_be_claimed(db, user_id, jobs, monkeypatch):
+    job_id = _create_job(db, user_id)
+
+    def claim_analysis_job(job_id):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(db, 'claim_analysis_job', claim_analysis_job)
+    jobs._run(job_id)
+
+    job = _job(db, user_id, job_id)
+    assert job['status'] == 'failed' and job['error'] == 'database is locked'
+
+
+def test_start_requeues_jobs_left_running(db, user_id, monkeypatch):
+    job_id = _create_job(db, user_id)
+    _set_status(db, job_id, 'running')
+
+    queue = AnalysisJobQueue(workers=1, recover=True)
+    submitted = []
+    monkeypatch.setattr(queue, '_run', submitted.append)
+    queue.start().shutdown(wait=True)
+
+    assert job_id in submitted
+    assert _job(db, user_id, job_id)['status'] == 'queued'
@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from connection_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.closed = False
+        self.rollbacks = 0
+        self.pings = 0
+
+    def rollback(self):
+        if not self.alive:
+            raise ConnectionError("gone")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+def _pool(**options):
+    created = []
+
+    def connect():
+        created.append(FakeConnection(len(created) + 1))
+        return created[-1]
+
+    def ping(connection):
+        connection.pings += 1
+        return connection.alive
+
+    options.setdefault('timeout', 0.2)
+    return ConnectionPool(connect, ping=ping, **options), created
+
+
+def test_released_connections_are_reused_and_rolled_back():
+    pool, created = _pool(max_size=2)
+    connection = pool.get()
+    connection.close()
+    connection.close()  # a second close is a no-op
+
+    assert created[0].rollbacks == 1
+    assert pool.get()._raw is created[0]
+    assert len(created) == 1
+    assert pool.stats()['checkouts'] == 2
+
+
+def test_recently_used_connections_are_not_pinged():
+    pool, created = _pool(ping_after=60)
+    pool.get().close()
+    pool.get().close()
+
+    assert created[0].pings == 0
+
+
+def test_idle_connection_that_fails_its_ping_is_dropped():
+    pool, created = _pool(ping_after=0)
+    pool.get().close()
+    created[0].alive = False
+    time.sleep(0.01)
+
+    assert pool.get()._raw is created[1]
+    assert created[0].closed
+    assert pool.stats()['discarded'] == 1
+
+
+def test_connection_idle_past_max_idle_is_recycled():
+    pool, created = _pool(max_idle=0.01)
+    pool.get().close()
+    time.sleep(0.02)
+
+    assert pool.get()._raw is created[1]
+    assert created[0].closed
+
+
+def test_connection_whose_rollback_fails_is_not_returned():
+    pool, created = _pool()
+    connection = pool.get()
+    created[0].alive = False
+    connection.close()
+
+    stats = pool.stats()
+    assert stats['open'] == 0 and stats['idle'] == 0
+
+
+def test_full_pool_waits_for_a_release_then_times_out():
+    pool, _ = _pool(max_size=1, timeout=1)
+    held = pool.get()
+    threading.Timer(0.05, held.close).start()
+    pool.get().close()
+    assert pool.stats()['waits'] == 1
+
+    pool.timeout = 0.05
+    held = pool.get()
+    with pytest.raises(PoolTimeoutError):
+        pool.get()
+    assert pool.stats()['timeouts'] == 1
+    held.close()
+
+
+def test_failed_connect_frees_its_slot():
+    def connect():
+        raise ConnectionError("refused")
+
+    pool = ConnectionPool(connect, max_size=1, timeout=0.05)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            pool.get()
+    assert pool.stats()['open'] == 0
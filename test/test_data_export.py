@@ -0,0 +1,76 @@
+import csv
+import gc
+import io
+import json
+import os
+from datetime import date
+
+import data_export
+from data_export import ExportFile, export_meals, export_meals_to_file
+
+
+def _save_meal(db, user_id, meal_type, *items):
+    nutrition = {'items': [], 'total_calories': 0, 'total_protein': 0, 'total_carbs': 0,
+                 'total_fat': 0, 'total_sugar': 0, 'total_fiber': 0}
+    for name, calories in items:
+        nutrition['items'].append({'name': name, 'calories': calories, 'protein': 1,
+                                   'carbs': 0, 'fat': 0, 'sugar': 0, 'fiber': 0})
+        nutrition['total_calories'] += calories
+    assert db.save_meal_analysis(user_id, meal_type, None, nutrition)
+
+
+def test_csv_export_has_one_row_per_item(db, user_id):
+    _save_meal(db, user_id, 'breakfast', ('Egg', 70), ('Toast', 80))
+    _save_meal(db, user_id, 'lunch', ('Rice', 200))
+
+    out = io.BytesIO()
+    assert export_meals(user_id, 'csv', out, chunk_size=2) == 3
+
+    rows = list(csv.DictReader(io.StringIO(out.getvalue().decode('utf-8'))))
+    assert [row['item_name'] for row in rows] == ['Egg', 'Toast', 'Rice']
+    assert rows[0]['meal_date'] == date.today().isoformat()
+    assert float(rows[2]['total_calories']) == 200
+
+
+def test_jsonl_export_nests_items_per_meal(db, user_id):
+    _save_meal(db, user_id, 'breakfast', ('Egg', 70), ('Toast', 80))
+    _save_meal(db, user_id, 'lunch', ('Rice', 200))
+
+    out = io.BytesIO()
+    assert export_meals(user_id, 'jsonl', out, chunk_size=1) == 3
+
+    meals = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [meal['meal_type'] for meal in meals] == ['breakfast', 'lunch']
+    assert [item['name'] for item in meals[0]['items']] == ['Egg', 'Toast']
+    assert meals[0]['total_calories'] == 150
+
+
+def test_export_file_is_deleted_after_its_download(db, user_id):
+    _save_meal(db, user_id, 'dinner', ('Soup', 120))
+
+    export_file = export_meals_to_file(user_id, 'csv')
+    assert export_file.rows == 1 and export_file.available
+    assert b'Soup' in export_file.take()
+    assert not os.path.exists(export_file.path)
+
+
+def test_export_file_is_deleted_with_its_session(tmp_path):
+    path = tmp_path / 'export.csv'
+    path.write_bytes(b'meal_id\n')
+
+    export_file = ExportFile(str(path), 0, 'csv')
+    del export_file
+    gc.collect()
+    assert not path.exists()
+
+
+def test_stale_exports_are_swept(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_export, 'EXPORT_DIR', str(tmp_path))
+    stale = tmp_path / 'stale.csv'
+    stale.write_bytes(b'')
+    os.utime(stale, (0, 0))
+    fresh = tmp_path / 'fresh.csv'
+    fresh.write_bytes(b'')
+
+    data_export._remove_stale_exports()
+    assert not stale.exists() and fresh.exists()
@@ -0,0 +1,67 @@
+import io
+import json
+from datetime import date
+
+import pytest
+
+from data_import import MAX_NUTRIENT_VALUE, ImportRowError, _parse_number, detect_format, import_meals
+
+
+def _csv(*lines):
+    return io.BytesIO('\n'.join(lines).encode('utf-8'))
+
+
+def _jsonl(*records):
+    return io.BytesIO('\n'.join(json.dumps(record) for record in records).encode('utf-8'))
+
+
+@pytest.mark.parametrize('value', ['nan', 'inf', '-inf', 'NaN', '1e308', '-1', 'abc'])
+def test_parse_number_rejects_values_the_database_cannot_hold(value):
+    with pytest.raises(ImportRowError):
+        _parse_number(value, 'total_calories')
+
+
+def test_parse_number_accepts_the_column_maximum_and_blanks():
+    assert _parse_number(str(MAX_NUTRIENT_VALUE), 'total_calories') == MAX_NUTRIENT_VALUE
+    assert _parse_number('', 'total_calories') == 0.0
+
+
+def test_detect_format():
+    assert detect_format('history.CSV') == 'csv'
+    assert detect_format('history.jsonl') == 'jsonl'
+
+
+def test_csv_import_groups_items_and_refreshes_the_rollup(db, user_id):
+    stream = _csv(
+        'meal_id,meal_date,meal_time,meal_type,item_name,item_calories,item_protein',
+        '1,2024-03-01,08:00,breakfast,Egg,70,6',
+        '1,2024-03-01,08:00,breakfast,Toast,80,3',
+        '2,2024-03-01,13:00,lunch,Salad,150,4',
+    )
+    summary = import_meals(user_id, stream, 'csv', batch_size=1)
+
+    assert summary['meals'] == 2
+    assert summary['items'] == 3
+    assert summary['error_count'] == 0
+    assert db.get_daily_nutrition(user_id, date(2024, 3, 1))['calories'] == 300
+
+
+def test_invalid_rows_are_reported_and_skipped(db, user_id):
+    stream = _jsonl(
+        {'meal_date': '2024-03-02', 'meal_type': 'dinner', 'items': [{'name': 'Pasta', 'calories': 600}]},
+        {'meal_date': '2024-03-02', 'meal_type': 'dinner', 'items': [{'name': 'Bad', 'calories': 'nan'}]},
+        {'meal_date': '2024-03-02', 'meal_type': 'dinner', 'total_calories': 1e12},
+        {'meal_date': 'yesterday', 'meal_type': 'dinner'},
+        {'meal_date': '2024-03-02', 'meal_type': 'brunch'},
+    )
+    summary = import_meals(user_id, stream, 'jsonl')
+
+    assert summary['meals'] == 1
+    assert summary['error_count'] == 4
+    assert summary['errors'][0].startswith('line 2:')
+    assert db.get_daily_nutrition(user_id, date(2024, 3, 2))['calories'] == 600
+
+
+def test_csv_without_required_columns_is_rejected(db, user_id):
+    with pytest.raises(ImportRowError, match='meal_type'):
+        import_meals(user_id, _csv('meal_date', '2024-03-01'), 'csv')
@@ -0,0 +1,117 @@
+from datetime import date, time
+
+
+def _nutrition(*items):
+    nutrition = {'items': [], 'total_calories': 0, 'total_protein': 0, 'total_carbs': 0,
+                 'total_fat': 0, 'total_sugar': 0, 'total_fiber': 0}
+    for name, calories, protein in items:
+        nutrition['items'].append({'name': name, 'calories': calories, 'protein': protein,
+                                   'carbs': 0, 'fat': 0, 'sugar': 0, 'fiber': 0})
+        nutrition['total_calories'] += calories
+        nutrition['total_protein'] += protein
+    return nutrition
+
+
+def test_users_sign_up_and_log_in(db):
+    assert db.create_user('alice', 'alice@example.com', 'secret', 'api-key') == (True, "User created successfully")
+    ok, message = db.create_user('alice', 'other@example.com', 'secret', '')
+    assert not ok and 'already exists' in message
+
+    ok, user, _ = db.authenticate_user('alice', 'wrong')
+    assert not ok and user is None
+
+    ok, user, _ = db.authenticate_user('alice', 'secret')
+    assert ok and user['gemini_api_key'] == 'api-key'
+    assert db.update_user_goals(user['id'], 1800, 120, 200, 60)
+    ok, user, _ = db.authenticate_user('alice', 'secret')
+    assert user['daily_calorie_goal'] == 1800
+
+
+def test_saved_meals_round_trip(db, user_id):
+    today = date.today()
+    assert db.save_meal_analysis(user_id, 'lunch', '| Egg | 70 |', _nutrition(('Egg', 70, 6), ('Toast', 80, 3)))
+    assert db.get_daily_nutrition(user_id, today)['calories'] == 150
+
+    meal_ids = db.save_meals([{
+        'user_id': user_id, 'meal_type': 'dinner', 'ai_analysis': None,
+        'nutrition_data': _nutrition(('Rice', 200, 4)), 'meal_date': today, 'meal_time': time(19, 30),
+    }])
+    assert len(meal_ids) == 1
+
+    meals = db.get_meals_by_date(user_id, today)
+    assert [meal['type'] for meal in meals] == ['lunch', 'dinner']
+    assert meals[0]['has_analysis'] and not meals[1]['has_analysis']
+    assert db.get_meal_analysis(user_id, meals[0]['id']) == '| Egg | 70 |'
+
+    nutrition = db.get_daily_nutrition(user_id, today)
+    assert nutrition['calories'] == 350
+    assert nutrition['protein'] == 13
+    assert db.verify_daily_nutrition(user_id) == []
+
+    db.delete_meal(user_id, meal_ids[0])
+    assert db.get_daily_nutrition(user_id, today)['calories'] == 150
+
+
+def test_nested_checkouts_keep_the_outer_transaction(db):
+    outer = db.backend.get_connection()
+    try:
+        cursor = outer.cursor()
+        cursor.execute("CREATE TABLE IF NOT EXISTS nested_checkout (value INTEGER)")
+        cursor.execute("INSERT INTO nested_checkout (value) VALUES (1)")
+
+        inner = db.backend.get_connection()
+        inner.cursor().execute("SELECT 1")
+        inner.close()
+
+        outer.commit()
+        cursor.execute("SELECT COUNT(*) FROM nested_checkout")
+        assert cursor.fetchone()[0] == 1
+
+        cursor.execute("INSERT INTO nested_checkout (value) VALUES (2)")
+    finally:
+        outer.close()
+
+    connection = db.backend.get_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM nested_checkout")
+        # The uncommitted second row was rolled back by the outermost close()
+        assert cursor.fetchone()[0] == 1
+    finally:
+        connection.close()
+
+
+def test_checkout_dropped_without_close_is_rolled_back(db):
+    connection = db.backend.get_connection()
+    connection.cursor().execute("CREATE TABLE IF NOT EXISTS dropped_checkout (value INTEGER)")
+    connection.commit()
+    connection.cursor().execute("INSERT INTO dropped_checkout (value) VALUES (1)")
+    del connection
+
+    connection = db.backend.get_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM dropped_checkout")
+        assert cursor.fetchone()[0] == 0
+    finally:
+        connection.close()
+
+
+def test_meal_items_link_only_to_confident_food_matches(db, user_id):
+    db.save_meals([{
+        'user_id': user_id, 'meal_type': 'dinner', 'ai_analysis': None, 'meal_date': date(2024, 1, 1),
+        'nutrition_data': _nutrition(('Grilled chicken breast', 250, 45), ('Chicken tikka masala', 400, 30)),
+    }])
+    connection = db.backend.get_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT mi.item_name, mi.food_id FROM meal_items mi JOIN meals m ON m.id = mi.meal_id
+            WHERE m.user_id = %s ORDER BY mi.id
+        """, (user_id,))
+        rows = cursor.fetchall()
+    finally:
+        connection.close()
+
+    assert rows[0][1] is not None
+    assert rows[1] == ('Chicken tikka masala', None)
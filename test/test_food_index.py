@@ -0,0 +1,55 @@
+import pytest
+
+from food_index import Food, FoodIndex, food_index, normalize_name
+
+
+def _food(id, name, serving=None, serving_grams=None):
+    return Food(id, name, 'test', (1.0, 0.1, 0.2, 0.05, 0.0, 0.0), serving, serving_grams)
+
+
+@pytest.fixture
+def index():
+    return FoodIndex([
+        (_food(1, 'chicken breast'), ['chicken breast', 'grilled chicken']),
+        (_food(2, 'white rice'), ['white rice', 'rice']),
+        (_food(3, 'broccoli'), ['broccoli']),
+        (_food(4, 'white bread', 'slice', 30), ['white bread', 'bread']),
+    ])
+
+
+def test_normalize_name_drops_fillers_accents_and_plurals():
+    assert normalize_name('A bowl of Crème Brûlées!') == 'of creme brulee'
+    assert normalize_name('Fresh Strawberries') == 'strawberry'
+
+
+def test_exact_and_alias_matches_score_one(index):
+    assert index.lookup('Chicken Breasts') == (index.get(1), 1.0)
+    assert index.lookup('grilled chicken') == (index.get(1), 1.0)
+
+
+def test_phrase_match_scores_by_clause_coverage(index):
+    food, score = index.lookup('chicken breast with rice')
+    assert food is index.get(1)
+    assert score == pytest.approx(0.9)
+
+    food, score = index.lookup('banana bread')
+    assert food is index.get(4)
+    assert score == pytest.approx(0.7)
+
+
+def test_fuzzy_match_catches_misspellings_above_the_threshold(index):
+    food, score = index.lookup('brocoli')
+    assert food is index.get(3)
+    assert score < 1.0
+    assert index.lookup('xylophone') is None
+
+
+def test_complete_matches_word_starts(index):
+    assert index.complete('bre') == [index.get(4), index.get(1)]
+    assert index.complete('zzz') == []
+
+
+def test_bundled_table_loads():
+    assert food_index is not None
+    assert len(food_index) > 100
+    assert food_index.lookup('banana')[1] == 1.0
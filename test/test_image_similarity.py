@@ -0,0 +1,50 @@
+import io
+import random
+
+from PIL import Image, ImageDraw
+
+from image_similarity import HashIndex, dhash, from_db, to_db
+
+
+def _photo(quality, shade=0):
+    image = Image.new('RGB', (200, 150), (240, 230, 200))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((30, 20, 170, 130), fill=(180 + shade, 90, 40))
+    draw.rectangle((80, 60, 120, 90), fill=(60, 140, 60))
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=quality)
+    return out.getvalue()
+
+
+def test_dhash_survives_recompression():
+    distance = bin(dhash(_photo(95)) ^ dhash(_photo(40, shade=10))).count('1')
+    assert distance <= 8
+
+
+def test_hashes_round_trip_through_signed_bigint():
+    for value in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        assert -(1 << 63) <= to_db(value) < 1 << 63
+        assert from_db(to_db(value)) == value
+
+
+def test_hash_index_finds_exactly_the_hashes_within_range():
+    generator = random.Random(7)
+    query = generator.getrandbits(64)
+    hashes = [generator.getrandbits(64) for _ in range(500)]
+    for flips in (0, 3, 8, 9, 20):
+        value = query
+        for bit in generator.sample(range(64), flips):
+            value ^= 1 << bit
+        hashes.append(value)
+
+    index = HashIndex()
+    for position, value in enumerate(hashes):
+        index.add(value, position)
+
+    expected = sorted(
+        (bin(value ^ query).count('1'), position)
+        for position, value in enumerate(hashes)
+        if bin(value ^ query).count('1') <= 8
+    )
+    assert sorted(index.search(query, 8)) == expected
+    assert [distance for distance, _ in expected] == [0, 3, 8]
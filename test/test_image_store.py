@@ -0,0 +1,67 @@
+import io
+import os
+
+from PIL import Image
+
+from image_store import THUMBNAIL_SUFFIX, ImageStore, create_image_store
+
+
+def _jpeg(color=(200, 120, 40)):
+    out = io.BytesIO()
+    Image.new('RGB', (800, 600), color).save(out, 'JPEG')
+    return out.getvalue()
+
+
+def _age(store, digest, seconds):
+    for suffix in ('', THUMBNAIL_SUFFIX):
+        path = store.path(digest, suffix)
+        modified = os.path.getmtime(path) - seconds
+        os.utime(path, (modified, modified))
+
+
+def test_photos_are_stored_once_with_a_thumbnail(tmp_path):
+    store = ImageStore(str(tmp_path), thumbnail_size=64)
+    data = _jpeg()
+
+    digest = store.put(data)
+    assert store.path(digest).startswith(os.path.join(str(tmp_path), digest[:2], digest[2:4]))
+    assert store.read(digest) == data
+    assert Image.open(io.BytesIO(store.read_thumbnail(digest))).size == (64, 48)
+
+    assert store.put(data) == digest
+    assert store.stats()['stored'] == 1 and store.stats()['deduplicated'] == 1
+
+
+def test_missing_or_invalid_digests_read_as_none(tmp_path):
+    store = ImageStore(str(tmp_path))
+    assert store.read('0' * 64) is None
+    assert store.read_thumbnail('0' * 64) is None
+    assert store.read_thumbnail('../../etc/passwd') is None
+
+
+def test_prune_removes_only_old_unreferenced_photos(tmp_path):
+    store = ImageStore(str(tmp_path))
+    kept = store.put(_jpeg((10, 10, 10)))
+    orphan = store.put(_jpeg((250, 250, 250)))
+    fresh = store.put(_jpeg((10, 200, 10)))
+    _age(store, kept, 7200)
+    _age(store, orphan, 7200)
+
+    assert store.prune({kept}) == 1
+    assert store.read(orphan) is None and store.read_thumbnail(orphan) is None
+    assert store.read(kept) is not None and store.read(fresh) is not None
+
+
+def test_reupload_protects_a_photo_from_prune(tmp_path):
+    store = ImageStore(str(tmp_path))
+    data = _jpeg()
+    digest = store.put(data)
+    _age(store, digest, 7200)
+
+    assert store.put(data) == digest
+    assert store.prune(set()) == 0
+
+
+def test_store_can_be_turned_off():
+    assert create_image_store('off') is None
+    assert create_image_store('') is None
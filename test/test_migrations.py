@@ -0,0 +1,69 @@
+import threading
+
+import migrations
+from storage import SQLiteBackend
+
+
+def _versions(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT version FROM schema_version ORDER BY version")
+    versions = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return versions
+
+
+def test_migrate_applies_every_version_once(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'schema.db'))
+    connection = backend.get_connection()
+    try:
+        assert migrations.migrate(connection, 'sqlite', target=2) == [1, 2]
+        assert migrations.migrate(connection, 'sqlite') == list(range(3, migrations.latest_version() + 1))
+        assert migrations.migrate(connection, 'sqlite') == []
+        assert _versions(connection) == list(range(1, migrations.latest_version() + 1))
+    finally:
+        connection.close()
+        backend.close()
+
+
+def test_interrupted_migration_resumes(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'schema.db'))
+    connection = backend.get_connection()
+    try:
+        migrations.migrate(connection, 'sqlite', target=8)
+        # Migration 9 got as far as adding its column before the process died
+        cursor = connection.cursor()
+        cursor.execute("ALTER TABLE meal_items ADD COLUMN food_id INT NULL")
+        connection.commit()
+        cursor.close()
+
+        assert migrations.migrate(connection, 'sqlite', target=9) == [9]
+    finally:
+        connection.close()
+        backend.close()
+
+
+def test_concurrent_migrations_apply_each_version_once(tmp_path):
+    path = str(tmp_path / 'schema.db')
+    results = []
+    errors = []
+
+    def run():
+        backend = SQLiteBackend(path)
+        connection = backend.get_connection()
+        try:
+            results.append(migrations.migrate(connection, 'sqlite'))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+            backend.close()
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(version for applied in results for version in applied) == \
+        list(range(1, migrations.latest_version() + 1))
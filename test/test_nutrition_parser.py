@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+from nutrition_parser import (
+    NUTRIENTS, SchemaError, StreamingItemParser, nutrition_from_analysis, parse_analysis,
+    parse_markdown_analysis, parse_structured_analysis, render_markdown,
+)
+
+
+def _item(name='Egg', **values):
+    item = {'name': name, 'portion': '1 large'}
+    item.update({nutrient: values.get(nutrient, 1) for nutrient in NUTRIENTS})
+    return item
+
+
+def _analysis(*items):
+    return {'items': list(items), 'insights': 'Balanced.'}
+
+
+def test_structured_analysis_round_trips():
+    data = _analysis(_item('Egg', calories=70, protein=6), _item('Toast', calories=80, protein=3))
+    parsed = parse_structured_analysis(json.dumps(data))
+    nutrition = nutrition_from_analysis(parsed)
+
+    assert [item['name'] for item in nutrition['items']] == ['Egg', 'Toast']
+    assert nutrition['total_calories'] == 150
+    assert nutrition['total_protein'] == 9
+
+
+@pytest.mark.parametrize('text', [
+    'not json',
+    json.dumps({'items': []}),
+    json.dumps(_analysis({'name': 'Egg', 'portion': '1'})),
+    json.dumps(_analysis(_item(calories=-5))),
+    json.dumps(_analysis(_item(calories=True))),
+])
+def test_structured_analysis_rejects_invalid_responses(text):
+    with pytest.raises(SchemaError):
+        parse_structured_analysis(text)
+
+
+@pytest.mark.parametrize('value', ['NaN', 'Infinity', '-Infinity'])
+def test_structured_analysis_rejects_non_finite_numbers(value):
+    text = json.dumps(_analysis(_item(calories=1))).replace('"calories": 1', f'"calories": {value}')
+    with pytest.raises(SchemaError):
+        parse_structured_analysis(text)
+
+
+def test_parse_analysis_renders_json_and_keeps_markdown():
+    markdown, nutrition = parse_analysis(json.dumps(_analysis(_item('Egg', calories=70))))
+    assert '| Egg |' in markdown
+    assert nutrition['total_calories'] == 70
+
+    table = "| Item | Calories |\n|---|---|\n| Rice | 200 |"
+    markdown, nutrition = parse_analysis(table)
+    assert markdown == table
+    assert nutrition['total_calories'] == 200
+
+
+def test_markdown_table_is_read_by_its_header():
+    text = """
+| Food Item | Portion | Calories | Protein (g) | Carbs (g) | Fat (g) | Fat (%DV) | Fiber (g) |
+|-----------|---------|----------|-------------|-----------|---------|-----------|-----------|
+| **Salmon** | 150 g | 280 kcal | 39 g | 0 g | 13 g | 17% | 0 g |
+| Rice | 1 cup | 205 | 4.3 | 45 | 0.4 | 1% | 0.6 |
+"""
+    nutrition = parse_markdown_analysis(text)
+
+    assert [item['name'] for item in nutrition['items']] == ['Salmon', 'Rice']
+    assert nutrition['items'][0]['fat'] == 13
+    assert nutrition['items'][1]['fiber'] == 0.6
+    assert nutrition['total_calories'] == 485
+
+
+def test_markdown_rows_shorter_than_the_header_are_skipped():
+    text = "| Item | Calories | Protein |\n|---|---|---|\n| Egg | 70 | 6 |\n| Broken |\n| Toast | 80 |"
+    nutrition = parse_markdown_analysis(text)
+
+    assert [item['name'] for item in nutrition['items']] == ['Egg']
+
+
+def test_markdown_stated_totals_win_over_the_item_sum():
+    text = "| Item | Calories |\n|---|---|\n| Egg | 70 |\n| **Total** | 100 |\n\nTotal: 25g protein"
+    nutrition = parse_markdown_analysis(text)
+
+    assert nutrition['total_calories'] == 100
+    assert nutrition['total_protein'] == 25
+
+
+def test_render_markdown_escapes_table_cells():
+    markdown = render_markdown(_analysis(_item('Fish | chips')), disclaimer=False)
+    assert 'Fish \\| chips' in markdown
+
+
+def test_streaming_parser_yields_items_as_they_complete():
+    text = json.dumps(_analysis(_item('Egg'), _item('Toast {buttered}')))
+    parser = StreamingItemParser()
+    completed = []
+    for start in range(0, len(text), 7):
+        completed.extend(item['name'] for item in parser.feed(text[start:start + 7]))
+
+    assert completed == ['Egg', 'Toast {buttered}']
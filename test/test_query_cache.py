@@ -0,0 +1,88 @@
+from datetime import date
+
+from query_cache import QueryCache
+
+DAY = date(2024, 5, 1)
+NEXT_DAY = date(2024, 5, 2)
+
+
+def test_hit_after_set_and_miss_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('query_cache.time.monotonic', lambda: now[0])
+    cache = QueryCache(max_size=10, ttl=60)
+
+    assert cache.get(('nutrition', 1, DAY)) == (False, None)
+    cache.set(('nutrition', 1, DAY), {'calories': 500})
+    assert cache.get(('nutrition', 1, DAY)) == (True, {'calories': 500})
+
+    now[0] += 61
+    assert cache.get(('nutrition', 1, DAY)) == (False, None)
+    assert cache.stats()['size'] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_size=2)
+    cache.set(('meals', 1, DAY), 'a')
+    cache.set(('meals', 1, NEXT_DAY), 'b')
+    cache.get(('meals', 1, DAY))
+    cache.set(('meals', 2, DAY), 'c')
+
+    assert cache.get(('meals', 1, NEXT_DAY)) == (False, None)
+    assert cache.get(('meals', 1, DAY)) == (True, 'a')
+    assert cache.stats()['evictions'] == 1
+
+
+def test_invalidate_drops_only_the_given_days_of_one_user():
+    cache = QueryCache()
+    cache.set(('nutrition', 1, DAY), 'a')
+    cache.set(('nutrition', 1, NEXT_DAY), 'b')
+    cache.set(('nutrition', 2, DAY), 'c')
+
+    cache.invalidate(1, [DAY])
+    assert cache.get(('nutrition', 1, DAY)) == (False, None)
+    assert cache.get(('nutrition', 1, NEXT_DAY)) == (True, 'b')
+    assert cache.get(('nutrition', 2, DAY)) == (True, 'c')
+
+    cache.invalidate(1)
+    assert cache.get(('nutrition', 1, NEXT_DAY)) == (False, None)
+
+
+def test_result_read_before_an_invalidation_is_not_stored():
+    cache = QueryCache()
+    generation = cache.generation(1)
+    cache.invalidate(1, [DAY])
+    cache.set(('nutrition', 1, DAY), 'stale', generation)
+
+    assert cache.get(('nutrition', 1, DAY)) == (False, None)
+    cache.set(('nutrition', 1, DAY), 'fresh', cache.generation(1))
+    assert cache.get(('nutrition', 1, DAY)) == (True, 'fresh')
+
+
+def test_zero_size_disables_the_cache():
+    cache = QueryCache(max_size=0)
+    cache.set(('meals', 1, DAY), 'a')
+
+    assert not cache.enabled
+    assert cache.get(('meals', 1, DAY)) == (False, None)
+
+
+def test_clear_invalidates_reads_in_flight():
+    cache = QueryCache()
+    cache.invalidate(1)
+    before_clear = cache.generation(1)
+    untouched_before_clear = cache.generation(2)
+    cache.clear()
+
+    cache.set(('nutrition', 1, DAY), 'stale', before_clear)
+    cache.set(('nutrition', 2, DAY), 'stale', untouched_before_clear)
+    assert cache.get(('nutrition', 1, DAY)) == (False, None)
+    assert cache.get(('nutrition', 2, DAY)) == (False, None)
+
+
+def test_generations_never_repeat():
+    cache = QueryCache()
+    seen = [cache.generation(1)]
+    for invalidate in (lambda: cache.invalidate(1), cache.clear, lambda: cache.invalidate(1), cache.clear):
+        invalidate()
+        assert cache.generation(1) not in seen
+        seen.append(cache.generation(1))
@@ -0,0 +1,73 @@
+import pytest
+
+from food_index import Food, FoodIndex
+from quick_log import parse_phrase, parse_quick_log, portion_grams, quick_log
+
+
+def _food(id, name, serving=None, serving_grams=None):
+    return Food(id, name, 'test', (1.0, 0.1, 0.2, 0.05, 0.0, 0.0), serving, serving_grams)
+
+
+@pytest.fixture
+def index():
+    return FoodIndex([
+        (_food(1, 'chicken breast'), ['chicken breast', 'grilled chicken']),
+        (_food(2, 'white rice'), ['white rice', 'rice']),
+        (_food(3, 'broccoli'), ['broccoli']),
+        (_food(4, 'white bread', 'slice', 30), ['white bread', 'bread']),
+    ])
+
+
+@pytest.mark.parametrize('phrase, expected', [
+    ('2 eggs', (2, None, 'eggs')),
+    ('1 1/2 cups of rice', (1.5, 'cup', 'rice')),
+    ('half a banana', (0.5, None, 'banana')),
+    ('a couple of slices of toast', (2, 'slice', 'toast')),
+    ('chicken breast 200 g', (200, 'g', 'chicken breast')),
+    ('banana', (None, None, 'banana')),
+    ('1,5 cups of rice', (1.5, 'cup', 'rice')),
+    ('1,000 g rice', (1000, 'g', 'rice')),
+])
+def test_parse_phrase(phrase, expected):
+    assert parse_phrase(phrase) == expected
+
+
+def test_portion_grams_prefers_mass_then_serving_then_volume(index):
+    bread = index.get(4)
+    assert portion_grams(bread, 2, 'oz') == pytest.approx(56.7)
+    assert portion_grams(bread, 2, 'slice') == 60
+    assert portion_grams(bread, 1, 'cup') == 240
+    assert portion_grams(bread, None, None) == 30
+
+
+def test_quick_log_resolves_known_foods_locally():
+    items, unresolved = parse_quick_log('2 eggs and a slice of toast, mac and cheese')
+
+    assert [item['name'] for item in items] == ['Egg', 'Toast', 'Mac and cheese']
+    assert all(item['food_id'] for item in items)
+    assert unresolved == []
+
+
+@pytest.mark.parametrize('text, portion', [('1,5 cups of rice', '1.5 × cup'), ('1,000 g rice', '1000 g')])
+def test_quick_log_keeps_commas_inside_numbers(text, portion):
+    items, unresolved = parse_quick_log(text)
+
+    assert unresolved == []
+    assert [item['name'] for item in items] == ['White rice']
+    assert items[0]['portion'].startswith(portion)
+
+
+@pytest.mark.parametrize('text', ['banana bread', 'chocolate milk', 'orange chicken'])
+def test_quick_log_sends_partial_matches_to_the_model(text):
+    items, unresolved = parse_quick_log(text)
+    assert items == []
+    assert unresolved == [text]
+
+
+def test_quick_log_needs_an_api_key_for_unknown_foods():
+    with pytest.raises(ValueError, match='banana bread'):
+        quick_log('banana bread')
+
+    _, nutrition, unresolved = quick_log('1 banana')
+    assert unresolved == []
+    assert nutrition['total_calories'] > 0
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from rate_limiter import AdmissionError, KeyRateLimiter, limiter_for
+
+
+def test_burst_is_admitted_at_once_then_requests_wait_for_a_refill():
+    limiter = KeyRateLimiter(requests_per_minute=600, burst=3)
+    started = time.monotonic()
+    for _ in range(3):
+        assert limiter.acquire(timeout=1)
+    assert time.monotonic() - started < 0.05
+
+    assert limiter.acquire(timeout=1)
+    # 600 rpm refills one token every 0.1s
+    assert time.monotonic() - started >= 0.08
+    assert limiter.stats()['admitted'] == 4
+
+
+def test_wait_times_out_with_admission_error():
+    limiter = KeyRateLimiter(requests_per_minute=1, burst=1)
+    assert limiter.acquire(timeout=1)
+    with pytest.raises(AdmissionError):
+        limiter.acquire(timeout=0.05)
+    assert limiter.stats()['rejected'] == 1
+
+
+def test_full_queue_rejects_immediately():
+    limiter = KeyRateLimiter(requests_per_minute=1, burst=1, max_queue=1)
+    assert limiter.acquire(timeout=1)
+    cancel = threading.Event()
+    waiting = threading.Thread(target=limiter.acquire, args=(5, None, cancel))
+    waiting.start()
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    with pytest.raises(AdmissionError, match='queue is full'):
+        limiter.acquire(timeout=5)
+    assert time.monotonic() - started < 0.1
+    cancel.set()
+    waiting.join()
+
+
+def test_cancel_leaves_the_queue_without_a_token():
+    limiter = KeyRateLimiter(requests_per_minute=1, burst=1)
+    assert limiter.acquire(timeout=1)
+    cancel = threading.Event()
+    threading.Timer(0.05, cancel.set).start()
+
+    assert limiter.acquire(timeout=5, cancel=cancel) is False
+    assert limiter.stats()['queued'] == 0
+
+
+def test_waiters_are_told_their_position():
+    limiter = KeyRateLimiter(requests_per_minute=600, burst=1)
+    assert limiter.acquire(timeout=1)
+    positions = []
+    assert limiter.acquire(timeout=1, on_wait=lambda position, eta: positions.append((position, eta)))
+
+    assert positions and positions[0][0] == 1
+    assert positions[0][1] > 0
+
+
+def test_backoff_pauses_the_key_and_success_restores_the_rate():
+    limiter = KeyRateLimiter(requests_per_minute=600, burst=5)
+    assert limiter.backoff(retry_after=0.1) == 0.1
+    assert limiter.stats()['rate_fraction'] == 0.5
+
+    started = time.monotonic()
+    assert limiter.acquire(timeout=1)
+    assert time.monotonic() - started >= 0.08
+
+    for _ in range(5):
+        limiter.succeeded()
+    assert limiter.stats()['rate_fraction'] == 1.0
+
+
+def test_limiter_for_shares_one_limiter_per_key():
+    assert limiter_for('key-a') is limiter_for('key-a')
+    assert limiter_for('key-a') is not limiter_for('key-b')